@@ -0,0 +1,138 @@
+"""
+Altitude from barometric pressure without calling pow() on every sample.
+
+Both altitude formulas only depend on the pressure ratio r = pressure / sea level pressure, raised to a fixed
+power.  That power is tabulated once, at import time, as 32 cubic polynomial segments (Chebyshev fits) over
+0.25 <= r < 1.20, which covers 300 to 1100 hPa for any sea level pressure between 917 and 1200 hPa.  Changing the
+sea level reference only changes one cached reciprocal, the tables stay as they are.  Ratios outside the table
+fall back to the exact formula.
+
+Maximum error against the exact formulas from 300 to 1100 hPa, measured with benchmarks/altitude_bench.py:
+  International Barometric Formula:  0.003 m
+  Hypsometric formula at 320 K:      0.008 m
+The tables are stored in single precision, as the Pico's floats are.  The hypsometric error scales with
+temperature, so it is smaller at lower temperatures.
+"""
+from array import array
+from math import cos, pi
+
+IBF_EXPONENT = 1 / 5.255
+HYPSOMETRIC_EXPONENT = 1 / 5.257
+LAPSE_RATE = 0.0065  # K/m
+METERS_TO_FEET = 3.28084
+
+_RATIO_MIN = 0.25
+_RATIO_MAX = 1.20
+_SEGMENTS = 32
+_DEGREE = 3
+_SEGMENT_SCALE = _SEGMENTS / (_RATIO_MAX - _RATIO_MIN)
+_INVERSE_LAPSE_RATE = 1 / LAPSE_RATE
+
+
+# Hypsometric function for calculation altitude from pressure and temperature values.
+def hyp_alt_from_pt( pressure_hpa, temperature, sea_level_pressure_hpa = 1012.5 ):
+  pressure_ratio = sea_level_pressure_hpa / pressure_hpa
+  hypsometric = (((pressure_ratio ** (1 / 5.257)) - 1) * temperature) / 0.0065
+  return hypsometric
+
+
+# Altitude from international barometric formula, given in BMP 180 datasheet.
+def ibf_alt_from_hpa( pressure_hpa, sea_level_pressure_hpa = 1012.5 ):
+  pressure_ratio = pressure_hpa / sea_level_pressure_hpa
+  return 44330 * (1 - (pressure_ratio ** (1 / 5.255)))
+
+
+def _fit_segments( exponent ):
+  """
+  Fit r ** exponent with a cubic on each segment.
+  Each segment's four coefficients are for x in [-1, 1] across the segment, highest power first.
+  """
+  n = _DEGREE + 1
+  width = (_RATIO_MAX - _RATIO_MIN) / _SEGMENTS
+  table = array( 'f' )
+  for segment in range( _SEGMENTS ):
+    low = _RATIO_MIN + segment * width
+    nodes = [cos( pi * (k + 0.5) / n ) for k in range( n )]
+    values = [(low + (x + 1) * width / 2) ** exponent for x in nodes]
+    cheb = [2.0 / n * sum( values[k] * cos( pi * j * (k + 0.5) / n ) for k in range( n ) ) for j in range( n )]
+    cheb[0] /= 2
+    # T0 = 1, T1 = x, T2 = 2x^2 - 1, T3 = 4x^3 - 3x
+    table.append( 4 * cheb[3] )
+    table.append( 2 * cheb[2] )
+    table.append( cheb[1] - 3 * cheb[3] )
+    table.append( cheb[0] - cheb[2] )
+  return table
+
+
+_IBF_TABLE = _fit_segments( IBF_EXPONENT )
+_HYPSOMETRIC_TABLE = _fit_segments( -HYPSOMETRIC_EXPONENT )
+
+
+def _evaluate( table, ratio, exponent ):
+  t = (ratio - _RATIO_MIN) * _SEGMENT_SCALE
+  segment = int( t )
+  if t < 0 or segment >= _SEGMENTS:
+    return ratio ** exponent
+  x = 2 * (t - segment) - 1
+  i = segment * 4
+  return ((table[i] * x + table[i + 1]) * x + table[i + 2]) * x + table[i + 3]
+
+
+class AltitudeEngine:
+  """
+  Altitude in meters from pressure in hPa, relative to a cached sea level pressure.
+  """
+
+  def __init__( self, sea_level_hpa = 1012.5 ):
+    self._sea_level_hpa = sea_level_hpa
+    self._inverse_sea_level = 1 / sea_level_hpa
+
+  @property
+  def sea_level_hpa( self ):
+    return self._sea_level_hpa
+
+  @sea_level_hpa.setter
+  def sea_level_hpa( self, value ):
+    assert value > 0
+    self._sea_level_hpa = value
+    self._inverse_sea_level = 1 / value
+
+  def ibf( self, pressure_hpa ):
+    """
+    Altitude from the International Barometric Formula, like ibf_alt_from_hpa().
+    """
+    return 44330 * (1 - _evaluate( _IBF_TABLE, pressure_hpa * self._inverse_sea_level, IBF_EXPONENT ))
+
+  def hypsometric( self, pressure_hpa, temperature_k ):
+    """
+    Altitude from the hypsometric formula, like hyp_alt_from_pt().
+    """
+    ratio = pressure_hpa * self._inverse_sea_level
+    return (_evaluate( _HYPSOMETRIC_TABLE, ratio, -HYPSOMETRIC_EXPONENT ) - 1) * temperature_k * _INVERSE_LAPSE_RATE
+
+  def ibf_batch( self, pressures_hpa, out = None ):
+    """
+    IBF altitude for a sequence of pressures.
+    :param out: optional preallocated array( 'f' ) at least as long as pressures_hpa.
+    :return: out, or a new array( 'f' ).
+    """
+    if out is None:
+      out = array( 'f', bytes( 4 * len( pressures_hpa ) ) )
+    inverse_sea_level = self._inverse_sea_level
+    for i in range( len( pressures_hpa ) ):
+      out[i] = 44330 * (1 - _evaluate( _IBF_TABLE, pressures_hpa[i] * inverse_sea_level, IBF_EXPONENT ))
+    return out
+
+  def hypsometric_batch( self, pressures_hpa, temperatures_k, out = None ):
+    """
+    Hypsometric altitude for sequences of pressures and temperatures of the same length.
+    :param out: optional preallocated array( 'f' ) at least as long as pressures_hpa.
+    :return: out, or a new array( 'f' ).
+    """
+    if out is None:
+      out = array( 'f', bytes( 4 * len( pressures_hpa ) ) )
+    inverse_sea_level = self._inverse_sea_level
+    for i in range( len( pressures_hpa ) ):
+      ratio = pressures_hpa[i] * inverse_sea_level
+      out[i] = (_evaluate( _HYPSOMETRIC_TABLE, ratio, -HYPSOMETRIC_EXPONENT ) - 1) * temperatures_k[i] * _INVERSE_LAPSE_RATE
+    return out
@@ -13,50 +13,41 @@ from time import sleep
 
 from machine import Pin, I2C
 
+from Altitude_uPython import AltitudeEngine, METERS_TO_FEET
+from Altitude_uPython import hyp_alt_from_pt, ibf_alt_from_hpa  # re-exported, they used to live here
+from Sampler_uPython import Sampler
 from Utilities_uPython import c_to_f
 from bmp280.BMP280_uPython_Library import BMP280, BMP280_CASE_INDOOR
-from bmp280.BMP280_uPython_Library import BMP280_POWER_NORMAL, BMP280_OS_HIGH, BMP280_TEMP_OS_8
-from bmp280.BMP280_uPython_Library import BMP280_TEMP_OS_4, BMP280_STANDBY_250, BMP280_IIR_FILTER_2
+from bmp280.BMP280_uPython_Library import BMP280_POWER_NORMAL, BMP280_TEMP_OS_8
+from bmp280.BMP280_uPython_Library import BMP280_PRES_OS_4, BMP280_STANDBY_250, BMP280_IIR_FILTER_2
 
 
-def create_bmp( i2c_class_object, sensor_address ):
-  new_bmp280_object = BMP280( i2c_class_object, addr = sensor_address, use_case = BMP280_CASE_INDOOR )
+def create_bmp( i2c_class_object, sensor_address, calibration_cache = None, max_age_ms = 200 ):
+  # Pass a flash directory (e.g. "/") as calibration_cache to skip the calibration read on warm boots.
+  # Readings younger than max_age_ms are shared by every caller instead of going back to the I2C bus.
+  new_bmp280_object = BMP280( i2c_class_object, addr = sensor_address, use_case = BMP280_CASE_INDOOR,
+                              calibration_cache = calibration_cache, max_age_ms = max_age_ms )
   return new_bmp280_object
 
 
 def configure_bmp( bmp280_class_object ):
-  # Configure the sensor, overriding some "CASE" settings.
-  bmp280_class_object.power_mode = BMP280_POWER_NORMAL
-  bmp280_class_object.oversample = BMP280_OS_HIGH
-  bmp280_class_object.temp_os = BMP280_TEMP_OS_8
-  bmp280_class_object.press_os = BMP280_TEMP_OS_4
-  bmp280_class_object.standby = BMP280_STANDBY_250
-  bmp280_class_object.iir = BMP280_IIR_FILTER_2
+  # Configure the sensor, overriding some "CASE" settings.  Each register is written once.
+  bmp280_class_object.configure( power_mode = BMP280_POWER_NORMAL,
+                                 temp_os = BMP280_TEMP_OS_8,
+                                 press_os = BMP280_PRES_OS_4,
+                                 standby = BMP280_STANDBY_250,
+                                 iir = BMP280_IIR_FILTER_2 )
   print( "BMP Object created and configured.\n" )
 
 
 def query_bmp( bmp280_class_object ):
-  result_dictionary = { 'tempC': bmp280_class_object.temperature, 'pressure': bmp280_class_object.pressure * 0.01 }
+  measurement = bmp280_class_object.measure()
+  result_dictionary = { 'tempC': measurement.temperature, 'pressure': measurement.pressure * 0.01 }
   return result_dictionary
 
 
-# Hypsometric function for calculation altitude from pressure and temperature values.
-def hyp_alt_from_pt( pressure_hpa, temperature, sea_level_pressure_hpa = 1012.5 ):
-  pressure_ratio = sea_level_pressure_hpa / pressure_hpa
-  hypsometric = (((pressure_ratio ** (1 / 5.257)) - 1) * temperature) / 0.0065
-  return hypsometric
-
-
-# Altitude from international barometric formula, given in BMP 180 datasheet.
-def ibf_alt_from_hpa( pressure_hpa, sea_level_pressure_hpa = 1012.5 ):
-  pressure_ratio = pressure_hpa / sea_level_pressure_hpa
-  return 44330 * (1 - (pressure_ratio ** (1 / 5.255)))
-
-
 if __name__ == "__main__":
   loop_count = 0
-  temp_list = [0, 0, 0]
-  pressure_list = [0, 0, 0]
 
   # Initiate I2C.  The first argument is an ID.
   i2c_object = I2C( 0, scl = Pin( 9 ), sda = Pin( 8 ), freq = 1000000 )
@@ -82,27 +73,35 @@ if __name__ == "__main__":
   bmp280_object = create_bmp( i2c_object, 0x76 )
   configure_bmp( bmp280_object )
 
+  # Altitude tables are built once; the default sea level pressure matches hyp_alt_from_pt() and ibf_alt_from_hpa().
+  altitude_engine = AltitudeEngine()
+
   last_sensor_poll = 0
   sensor_interval = 15  # Seconds
 
+  # Sample every second in the background, keeping one reporting interval of history for the averages.
+  bmp280_sampler = Sampler( bmp280_object.measure, length = sensor_interval, period_ms = 1000, channels = 2 )
+  temp_buffer, pressure_buffer = bmp280_sampler.buffers
+  bmp280_sampler.start()
+
   print( "\nStarting loop\n" )
   while True:
     if (time.time() - last_sensor_poll) > sensor_interval:
       loop_count += 1
 
-      # Query sensors.
-      bmp280_temp_c = bmp280_object.temperature
-      bmp280_pres_hpa = bmp280_object.pressure * 0.01
+      # Query sensors.  Both values come from the same burst read.
+      bmp280_temp_c, bmp280_pres_pa = bmp280_object.measure()
+      bmp280_pres_hpa = bmp280_pres_pa * 0.01
 
       # Convert pressure and temperature to altitude using the HYPSOMETRIC formula.
-      h_altitude = hyp_alt_from_pt( bmp280_pres_hpa, bmp280_temp_c + 273.15 )
-      h_altitude_feet = h_altitude * 3.28084
+      h_altitude = altitude_engine.hypsometric( bmp280_pres_hpa, bmp280_temp_c + 273.15 )
+      h_altitude_feet = h_altitude * METERS_TO_FEET
 
       # Convert pressure to altitude using the International Barometric Formula.
-      i_altitude = ibf_alt_from_hpa( bmp280_pres_hpa )
+      i_altitude = altitude_engine.ibf( bmp280_pres_hpa )
 
       # Convert the altitude in meters to altitude in feet.
-      f_altitude = i_altitude * 3.28084
+      f_altitude = i_altitude * METERS_TO_FEET
 
       # Print the values to the serial port.
       print( f"BMP280: {bmp280_temp_c:.2f} degrees Celsius" )
@@ -113,6 +112,9 @@ if __name__ == "__main__":
       print( f"BMP280: {h_altitude_feet:.2f} feet (Hypsometric)" )
       print( f"BMP280: {i_altitude:.2f} meters (International Barometric)" )
       print( f"BMP280: {f_altitude:.2f} feet (International Barometric)" )
+      if len( temp_buffer ):
+        print( f"BMP280: {temp_buffer.mean:.2f} C average, {temp_buffer.min:.2f} to {temp_buffer.max:.2f} C over {len( temp_buffer )} samples" )
+        print( f"BMP280: {pressure_buffer.mean * 0.01:.2f} hPa average, standard deviation {pressure_buffer.stddev:.2f} Pa" )
       print( f"Loop count: {loop_count}" )
       print( "" )
 
@@ -0,0 +1,178 @@
+"""
+HTTP/1.1 server for uasyncio (and CPython asyncio), serving several clients at once from a route table:
+
+  def index( request ):
+    return response( b"<p>Hello</p>" )
+
+  server = HttpServer( { "/": index } )
+  server.run( "0.0.0.0", 80 )
+
+A handler takes the Request and returns the complete response as bytes, so it can return one it cached earlier.
+Connections are kept open between requests (HTTP/1.1 keep-alive) until the client closes them, asks to close, sends
+nothing for timeout_ms, or has made max_requests requests.  No request can hold up the others: while one client
+is slow, the event loop serves the rest.
+"""
+try:
+  import uasyncio as asyncio
+except ImportError:
+  import asyncio
+
+STATUS_TEXT = { 200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+                503: "Service Unavailable" }
+# Requests with more header lines than this are refused, to bound the memory one request can take.
+MAX_HEADERS = 32
+
+
+def response( body, content_type = "text/html", status = 200, headers = () ):
+  """
+  :param headers: extra (name, value) header pairs.
+  :return: a complete HTTP/1.1 response.
+  """
+  head = ["HTTP/1.1 %d %s\r\n" % (status, STATUS_TEXT[status])]
+  if body or status != 304:
+    head.append( "Content-Type: %s\r\nContent-Length: %d\r\n" % (content_type, len( body )) )
+  for name, value in headers:
+    head.append( "%s: %s\r\n" % (name, value) )
+  head.append( "\r\n" )
+  return "".join( head ).encode() + body
+
+
+BAD_REQUEST = response( b"Bad request\n", "text/plain", 400 )
+NOT_FOUND = response( b"Not found\n", "text/plain", 404 )
+SERVER_ERROR = response( b"Server error\n", "text/plain", 500 )
+BUSY = response( b"Too many connections\n", "text/plain", 503 )
+
+
+class Request:
+  def __init__( self, method, target, version, headers ):
+    self.method = method
+    self.path, _, self.query = target.partition( "?" )
+    self.version = version
+    self.headers = headers  # lower case header name -> value, both bytes
+
+  @property
+  def keep_alive( self ):
+    """
+    Whether the client expects the connection to stay open: HTTP/1.1 unless it sent Connection: close.
+    """
+    return self.version == b"HTTP/1.1" and self.headers.get( b"connection", b"" ).lower() != b"close"
+
+
+async def read_request( reader ):
+  """
+  :return: the next Request, None at the end of the stream, or False if the request is malformed.
+  """
+  line = await reader.readline()
+  if not line:
+    return None
+  parts = line.split()
+  if len( parts ) != 3:
+    return False
+  headers = { }
+  for _ in range( MAX_HEADERS ):
+    line = await reader.readline()
+    if not line:
+      return None
+    if line == b"\r\n" or line == b"\n":
+      break
+    name, _, value = line.partition( b":" )
+    headers[name.strip().lower()] = value.strip()
+  else:
+    return False
+  length = headers.get( b"content-length" )
+  if length:
+    # The handlers do not take bodies, but the body has to be read to get to the next request.
+    try:
+      await reader.readexactly( int( length.decode() ) )
+    except ValueError:
+      return False
+  return Request( parts[0].decode(), parts[1].decode(), parts[2], headers )
+
+
+class HttpServer:
+  def __init__( self, routes, backlog = 4, max_connections = 4, timeout_ms = 5000, max_requests = 100 ):
+    """
+    :param routes: a dictionary of path (without the query string) to handler( request ).
+    :param backlog: connections the network stack queues while the server is busy accepting.
+    :param max_connections: connections served at once.  Clients beyond that get 503 and are closed, which keeps
+      the sockets and RAM the server takes within what the Pico W has.
+    :param timeout_ms: close a connection whose next request does not arrive in full within this time, or that
+      does not take a response within this time.
+    :param max_requests: requests on one connection before it is closed, so that one client cannot keep a
+      connection slot forever.
+    """
+    self.routes = routes
+    self.backlog = backlog
+    self.max_connections = max_connections
+    self.timeout_ms = timeout_ms
+    self.max_requests = max_requests
+    self.active = 0  # connections open now
+    self.requests = 0  # requests answered
+    self.rejected = 0  # connections refused with 503
+    self.timeouts = 0  # connections closed for taking too long
+
+  async def start( self, host = "0.0.0.0", port = 80 ):
+    """
+    Start accepting connections in the background.
+    :return: the asyncio server.
+    """
+    return await asyncio.start_server( self._serve, host, port, backlog = self.backlog )
+
+  def run( self, host = "0.0.0.0", port = 80 ):
+    """
+    Serve forever.
+    """
+
+    async def main():
+      await self.start( host, port )
+      while True:
+        await asyncio.sleep( 3600 )
+
+    asyncio.run( main() )
+
+  def handle( self, request ):
+    """
+    :return: the response to request, from its route.
+    """
+    handler = self.routes.get( request.path )
+    if handler is None:
+      return NOT_FOUND
+    try:
+      return handler( request )
+    except Exception as e:
+      print( f"HTTP handler for {request.path} failed: {e!r}" )
+      return SERVER_ERROR
+
+  async def _serve( self, reader, writer ):
+    timeout = self.timeout_ms / 1000
+    try:
+      if self.active >= self.max_connections:
+        self.rejected += 1
+        writer.write( BUSY )
+        await asyncio.wait_for( writer.drain(), timeout )
+        return
+      self.active += 1
+      try:
+        served = 0
+        while served < self.max_requests:
+          request = await asyncio.wait_for( read_request( reader ), timeout )
+          if request is None:
+            break
+          writer.write( self.handle( request ) if request else BAD_REQUEST )
+          await asyncio.wait_for( writer.drain(), timeout )
+          self.requests += 1
+          served += 1
+          if not request or not request.keep_alive:
+            break
+      finally:
+        self.active -= 1
+    except asyncio.TimeoutError:
+      self.timeouts += 1
+    except (OSError, EOFError):
+      pass
+    finally:
+      writer.close()
+      try:
+        await writer.wait_closed()
+      except OSError:
+        pass
@@ -5,21 +5,33 @@ import ujson
 import utime
 
 import PicoW_WiFi
+from Telemetry_Frame import FrameEncoder
+from umqtt.router import TopicRouter
 from umqtt.simple import MQTTClient
 
+# Handlers for received messages, by topic filter.
+router = TopicRouter()
+led = machine.Pin( "LED", machine.Pin.OUT )
+# Publish each sample as one binary frame (see Telemetry_Frame.py) on <pubTopic>/telemetry instead of one ASCII value
+# per topic.  TELEMETRY_BATCH samples go in each frame.
+BINARY_TELEMETRY = False
+TELEMETRY_BATCH = 1
+
 
 def connect_mqtt():
   new_client = MQTTClient( client_id = client_id,
                            server = broker,
                            port = 0,
-                           keepalive = 7200,
+                           keepalive = 60,
                            ssl = False )
   new_client.connect()
   return new_client
 
 
-def subscribe_callback( topic, msg ):
-  led = machine.Pin( "LED", machine.Pin.OUT )
+def led_command( topic, msg ):
+  # topic and msg are views into the client's receive buffer; copy them for printing.
+  topic = bytes( topic )
+  msg = bytes( msg )
   print( (topic, msg) )
   if msg == b'LEDon':
     print( f"Device received LEDon message on topic {topic}" )
@@ -29,13 +41,20 @@ def subscribe_callback( topic, msg ):
     led.value( 0 )
 
 
-def mqtt_subscribe( client, topic ):
-  client.set_callback( subscribe_callback )
+def mqtt_subscribe( client, topic, handler = led_command ):
+  """
+  Subscribe to a topic filter and route its messages to handler.
+  """
+  router.add( topic, handler )
+  client.set_callback( router.dispatch )
   client.subscribe( topic )
   print( f"Subscribed to topic {topic}" )
 
 
 def publish( client, topic, value ):
+  """
+  :param topic: a topic string or a handle from client.prepare().
+  """
   print( topic )
   print( value )
   client.publish( topic, value )
@@ -58,22 +77,38 @@ if __name__ == "__main__":
 
   PicoW_WiFi.wifi_connect( wifi_ssid, wifi_password )
   mqtt_client = connect_mqtt()
+  # Encode the telemetry topics once instead of formatting them on every loop.
+  if BINARY_TELEMETRY:
+    telemetry_topic = mqtt_client.prepare( f"{publish_topic}/telemetry" )
+    telemetry = FrameEncoder( ('temperature', 'pressure', 'humidity'), TELEMETRY_BATCH )
+  else:
+    temperature_topic = mqtt_client.prepare( f"{publish_topic}/temperature" )
+    pressure_topic = mqtt_client.prepare( f"{publish_topic}/pressure" )
+    humidity_topic = mqtt_client.prepare( f"{publish_topic}/humidity" )
 
   loop_count = 1
   while True:
     # Read sensor data
-    sensor_reading = [str( loop_count ), str( loop_count + 1 ), str( loop_count + 2 )]
-    temperature = sensor_reading[0]
-    pressure = sensor_reading[1]
-    humidity = sensor_reading[2]
-
+    sensor_reading = [loop_count, loop_count + 1, loop_count + 2]
     print( sensor_reading )
     # publish as MQTT payload
-    publish( mqtt_client, f"{publish_topic}/temperature", temperature )
-    publish( mqtt_client, f"{publish_topic}/pressure", pressure )
-    publish( mqtt_client, f"{publish_topic}/humidity", humidity )
+    if BINARY_TELEMETRY:
+      frame = telemetry.add( utime.time(), sensor_reading )
+      if frame is not None:
+        mqtt_client.publish( telemetry_topic, frame )
+        print( f"Published a {len( frame )} byte telemetry frame" )
+    else:
+      publish( mqtt_client, temperature_topic, str( sensor_reading[0] ) )
+      publish( mqtt_client, pressure_topic, str( sensor_reading[1] ) )
+      publish( mqtt_client, humidity_topic, str( sensor_reading[2] ) )
     # delay 5 seconds
     loop_count += 3
     stringly = f"{network.WLAN.status( network.WLAN( network.STA_IF ) )}"
     print( stringly )
+    # Handle broker traffic; this also pings the broker when the link is idle and notices a dead connection.
+    try:
+      mqtt_client.check_msg()
+    except OSError as exception:
+      print( f"MQTT connection lost: {exception}" )
+      mqtt_client = connect_mqtt()
     utime.sleep( 5 )
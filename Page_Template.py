@@ -0,0 +1,105 @@
+"""
+Pages split once, at startup, into static byte chunks and {name} slots, so a request only formats the slot
+values and joins the pieces:
+
+  page = PageTemplate( "<p>LED is {state}</p>" )
+  body = page.render( { 'state': "ON" } )
+
+response() also keeps the last HTTP response it built and returns it again, without formatting anything, until
+its arguments change.  Each new rendering gets a new ETag, so conditional_response() can answer a client that
+already has it with a bodyless 304.  Braces that do not enclose a name (letters, digits and _) are left as they
+are.
+
+This module has no MicroPython-only imports, so the same code runs on the device and on the host.
+"""
+import random
+
+# Part of every ETag, so that the renderings counted after a restart get different ETags from those before it.
+_BOOT_TAG = "%08x" % random.getrandbits( 32 )
+
+
+def _is_name( text ):
+  if not text:
+    return False
+  for c in text:
+    if not (c.isalpha() or c.isdigit() or c == "_"):
+      return False
+  return True
+
+
+def _encode( value ):
+  return value.encode() if isinstance( value, str ) else value
+
+
+class PageTemplate:
+  def __init__( self, text, content_type = "text/html" ):
+    self.slots = []  # slot names, in page order; a name may appear more than once
+    # Static chunks at the even indexes, slot values go in between.  The list is reused by every render().
+    self._parts = []
+    start = 0
+    static_start = 0
+    while True:
+      open_at = text.find( "{", start )
+      if open_at < 0:
+        break
+      close_at = text.find( "}", open_at + 1 )
+      if close_at < 0:
+        break
+      name = text[open_at + 1:close_at]
+      if _is_name( name ):
+        self._parts.append( text[static_start:open_at].encode() )
+        self._parts.append( b"" )
+        self.slots.append( name )
+        static_start = close_at + 1
+        start = close_at + 1
+      else:
+        start = open_at + 1
+    self._parts.append( text[static_start:].encode() )
+    self._head = b"HTTP/1.1 200 OK\r\nContent-Type: " + content_type.encode() + b"\r\nContent-Length: "
+    self._args = None
+    self._response = None
+    self._not_modified = None
+    self.etag = None  # of the current rendering, quoted, as bytes
+    self.hits = 0
+    self.misses = 0
+    self.not_modified = 0  # 304 responses
+
+  def render( self, values ):
+    """
+    :param values: a dictionary with a str or bytes value for every slot.
+    :return: the page as bytes.
+    """
+    parts = self._parts
+    i = 1
+    for name in self.slots:
+      parts[i] = _encode( values[name] )
+      i += 2
+    return b"".join( parts )
+
+  def response( self, make_values, *args ):
+    """
+    :return: an HTTP response with the page rendered from make_values( *args ), or the previous one if args are
+      the same as last time.
+    """
+    if self._response is not None and args == self._args:
+      self.hits += 1
+      return self._response
+    self.misses += 1
+    body = self.render( make_values( *args ) )
+    self.etag = ('"%s-%x"' % (_BOOT_TAG, self.misses)).encode()
+    self._response = b"".join( (self._head, str( len( body ) ).encode(), b"\r\nETag: ", self.etag, b"\r\n\r\n",
+                                body) )
+    self._not_modified = b"HTTP/1.1 304 Not Modified\r\nETag: " + self.etag + b"\r\n\r\n"
+    self._args = args
+    return self._response
+
+  def conditional_response( self, if_none_match, make_values, *args ):
+    """
+    :param if_none_match: the request's If-None-Match header (bytes), or None.
+    :return: response( make_values, *args ), or a 304 Not Modified response if if_none_match names its ETag.
+    """
+    full = self.response( make_values, *args )
+    if if_none_match is not None and (self.etag in if_none_match or if_none_match.strip() == b"*"):
+      self.not_modified += 1
+      return self._not_modified
+    return full
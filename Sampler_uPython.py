@@ -0,0 +1,233 @@
+"""
+Background sensor sampling into preallocated ring buffers.
+
+RingBuffer keeps the last N samples in an array and maintains the window's mean, variance, min and max as each
+sample arrives, so reading the statistics costs nothing.  Sampler drives one or more RingBuffers from a
+machine.Timer: the timer interrupt only schedules the read with micropython.schedule(), so the sensor is read
+outside interrupt context and I2C is safe to use.
+"""
+from array import array
+
+import micropython
+from machine import Timer
+
+
+class _MonotonicQueue:
+  """
+  Ring positions of the samples that can still become the window minimum (or maximum).
+  Values along the queue are increasing for a minimum queue and decreasing for a maximum queue,
+  so the front is always the current extreme.  Each position is pushed and popped at most once: amortized O(1).
+  """
+
+  def __init__( self, length, keep_max ):
+    self._positions = array( 'H' if length <= 0xFFFF else 'I', [0] * length )
+    self._length = length
+    self._start = 0
+    self._count = 0
+    self._keep_max = keep_max
+
+  def clear( self ):
+    self._start = 0
+    self._count = 0
+
+  def front( self ):
+    return self._positions[self._start]
+
+  def push( self, data, position ):
+    value = data[position]
+    while self._count:
+      back = self._positions[(self._start + self._count - 1) % self._length]
+      if (data[back] <= value) if self._keep_max else (data[back] >= value):
+        self._count -= 1
+      else:
+        break
+    self._positions[(self._start + self._count) % self._length] = position
+    self._count += 1
+
+  def evict( self, position ):
+    # Called before the sample at position is overwritten.
+    if self._count and self._positions[self._start] == position:
+      self._start = (self._start + 1) % self._length
+      self._count -= 1
+
+
+class RingBuffer:
+  """
+  Fixed-size sample window backed by a preallocated array, with O(1) running statistics.
+  """
+
+  def __init__( self, length, typecode = 'f' ):
+    assert length > 0
+    self._data = array( typecode, [0] * length )
+    self._length = length
+    self._head = 0  # position the next sample is written to
+    self._count = 0
+    self._mean = 0.0
+    self._m2 = 0.0  # sum of squared differences from the mean (Welford)
+    self._min_queue = _MonotonicQueue( length, False )
+    self._max_queue = _MonotonicQueue( length, True )
+
+  def __len__( self ):
+    return self._count
+
+  def clear( self ):
+    self._head = 0
+    self._count = 0
+    self._mean = 0.0
+    self._m2 = 0.0
+    self._min_queue.clear()
+    self._max_queue.clear()
+
+  def append( self, value ):
+    position = self._head
+    if self._count == self._length:
+      # Sliding-window Welford update: replace the oldest sample with the new one.
+      old = self._data[position]
+      self._min_queue.evict( position )
+      self._max_queue.evict( position )
+      self._data[position] = value
+      value = self._data[position]  # compare against the value as stored (e.g. rounded to 'f')
+      mean = self._mean + (value - old) / self._count
+      self._m2 += (value - old) * (value - mean + old - self._mean)
+      self._mean = mean
+      if position == self._length - 1:
+        self._recompute()
+    else:
+      self._data[position] = value
+      value = self._data[position]
+      self._count += 1
+      delta = value - self._mean
+      self._mean += delta / self._count
+      self._m2 += delta * (value - self._mean)
+    self._min_queue.push( self._data, position )
+    self._max_queue.push( self._data, position )
+    self._head = (position + 1) % self._length
+
+  def _recompute( self ):
+    # Floats are single precision on the RP2040, so the sliding updates above gather rounding error without limit.
+    # Once per pass over the full window, the mean and M2 are computed again from the samples: still O(1) per
+    # append on average.
+    total = 0.0
+    for value in self._data:
+      total += value
+    mean = total / self._length
+    m2 = 0.0
+    for value in self._data:
+      delta = value - mean
+      m2 += delta * delta
+    self._mean = mean
+    self._m2 = m2
+
+  @property
+  def latest( self ):
+    if not self._count:
+      return None
+    return self._data[(self._head - 1) % self._length]
+
+  @property
+  def mean( self ):
+    return self._mean if self._count else None
+
+  @property
+  def variance( self ):
+    """
+    Population variance of the samples in the window.
+    """
+    if not self._count:
+      return None
+    return max( self._m2, 0.0 ) / self._count
+
+  @property
+  def stddev( self ):
+    if not self._count:
+      return None
+    return self.variance ** 0.5
+
+  @property
+  def min( self ):
+    return self._data[self._min_queue.front()] if self._count else None
+
+  @property
+  def max( self ):
+    return self._data[self._max_queue.front()] if self._count else None
+
+  def window( self, count = None ):
+    """
+    Zero-copy view of the most recent samples, oldest first.
+    The window can wrap around the end of the array, so it is returned as two memoryviews; the second is empty
+    when it does not wrap.  The views share memory with the buffer, so samples appended later show through.
+    :param count: number of samples, default all of them.
+    :return: (older, newer) memoryviews.
+    """
+    if count is None or count > self._count:
+      count = self._count
+    view = memoryview( self._data )
+    start = (self._head - count) % self._length
+    if start + count <= self._length:
+      return view[start:start + count], view[0:0]
+    return view[start:], view[:self._head]
+
+
+class Sampler:
+  """
+  Read a sensor every period_ms from a machine.Timer into RingBuffers.
+  read_function returns one value, or a sequence of `channels` values, one per buffer:
+    sampler = Sampler( lambda: bmp.measure(), channels = 2, length = 60, period_ms = 1000 )
+    sampler.start()
+    temperature_buffer, pressure_buffer = sampler.buffers
+  """
+
+  def __init__( self, read_function, length = 60, period_ms = 1000, typecode = 'f', channels = 1, timer_id = -1 ):
+    self.buffers = [RingBuffer( length, typecode ) for _ in range( channels )]
+    self.buffer = self.buffers[0]
+    self.period_ms = period_ms
+    self.errors = 0  # reads that raised OSError
+    self.overruns = 0  # timer ticks dropped because the previous read had not run yet
+    self._read_function = read_function
+    self._channels = channels
+    self._timer_id = timer_id
+    self._timer = None
+    self._pending = False
+    # Bound methods allocate when created, so create them once instead of in the interrupt handler.
+    self._sample_ref = self._sample
+    self._irq_ref = self._irq
+
+  def _irq( self, _timer ):
+    if self._pending:
+      self.overruns += 1
+      return
+    self._pending = True
+    try:
+      micropython.schedule( self._sample_ref, 0 )
+    except RuntimeError:
+      # The schedule queue is full.
+      self._pending = False
+      self.overruns += 1
+
+  def _sample( self, _arg ):
+    self._pending = False
+    try:
+      values = self._read_function()
+    except OSError:
+      self.errors += 1
+      return
+    if self._channels == 1:
+      self.buffer.append( values )
+    else:
+      for i in range( self._channels ):
+        self.buffers[i].append( values[i] )
+
+  def sample_now( self ):
+    """
+    Take one sample immediately, outside the timer.
+    """
+    self._sample( 0 )
+
+  def start( self ):
+    if self._timer is None:
+      self._timer = Timer( self._timer_id )
+    self._timer.init( mode = Timer.PERIODIC, period = self.period_ms, callback = self._irq_ref )
+
+  def stop( self ):
+    if self._timer is not None:
+      self._timer.deinit()
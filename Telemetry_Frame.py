@@ -0,0 +1,154 @@
+"""
+Binary telemetry frames: one MQTT payload for a whole sample, or a batch of samples, instead of one ASCII value
+per topic.
+
+A frame is little-endian:
+  header  version (B), sample count (B), sensor bitmap (H), timestamp of the first sample (I), its sequence
+          number (H)
+  sample  seconds after the first sample (H), then one fixed-point value (i) per bit set in the bitmap, lowest
+          bit first
+
+Bit n of the bitmap stands for SENSORS[n], whose scale turns its value into an integer: a temperature of
+21.537 C is sent as 2154.  New sensors are only ever appended to SENSORS, so old frames keep decoding; a change
+to the layout itself gets a new FORMAT_VERSION.  A frame spans at most MAX_OFFSET_S seconds, and a scaled value
+has to fit in 32 bits: FrameEncoder.add() refuses a sample that breaks either, before it changes the frame.
+
+This module has no MicroPython-only imports, so the same code runs on the device and on the host.
+"""
+import struct
+
+FORMAT_VERSION = 1
+
+# (name, scale), by bitmap bit.
+SENSORS = (
+  ('temperature', 100),  # degrees Celsius
+  ('pressure', 100),  # hPa
+  ('humidity', 100),  # % relative humidity
+  ('altitude', 10),  # meters
+  ('core_temperature', 100),  # degrees Celsius, RP2040 internal sensor
+  ('rssi', 1),  # WiFi signal strength in dBm
+)
+
+HEADER = "<BBHIH"
+HEADER_SIZE = struct.calcsize( HEADER )
+MAX_SAMPLES = 255
+MAX_OFFSET_S = 0xFFFF  # latest sample in a frame, in seconds after the first
+
+
+def _sample_format( bitmap ):
+  return "<H" + "i" * bin( bitmap ).count( "1" )
+
+
+class FrameEncoder:
+  """
+  Packs samples into a preallocated frame:
+
+    encoder = FrameEncoder( ('temperature', 'pressure', 'humidity'), batch = 10 )
+    frame = encoder.add( utime.time(), (temperature, pressure, humidity) )
+    if frame is not None:
+      client.publish( telemetry_topic, frame )
+  """
+
+  def __init__( self, sensors, batch = 1 ):
+    """
+    :param sensors: names from SENSORS; add() takes the values in this order.
+    :param batch: samples per frame, 1 to MAX_SAMPLES.
+    :raise ValueError: for an unknown sensor name or batch size.
+    """
+    names = [name for name, _ in SENSORS]
+    if not 1 <= batch <= MAX_SAMPLES:
+      raise ValueError( "batch must be 1 to %d" % MAX_SAMPLES )
+    try:
+      bits = [names.index( name ) for name in sensors]
+    except ValueError:
+      raise ValueError( "unknown sensor" )
+    self.bitmap = 0
+    for bit in bits:
+      self.bitmap |= 1 << bit
+    # For each slot of a sample, in bitmap order: the position of its value in add()'s argument, and its scale.
+    order = sorted( range( len( bits ) ), key = lambda i: bits[i] )
+    self._slots = [(i, SENSORS[bits[i]][1]) for i in order]
+    self._sample_format = _sample_format( self.bitmap )
+    self.sample_size = struct.calcsize( self._sample_format )
+    self.batch = batch
+    self._buf = bytearray( HEADER_SIZE + batch * self.sample_size )
+    self._view = memoryview( self._buf )
+    self._values = [0] * len( bits )
+    self._count = 0
+    self._first_time = 0
+    self.sequence = 0  # of the next sample, wrapping at 65536
+
+  def add( self, timestamp, values ):
+    """
+    :param timestamp: seconds, on whatever clock the device keeps (utime.time() counts from 2000 on the Pico).
+    :param values: one value per sensor, in the order given to the constructor.
+    :return: the frame as a memoryview, valid until the next add(), when this sample completes the batch;
+      otherwise None.
+    :raise ValueError: if the sample is earlier than the first in the frame or more than MAX_OFFSET_S after it
+      (flush() and add it again to start a new frame), or a value does not fit once scaled.  The frame is left
+      as it was.
+    """
+    if self._count:
+      offset_s = timestamp - self._first_time
+      if not 0 <= offset_s <= MAX_OFFSET_S:
+        raise ValueError( "sample is not within %d s after the first in the frame" % MAX_OFFSET_S )
+    else:
+      offset_s = 0
+      if not 0 <= timestamp <= 0xFFFFFFFF:
+        raise ValueError( "timestamp out of range" )
+    packed = self._values
+    for slot, (i, scale) in enumerate( self._slots ):
+      value = round( values[i] * scale )
+      if not -0x80000000 <= value <= 0x7FFFFFFF:
+        raise ValueError( "telemetry value out of range" )
+      packed[slot] = value
+    if self._count == 0:
+      self._first_time = timestamp
+      struct.pack_into( HEADER, self._buf, 0, FORMAT_VERSION, 0, self.bitmap, timestamp, self.sequence )
+    offset = HEADER_SIZE + self._count * self.sample_size
+    struct.pack_into( self._sample_format, self._buf, offset, offset_s, *packed )
+    self._count += 1
+    self.sequence = (self.sequence + 1) & 0xFFFF
+    if self._count == self.batch:
+      return self.flush()
+    return None
+
+  def flush( self ):
+    """
+    Close the current frame early, with the samples added so far.
+    :return: the frame as a memoryview, or None if it is empty.
+    """
+    count = self._count
+    if not count:
+      return None
+    self._count = 0
+    self._buf[1] = count
+    return self._view[:HEADER_SIZE + count * self.sample_size]
+
+
+def decode( frame ):
+  """
+  Unpack a frame from FrameEncoder.
+  :return: a list with a dictionary per sample: 'timestamp', 'sequence' and a float per sensor.
+  :raise ValueError: if the frame has an unknown version, an unknown sensor or the wrong length.
+  """
+  if len( frame ) < HEADER_SIZE:
+    raise ValueError( "short telemetry frame" )
+  version, count, bitmap, timestamp, sequence = struct.unpack_from( HEADER, frame )
+  if version != FORMAT_VERSION:
+    raise ValueError( "unknown telemetry frame version %d" % version )
+  if bitmap >> len( SENSORS ):
+    raise ValueError( "unknown sensor in telemetry frame" )
+  sensors = [SENSORS[bit] for bit in range( len( SENSORS ) ) if bitmap >> bit & 1]
+  sample_format = _sample_format( bitmap )
+  sample_size = struct.calcsize( sample_format )
+  if len( frame ) != HEADER_SIZE + count * sample_size:
+    raise ValueError( "telemetry frame length does not match its header" )
+  samples = []
+  for n in range( count ):
+    fields = struct.unpack_from( sample_format, frame, HEADER_SIZE + n * sample_size )
+    sample = { 'timestamp': timestamp + fields[0], 'sequence': (sequence + n) & 0xFFFF }
+    for (name, scale), value in zip( sensors, fields[1:] ):
+      sample[name] = value / scale
+    samples.append( sample )
+  return samples
@@ -22,6 +22,43 @@ def average_list( input_list ):
   return sum( input_list ) / len( input_list )
 
 
+class SensorCache:
+  """
+  Wrap a sensor read function so repeat reads within max_age_ms are served from memory.
+  Share one SensorCache between all consumers of a sensor (web server, MQTT publisher, serial logger...).
+  """
+
+  def __init__( self, read_function, max_age_ms = 1000 ):
+    self._read_function = read_function
+    self.max_age_ms = max_age_ms
+    self._value = None
+    self._timestamp = None
+    self.hits = 0
+    self.misses = 0
+
+  def read( self ):
+    now = time.ticks_ms()
+    if self._timestamp is not None and time.ticks_diff( now, self._timestamp ) < self.max_age_ms:
+      self.hits += 1
+      return self._value
+    self.misses += 1
+    self._value = self._read_function()
+    self._timestamp = now
+    return self._value
+
+  def invalidate( self ):
+    self._timestamp = None
+
+  @property
+  def age_ms( self ):
+    """
+    Age of the cached value in ms, or None if nothing has been read yet.
+    """
+    if self._timestamp is None:
+      return None
+    return time.ticks_diff( time.ticks_ms(), self._timestamp )
+
+
 def restart_and_reconnect():
   print( "Failed to connect to MQTT broker. Restarting..." )
   time.sleep( 10 )
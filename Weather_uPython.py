@@ -3,8 +3,9 @@ from time import sleep_ms
 
 from machine import Pin, I2C
 
-from BMP280 import configure_bmp, create_bmp, hyp_alt_from_pt, ibf_alt_from_hpa
-from sht20.SHT20_uPython_Library import sht20_temperature, sht20_humidity
+from Altitude_uPython import AltitudeEngine, METERS_TO_FEET
+from BMP280 import configure_bmp, create_bmp
+from sht20.SHT20_uPython_Library import SHT20
 
 if __name__ == "__main__":
   # Initiate I2C.  The first argument is an ID.
@@ -14,6 +15,9 @@ if __name__ == "__main__":
   bmp280_object = create_bmp( i2c_object, 0x76 )
   configure_bmp( bmp280_object )
 
+  # The SHT20 converts without holding the bus, so its conversions overlap with the BMP280 work below.
+  sht20_object = SHT20( i2c_object, 0x40 )
+
   # Program variables
   loop_count = 0
   last_sensor_poll = 0
@@ -23,6 +27,8 @@ if __name__ == "__main__":
   # Provo airport: https://e6bx.com/weather/KPVU/
   # ToDo: Get this from an API like https://api.meteomatics.com/2022-12-30T19:40:00.000-07:00/msl_pressure:hPa/40.2981599,-111.6944313/json?model=mix
   sea_level_pressure = 1015.2  # hPa
+  # Update altitude_engine.sea_level_hpa when a new sea level pressure is known; the tables do not need rebuilding.
+  altitude_engine = AltitudeEngine( sea_level_pressure )
 
   while True:
     if (time.time() - last_sensor_poll) > sensor_poll_interval:
@@ -31,25 +37,28 @@ if __name__ == "__main__":
       #  Print the average of the array.
       loop_count += 1
 
-      # Query temperature from the BMP280.
-      temperature_c = bmp280_object.temperature
+      # Start the SHT20 temperature conversion, then do the BMP280 work while it runs.
+      sht20_object.trigger_temperature()
+
+      # Query temperature and pressure from the BMP280 with one burst read.
+      temperature_c, pressure_pascal = bmp280_object.measure()
 
-      # Query pressure from the BMP280, and convert to hectopascal (hPa).
-      pressure_hectopascal = bmp280_object.pressure * 0.01
+      # Convert pressure to hectopascal (hPa).
+      pressure_hectopascal = pressure_pascal * 0.01
 
       # Convert pressure and temperature to altitude using the HYPSOMETRIC formula.
-      h_altitude = hyp_alt_from_pt( pressure_hectopascal, temperature_c + 273.15, sea_level_pressure )
+      h_altitude = altitude_engine.hypsometric( pressure_hectopascal, temperature_c + 273.15 )
 
       # Convert pressure to altitude using the International Barometric Formula.
-      i_altitude = ibf_alt_from_hpa( pressure_hectopascal, sea_level_pressure )
+      i_altitude = altitude_engine.ibf( pressure_hectopascal )
 
       # Convert the altitude in meters to altitude in feet.
-      f_altitude = i_altitude * 3.28084
+      f_altitude = i_altitude * METERS_TO_FEET
 
-      sht_temp_c = sht20_temperature( i2c_object, 0x40 )
-      sleep_ms( 50 )  # SHT20 measurement takes time.
-      sht_humidity = sht20_humidity( i2c_object, 0x40 )
-      sleep_ms( 50 )  # SHT20 measurement takes time.
+      # Collect the SHT20 temperature (only sleeping for whatever conversion time is left), then start humidity.
+      sht_temp_c = sht20_object.fetch( wait = True )
+      sht20_object.trigger_humidity()
+      sht_humidity = sht20_object.fetch( wait = True )
 
       # Print the values to the serial port.
       print( f"Temperature: {temperature_c:.2f} degrees Celsius" )
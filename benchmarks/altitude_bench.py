@@ -0,0 +1,63 @@
+"""
+Accuracy and speed of Altitude_uPython.AltitudeEngine against hyp_alt_from_pt() and ibf_alt_from_hpa().
+
+Run from the repository root:
+  python3 -m benchmarks.altitude_bench
+On the Pico, copy Altitude_uPython.py and benchmarks/ to the board and run it from the REPL.
+"""
+from array import array
+
+from Altitude_uPython import AltitudeEngine, hyp_alt_from_pt, ibf_alt_from_hpa
+from benchmarks.timing import ticks_us, ticks_diff
+
+SEA_LEVELS_HPA = (917.0, 950.0, 1012.5, 1050.0, 1200.0)
+PRESSURE_MIN_HPA = 300
+PRESSURE_MAX_HPA = 1100
+PRESSURE_STEP_HPA = 0.05
+HOT_K = 320.0
+SAMPLES = 2000
+
+
+def max_errors():
+  """
+  :return: (max IBF error, max hypsometric error at HOT_K), in meters.
+  """
+  worst_ibf = 0.0
+  worst_hyp = 0.0
+  steps = int( (PRESSURE_MAX_HPA - PRESSURE_MIN_HPA) / PRESSURE_STEP_HPA )
+  for sea_level in SEA_LEVELS_HPA:
+    engine = AltitudeEngine( sea_level )
+    for i in range( steps + 1 ):
+      pressure = PRESSURE_MIN_HPA + i * PRESSURE_STEP_HPA
+      worst_ibf = max( worst_ibf, abs( engine.ibf( pressure ) - ibf_alt_from_hpa( pressure, sea_level ) ) )
+      error = abs( engine.hypsometric( pressure, HOT_K ) - hyp_alt_from_pt( pressure, HOT_K, sea_level ) )
+      worst_hyp = max( worst_hyp, error )
+  return worst_ibf, worst_hyp
+
+
+def time_per_call( function, *args ):
+  start = ticks_us()
+  for _ in range( SAMPLES ):
+    function( *args )
+  return ticks_diff( ticks_us(), start ) / SAMPLES
+
+
+if __name__ == "__main__":
+  ibf_error, hyp_error = max_errors()
+  print( f"Max error, {PRESSURE_MIN_HPA}-{PRESSURE_MAX_HPA} hPa, sea level {SEA_LEVELS_HPA[0]}-{SEA_LEVELS_HPA[-1]} hPa:" )
+  print( f"  IBF:         {ibf_error:.5f} m" )
+  print( f"  Hypsometric: {hyp_error:.5f} m at {HOT_K} K" )
+  print( "" )
+
+  engine = AltitudeEngine( 1015.2 )
+  print( "Time per call:" )
+  print( f"  ibf_alt_from_hpa:    {time_per_call( ibf_alt_from_hpa, 850.0, 1015.2 ):.3f} us" )
+  print( f"  AltitudeEngine.ibf:  {time_per_call( engine.ibf, 850.0 ):.3f} us" )
+  print( f"  hyp_alt_from_pt:     {time_per_call( hyp_alt_from_pt, 850.0, 295.0, 1015.2 ):.3f} us" )
+  print( f"  engine.hypsometric:  {time_per_call( engine.hypsometric, 850.0, 295.0 ):.3f} us" )
+
+  pressures = array( 'f', [PRESSURE_MIN_HPA + i * 0.4 for i in range( SAMPLES )] )
+  out = array( 'f', bytes( 4 * SAMPLES ) )
+  start = ticks_us()
+  engine.ibf_batch( pressures, out )
+  print( f"  ibf_batch:           {ticks_diff( ticks_us(), start ) / SAMPLES:.3f} us per sample" )
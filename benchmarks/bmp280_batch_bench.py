@@ -0,0 +1,72 @@
+"""
+Check and time BMP280_Batch.compensate_batch() against the scalar compensation path.
+
+Every engine is checked bit for bit against the scalar formulas, on the datasheet golden sample and on a grid over
+the full 20-bit raw range.  Throughput is then measured on a million synthetic raw samples.
+
+Run from the repository root:
+  python3 -m benchmarks.bmp280_batch_bench
+"""
+import random
+import time
+
+from bmp280.BMP280_Batch import compensate_batch, numpy
+from bmp280.BMP280_Compensation import COMPENSATION_INT64, COMPENSATION_INT32, COMPENSATION_FLOAT
+from bmp280.BMP280_Compensation import TEST_CALIBRATION, TEST_T_RAW, TEST_P_RAW
+from bmp280.BMP280_Compensation import t_fine, temperature_c, pressure_pa
+
+ENGINES = (('int64', COMPENSATION_INT64), ('int32', COMPENSATION_INT32), ('float', COMPENSATION_FLOAT))
+GRID_STEP = 4099  # a prime step, so the grid does not line up with bit boundaries
+THROUGHPUT_SAMPLES = 1000000
+
+
+def raw_grid():
+  t_raw = []
+  p_raw = []
+  for t in range( 0, 1 << 20, GRID_STEP ):
+    for p in range( 0, 1 << 20, GRID_STEP ):
+      t_raw.append( t )
+      p_raw.append( p )
+  return t_raw, p_raw
+
+
+def count_mismatches( cal, t_raw, p_raw, compensation, use_numpy ):
+  temperatures, pressures = compensate_batch( cal, t_raw, p_raw, compensation, use_numpy )
+  mismatches = 0
+  for i in range( len( t_raw ) ):
+    t_fine_value = t_fine( cal, t_raw[i] )
+    if temperatures[i] != temperature_c( t_fine_value, compensation ):
+      mismatches += 1
+    elif pressures[i] != pressure_pa( cal, p_raw[i], t_fine_value, compensation ):
+      mismatches += 1
+  return mismatches
+
+
+if __name__ == "__main__":
+  paths = [False]
+  if numpy is not None:
+    paths.append( True )
+  else:
+    print( "NumPy is not installed, only the pure Python path is checked." )
+
+  t_grid, p_grid = raw_grid()
+  for use_numpy in paths:
+    label = "numpy" if use_numpy else "python"
+    for name, compensation in ENGINES:
+      golden = compensate_batch( TEST_CALIBRATION, [TEST_T_RAW], [TEST_P_RAW], compensation, use_numpy )
+      mismatches = count_mismatches( TEST_CALIBRATION, t_grid, p_grid, compensation, use_numpy )
+      print( f"{label} {name}: golden {golden[0][0]} C {golden[1][0]} Pa, "
+             f"{mismatches} mismatches in {len( t_grid )} grid samples" )
+  print( "" )
+
+  rng = random.Random( 280 )
+  t_raw = [rng.randrange( 400000, 600000 ) for _ in range( THROUGHPUT_SAMPLES )]
+  p_raw = [rng.randrange( 250000, 450000 ) for _ in range( THROUGHPUT_SAMPLES )]
+  for use_numpy in paths:
+    label = "numpy" if use_numpy else "python"
+    count = THROUGHPUT_SAMPLES if use_numpy else THROUGHPUT_SAMPLES // 20
+    for name, compensation in ENGINES:
+      start = time.perf_counter()
+      compensate_batch( TEST_CALIBRATION, t_raw[:count], p_raw[:count], compensation, use_numpy )
+      elapsed = time.perf_counter() - start
+      print( f"{label} {name}: {count / elapsed / 1e6:.2f} million samples/s" )
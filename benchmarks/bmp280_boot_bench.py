@@ -0,0 +1,78 @@
+"""
+I2C transactions a BMP280 costs at boot, counted on a fake bus that stands in for the sensor: a cold boot, a warm
+boot from the calibration cache, and a warm boot after the sensor at that address was swapped for a chip with a
+different ID, which has to ignore the cache.
+
+Rows without a use case count only what the constructor reads to load calibration; the others add the
+configuration writes of the default use case.
+
+Run from the repository root:
+  python3 -m benchmarks.bmp280_boot_bench
+"""
+import os
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path.insert( 0, os.path.join( BENCHMARKS, "shims" ) )
+
+from bmp280.BMP280_uPython_Library import BMP280, BMP280_CASE_HANDHELD_DYN
+from bmp280.BMP280_Compensation import TEST_CALIBRATION
+from ustruct import pack, unpack
+
+ADDRESS = 0x76
+BMP280_ID = 0x58
+BME280_ID = 0x60
+
+
+class FakeI2C:
+  """
+  Register file of one sensor, counting every transaction and the bytes it moves.
+  """
+
+  def __init__( self, chip_id, calibration ):
+    self.registers = bytearray( 256 )
+    self.registers[0xD0] = chip_id
+    self.registers[0x88:0x88 + len( calibration )] = calibration
+    self.transactions = 0
+    self.bytes = 0
+    self.calibration_reads = 0
+
+  def readfrom_mem( self, addr, register, size ):
+    assert addr == ADDRESS
+    self.transactions += 1
+    self.bytes += size
+    if register <= 0x9F and register + size > 0x88:
+      self.calibration_reads += 1
+    return bytes( self.registers[register:register + size] )
+
+  def readfrom_mem_into( self, addr, register, buf ):
+    buf[:] = self.readfrom_mem( addr, register, len( buf ) )
+
+  def writeto_mem( self, addr, register, buf ):
+    assert addr == ADDRESS
+    self.transactions += 1
+    self.bytes += len( buf )
+    self.registers[register:register + len( buf )] = buf
+
+
+def boot( directory, chip_id, calibration, use_case ):
+  bus = FakeI2C( chip_id, calibration )
+  sensor = BMP280( bus, ADDRESS, use_case = use_case, calibration_cache = directory )
+  return bus, sensor
+
+
+if __name__ == "__main__":
+  calibration = pack( '<HhhHhhhhhhhh', *TEST_CALIBRATION )
+  # The same layout with every value changed, for the swapped-in chip.
+  other_calibration = pack( '<HhhHhhhhhhhh', *(value + 1 for value in TEST_CALIBRATION) )
+  print( "boot                    use case  transactions  bytes  calibration" )
+  for use_case in (None, BMP280_CASE_HANDHELD_DYN):
+    with tempfile.TemporaryDirectory() as directory:
+      for name, chip_id, cal in (("cold", BMP280_ID, calibration), ("warm", BMP280_ID, calibration),
+                                 ("warm, chip swapped", BME280_ID, other_calibration)):
+        bus, sensor = boot( directory, chip_id, cal, use_case )
+        assert tuple( sensor._cal ) == unpack( '<HhhHhhhhhhhh', cal ), name
+        source = "read from the bus" if bus.calibration_reads else "from the cache"
+        print( f"{name:22s}  {'none' if use_case is None else 'default':8s}  {bus.transactions:12d}  {bus.bytes:5d}"
+               f"  {source}" )
@@ -0,0 +1,121 @@
+"""
+Accuracy and cost comparison of the BMP280 pressure compensation engines.
+
+Accuracy: the 32-bit integer and float engines are compared against the 64-bit datasheet formula over a grid
+covering the full 20-bit raw temperature and pressure range, and separately over the operating range
+(-40 to 85 C, 300 to 1100 hPa).
+
+Cost: time per sample, and heap bytes allocated per sample.  On MicroPython (the Pico or the unix port) that is
+the growth of gc.mem_alloc() with the collector off, so 0 means the engine allocates nothing.  CPython has no
+gc.mem_alloc(), so there it is the most memory a single sample has in use for new Python objects at once, from
+tracemalloc, as in the other benchmarks.  Every CPython int outside the small-int cache is a heap object, so
+there the integer engines never show 0, unlike on MicroPython, where intermediates that fit in a small int are not
+allocated.
+
+Run from the repository root:
+  python3 -m benchmarks.bmp280_compensation_bench
+On the Pico, copy bmp280/ and benchmarks/ to the board and run it from the REPL.
+"""
+import gc
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+from benchmarks.timing import ticks_us, ticks_diff
+from bmp280.BMP280_Compensation import TEST_CALIBRATION, t_fine, pressure_q24_8, pressure_int32, pressure_float
+
+RAW_STEPS = 256  # grid points per raw axis
+SAMPLES = 2000  # samples per timing run
+ALLOC_SAMPLES = 1000  # samples measured one by one with tracemalloc
+
+
+def engine_q24_8( cal, p_raw, t_fine_value ):
+  return pressure_q24_8( cal, p_raw, t_fine_value ) / 256.0
+
+
+ENGINES = (('int64', engine_q24_8), ('int32', pressure_int32), ('float', pressure_float))
+
+
+def compare_accuracy( cal, operating_only ):
+  """
+  :return: a dictionary of engine name to (max abs error in Pa, mean abs error in Pa, samples compared).
+  """
+  step = (1 << 20) // RAW_STEPS
+  stats = { }
+  for name, _ in ENGINES[1:]:
+    stats[name] = [0.0, 0.0, 0]
+  for t_raw in range( 0, 1 << 20, step ):
+    t_fine_value = t_fine( cal, t_raw )
+    if operating_only and not -4000 <= (t_fine_value * 5 + 128) >> 8 <= 8500:
+      continue
+    for p_raw in range( 0, 1 << 20, step ):
+      reference = engine_q24_8( cal, p_raw, t_fine_value )
+      if reference <= 0 or (operating_only and not 30000 <= reference <= 110000):
+        continue
+      for name, engine in ENGINES[1:]:
+        error = abs( engine( cal, p_raw, t_fine_value ) - reference )
+        entry = stats[name]
+        if error > entry[0]:
+          entry[0] = error
+        entry[1] += error
+        entry[2] += 1
+  for name in stats:
+    entry = stats[name]
+    stats[name] = (entry[0], entry[1] / entry[2] if entry[2] else 0.0, entry[2])
+  return stats
+
+
+def measure_cost( cal, engine ):
+  """
+  :return: (microseconds per sample, heap bytes allocated per sample or None if it cannot be measured, and
+    whether that is the tracemalloc peak).
+  """
+  # Typical indoor raw values, so the timing reflects steady state rather than the grid extremes.
+  t_fine_value = t_fine( cal, 519888 )
+  p_raw = 415148
+  engine( cal, p_raw, t_fine_value )
+  gc.collect()
+  has_mem_alloc = hasattr( gc, 'mem_alloc' )
+  if has_mem_alloc:
+    gc.disable()
+    before = gc.mem_alloc()
+  start = ticks_us()
+  for _ in range( SAMPLES ):
+    engine( cal, p_raw, t_fine_value )
+  elapsed = ticks_diff( ticks_us(), start )
+  allocated = None
+  if has_mem_alloc:
+    allocated = (gc.mem_alloc() - before) / SAMPLES
+    gc.enable()
+  elif tracemalloc is not None:
+    total = 0
+    tracemalloc.start()
+    for _ in range( ALLOC_SAMPLES ):
+      before = tracemalloc.get_traced_memory()[0]
+      tracemalloc.reset_peak()
+      engine( cal, p_raw, t_fine_value )
+      total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    allocated = total / ALLOC_SAMPLES
+  return elapsed / SAMPLES, allocated, not has_mem_alloc
+
+
+if __name__ == "__main__":
+  for operating_only in (False, True):
+    label = "operating range" if operating_only else "full raw range"
+    print( f"Accuracy against the 64-bit engine, {label}:" )
+    for name, (max_error, mean_error, count) in compare_accuracy( TEST_CALIBRATION, operating_only ).items():
+      print( f"  {name}: max {max_error:.3f} Pa, mean {mean_error:.3f} Pa over {count} samples" )
+  print( "" )
+  print( "Cost per sample:" )
+  for name, engine in ENGINES:
+    us_per_sample, bytes_per_sample, peak = measure_cost( TEST_CALIBRATION, engine )
+    if bytes_per_sample is None:
+      allocation = "allocations not measurable on this port"
+    elif peak:
+      allocation = f"{bytes_per_sample:.1f} bytes peak allocation (tracemalloc)"
+    else:
+      allocation = f"{bytes_per_sample:.1f} bytes allocated"
+    print( f"  {name}: {us_per_sample:.2f} us, {allocation}" )
@@ -0,0 +1,254 @@
+"""
+A minimal MQTT 3.1.1 broker on loopback, for running the umqtt clients against on the host.
+
+Each client gets a thread.  It handles CONNECT, PUBLISH at QoS 0 and 1, PUBACK, SUBSCRIBE with + and # wildcards,
+UNSUBSCRIBE, PINGREQ and DISCONNECT.  There are no sessions, retained messages, wills or QoS 2.  Messages are
+forwarded to subscribers at the lower of the two QoS levels.  Given an SSL context, it serves TLS instead, with
+the session resumption CPython's ssl module offers.
+
+  broker = Broker()
+  client = MQTTClient( "bench", "127.0.0.1", port = broker.port )
+"""
+import queue
+import socket
+import struct
+import threading
+import time
+
+from umqtt.router import TopicRouter
+
+
+def _encode_len( n ):
+  out = bytearray()
+  while True:
+    b = n & 0x7F
+    n >>= 7
+    out.append( b | 0x80 if n else b )
+    if not n:
+      return bytes( out )
+
+
+def packet( header, body ):
+  """
+  :return: an MQTT packet with the fixed header byte header and the remaining length of body.
+  """
+  return bytes( (header,) ) + _encode_len( len( body ) ) + body
+
+
+def publish_packet( topic, msg, qos = 0, pid = 0 ):
+  body = struct.pack( "!H", len( topic ) ) + topic
+  if qos:
+    body += struct.pack( "!H", pid )
+  return packet( 0x30 | qos << 1, body + msg )
+
+
+class _Connection:
+  def __init__( self, broker, sock ):
+    self.broker = broker
+    self.sock = sock
+    self.lock = threading.Lock()
+    self.subscriptions = []  # (filter, (connection, qos)) as registered with the router
+    self.pid = 0
+
+  def next_pid( self ):
+    self.pid = self.pid % 65535 + 1
+    return self.pid
+
+  def send( self, data ):
+    if self.broker.delay_ms:
+      self.broker._delayed.put( (time.monotonic() + self.broker.delay_ms / 1000, self, data) )
+    else:
+      self.send_now( data )
+
+  def send_now( self, data ):
+    with self.lock:
+      try:
+        self.sock.sendall( data )
+      except OSError:
+        pass
+
+
+class Broker:
+  def __init__( self, port = 0, delay_ms = 0, ssl_context = None ):
+    """
+    :param port: TCP port on 127.0.0.1, or 0 for any free one (see the port attribute).
+    :param delay_ms: hold every packet the broker sends for this long, in order, to stand in for a network round
+      trip.
+    :param ssl_context: a server-side ssl.SSLContext to accept TLS connections with.
+    """
+    self.delay_ms = delay_ms
+    self.ssl_context = ssl_context
+    self.handshakes = 0  # TLS handshakes completed
+    self.resumed = 0  # of which resumed a previous session
+    self.published = 0  # PUBLISH packets received
+    self.delivered = 0  # PUBLISH packets forwarded to subscribers
+    self.pubacks = 0  # PUBACKs received from subscribers
+    self.pings = 0
+    self._router = TopicRouter()
+    self._router_lock = threading.Lock()
+    self._connections = []
+    self._server = socket.socket()
+    self._server.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    self._server.bind( ("127.0.0.1", port) )
+    self._server.listen( 8 )
+    self.port = self._server.getsockname()[1]
+    if delay_ms:
+      self._delayed = queue.Queue()
+      threading.Thread( target = self._send_delayed, daemon = True ).start()
+    threading.Thread( target = self._accept, daemon = True ).start()
+
+  def close( self ):
+    """
+    Stop listening and drop every client.
+    """
+    try:
+      self._server.shutdown( socket.SHUT_RDWR )
+    except OSError:
+      pass
+    self._server.close()
+    for connection in list( self._connections ):
+      try:
+        connection.sock.shutdown( socket.SHUT_RDWR )
+      except OSError:
+        pass
+
+  def flood( self, topic, msg, count, qos = 0 ):
+    """
+    Send count copies of a message to the subscribers of topic as fast as the sockets take them, from a thread.
+    :return: the thread.
+    """
+    def run():
+      topic_bytes = topic.encode() if isinstance( topic, str ) else topic
+      with self._router_lock:
+        targets = self._router.match( topic_bytes )
+      for connection, sub_qos in targets:
+        q = min( qos, sub_qos )
+        if q:
+          # Each batch is sent repeatedly with the same packet identifiers, which the clients only echo back.
+          batch = b"".join( publish_packet( topic_bytes, msg, q, connection.next_pid() ) for _ in range( 100 ) )
+        else:
+          batch = publish_packet( topic_bytes, msg ) * 100
+        for sent in range( 0, count, 100 ):
+          connection.send_now( batch if count - sent >= 100 else batch[:len( batch ) // 100 * (count - sent)] )
+        self.delivered += count
+
+    thread = threading.Thread( target = run, daemon = True )
+    thread.start()
+    return thread
+
+  def _accept( self ):
+    while True:
+      try:
+        sock, _ = self._server.accept()
+      except OSError:
+        return
+      sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+      connection = _Connection( self, sock )
+      self._connections.append( connection )
+      threading.Thread( target = self._serve, args = (connection,), daemon = True ).start()
+
+  def _send_delayed( self ):
+    while True:
+      due, connection, data = self._delayed.get()
+      wait = due - time.monotonic()
+      if wait > 0:
+        time.sleep( wait )
+      connection.send_now( data )
+
+  def _serve( self, connection ):
+    if self.ssl_context is not None:
+      try:
+        connection.sock = self.ssl_context.wrap_socket( connection.sock, server_side = True )
+      except OSError:
+        self._connections.remove( connection )
+        connection.sock.close()
+        return
+      self.handshakes += 1
+      self.resumed += connection.sock.session_reused
+    stream = connection.sock.makefile( "rb" )
+    try:
+      while True:
+        header = stream.read( 1 )
+        if not header:
+          break
+        n = 0
+        shift = 0
+        while True:
+          b = stream.read( 1 )
+          if not b:
+            raise EOFError
+          n |= (b[0] & 0x7F) << shift
+          shift += 7
+          if not b[0] & 0x80:
+            break
+        body = stream.read( n )
+        if len( body ) < n:
+          break
+        if not self._handle( connection, header[0], body ):
+          break
+    except (EOFError, OSError):
+      pass
+    with self._router_lock:
+      for topic_filter, handler in connection.subscriptions:
+        self._router.remove( topic_filter, handler )
+    self._connections.remove( connection )
+    connection.sock.close()
+
+  def _handle( self, connection, header, body ):
+    """
+    :return: False to close the connection.
+    """
+    kind = header & 0xF0
+    if kind == 0x10:  # CONNECT
+      connection.send( b"\x20\x02\0\0" )
+    elif kind == 0x30:  # PUBLISH
+      self.published += 1
+      qos = header >> 1 & 3
+      i = 2 + struct.unpack_from( "!H", body )[0]
+      topic = body[2:i]
+      if qos:
+        connection.send( b"\x40\x02" + body[i:i + 2] )
+        i += 2
+      msg = body[i:]
+      with self._router_lock:
+        targets = self._router.match( topic )
+      for target, sub_qos in targets:
+        q = min( qos, sub_qos )
+        target.send( publish_packet( topic, msg, q, target.next_pid() if q else 0 ) )
+        self.delivered += 1
+    elif kind == 0x40:  # PUBACK
+      self.pubacks += 1
+    elif kind == 0x80:  # SUBSCRIBE
+      codes = bytearray()
+      i = 2
+      while i < len( body ):
+        j = i + 2 + struct.unpack_from( "!H", body, i )[0]
+        topic_filter = body[i + 2:j]
+        qos = min( body[j], 1 )
+        handler = (connection, qos)
+        try:
+          with self._router_lock:
+            self._router.add( topic_filter, handler )
+          connection.subscriptions.append( (topic_filter, handler) )
+          codes.append( qos )
+        except ValueError:
+          codes.append( 0x80 )
+        i = j + 1
+      connection.send( packet( 0x90, body[:2] + codes ) )
+    elif kind == 0xA0:  # UNSUBSCRIBE
+      i = 2
+      while i < len( body ):
+        j = i + 2 + struct.unpack_from( "!H", body, i )[0]
+        topic_filter = body[i + 2:j]
+        with self._router_lock:
+          for entry in [s for s in connection.subscriptions if s[0] == topic_filter]:
+            self._router.remove( topic_filter, entry[1] )
+            connection.subscriptions.remove( entry )
+        i = j
+      connection.send( b"\xb0\x02" + body[:2] )
+    elif kind == 0xC0:  # PINGREQ
+      self.pings += 1
+      connection.send( b"\xd0\0" )
+    elif kind == 0xE0:  # DISCONNECT
+      return False
+    return True
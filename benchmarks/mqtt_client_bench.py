@@ -0,0 +1,228 @@
+"""
+Throughput, latency, bytes on the wire and allocations of umqtt.simple and umqtt.robust, under CPython, against
+the broker in benchmarks.mqtt_broker on loopback.
+
+The client modules run unmodified: benchmarks/shims stands in for usocket, ustruct, utime and urandom, and umqtt/
+goes on the path the way its files sit in /lib on the Pico.  The numbers are for comparing one version of the
+client with another on the same machine, not for predicting speed on the RP2040.
+
+  publish  messages sent back to back; QoS 1 includes waiting for the PUBACKs.
+  receive  messages the broker sends as fast as it can, read with wait_msg().
+  latency  publish to a topic the client is subscribed to, until the callback gets it back.
+  writes   socket writes per message; bytes are counted at the socket, MQTT packets without TCP/IP headers.
+  alloc    the most memory a single call has in use for new Python objects at once, from tracemalloc.  For this
+           the client writes into nothing and reads replies queued in advance (see ReplayStream), so that only
+           its own allocations are counted, not the broker's or the socket stand-in's.
+
+Run from the repository root:
+  python3 -m benchmarks.mqtt_client_bench
+"""
+import os
+import socket as host_socket
+import sys
+import threading
+import tracemalloc
+
+BENCHMARKS = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path[:0] = [os.path.join( BENCHMARKS, "shims" ), os.path.join( os.path.dirname( BENCHMARKS ), "umqtt" )]
+
+import robust
+import simple
+import usocket
+from benchmarks.mqtt_broker import Broker, publish_packet
+from benchmarks.timing import ticks_us, ticks_diff
+
+MESSAGES = 20000
+LATENCY_SAMPLES = 2000
+ALLOC_SAMPLES = 1000
+WARMUP = 100
+TOPIC = "sensors/pico/temperature"
+PAYLOAD = b"21.53"
+WINDOW = 16
+CLIENTS = (("simple", simple.MQTTClient, { }),
+           ("simple", simple.MQTTClient, { "max_inflight": WINDOW }),
+           ("robust", robust.MQTTClient, { }))
+
+
+def ignore( topic, msg ):
+  pass
+
+
+def connect( cls, broker, **kwargs ):
+  client = cls( "bench", "127.0.0.1", port = broker.port, **kwargs )
+  client.set_callback( ignore )
+  client.connect()
+  return client
+
+
+class ReplayStream:
+  """
+  The client's socket while its allocations are measured: writes are dropped, and reads come from what the other
+  end sent in advance.  Neither allocates anything.
+  """
+
+  def __init__( self, sock ):
+    self._sock = sock
+
+  def write( self, buf, off_or_n = None, n = None ):
+    return n if n is not None else off_or_n if off_or_n is not None else len( buf )
+
+  def readinto( self, buf, nbytes = None ):
+    return self._sock.recv_into( buf, nbytes or 0 )
+
+  def setblocking( self, flag ):
+    self._sock.setblocking( flag )
+
+  def close( self ):
+    self._sock.close()
+
+
+def connect_direct( cls, **kwargs ):
+  """
+  Connect a client to a plain socket instead of the broker, then swap its socket for a ReplayStream.
+  :return: the client and the other end of its connection.
+  """
+  server = host_socket.create_server( ("127.0.0.1", 0) )
+  peer = []
+
+  def accept():
+    sock, _ = server.accept()
+    sock.sendall( b"\x20\x02\0\0" )  # CONNACK
+    peer.append( sock )
+
+  thread = threading.Thread( target = accept )
+  thread.start()
+  client = cls( "bench", "127.0.0.1", port = server.getsockname()[1], **kwargs )
+  client.set_callback( ignore )
+  client.connect()
+  thread.join()
+  server.close()
+  client.sock = ReplayStream( client.sock._sock )
+  return client, peer[0]
+
+
+def alloc_per_call( call, count ):
+  """
+  :return: the average over count calls of the peak memory each call allocated, in bytes.
+  """
+  total = 0
+  tracemalloc.start()
+  for _ in range( count ):
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    call()
+    total += tracemalloc.get_traced_memory()[1] - before
+  tracemalloc.stop()
+  return total / count
+
+
+def wire( count ):
+  return (f"{usocket.STATS['writes'] / count:10.2f}  {usocket.STATS['sent'] / count:8.1f}  "
+          f"{usocket.STATS['received'] / count:8.1f}")
+
+
+def bench_publish( broker, cls, qos, kwargs ):
+  client = connect( cls, broker, **kwargs )
+  for _ in range( WARMUP ):
+    client.publish( TOPIC, PAYLOAD, qos = qos )
+  client.flush()
+  usocket.reset_stats()
+  start = ticks_us()
+  for _ in range( MESSAGES ):
+    client.publish( TOPIC, PAYLOAD, qos = qos )
+  client.flush()
+  elapsed = ticks_diff( ticks_us(), start )
+  rate = MESSAGES * 1000000 / elapsed
+  traffic = wire( MESSAGES )
+  client.disconnect()
+
+  client, peer = connect_direct( cls, **kwargs )
+  if qos:
+    # Every PUBACK the client will wait for, sent in advance.
+    peer.sendall( b"".join( b"\x40\x02" + ((client.pid + i) % 65535 + 1).to_bytes( 2, "big" )
+                            for i in range( ALLOC_SAMPLES ) ) )
+  alloc = alloc_per_call( lambda: client.publish( TOPIC, PAYLOAD, qos = qos ), ALLOC_SAMPLES )
+  client.flush()
+  client.disconnect()
+  peer.close()
+  return f"{rate:13.0f}  {traffic}  {alloc:11.1f}"
+
+
+def bench_receive( broker, cls, qos ):
+  received = [0]
+
+  def count( topic, msg ):
+    received[0] += 1
+
+  client = connect( cls, broker )
+  client.set_callback( count )
+  client.subscribe( "bench/rx", qos )
+  usocket.reset_stats()
+  start = ticks_us()
+  broker.flood( "bench/rx", PAYLOAD, MESSAGES, qos )
+  while received[0] < MESSAGES:
+    client.wait_msg()
+  elapsed = ticks_diff( ticks_us(), start )
+  rate = MESSAGES * 1000000 / elapsed
+  traffic = wire( MESSAGES )
+  client.disconnect()
+
+  client, peer = connect_direct( cls )
+  peer.sendall( b"".join( publish_packet( b"bench/rx", PAYLOAD, qos, i + 1 ) for i in range( ALLOC_SAMPLES ) ) )
+  alloc = alloc_per_call( client.wait_msg, ALLOC_SAMPLES )
+  client.disconnect()
+  peer.close()
+  return f"{rate:13.0f}  {traffic}  {alloc:11.1f}"
+
+
+def bench_latency( broker, cls, qos, kwargs ):
+  received = [False]
+
+  def echo( topic, msg ):
+    received[0] = True
+
+  client = connect( cls, broker, **kwargs )
+  client.set_callback( echo )
+  client.subscribe( "bench/echo", qos )
+  samples = []
+  for i in range( WARMUP + LATENCY_SAMPLES ):
+    received[0] = False
+    start = ticks_us()
+    client.publish( "bench/echo", PAYLOAD, qos = qos )
+    while not received[0]:
+      client.wait_msg()
+    if i >= WARMUP:
+      samples.append( ticks_diff( ticks_us(), start ) )
+  client.flush()
+  client.disconnect()
+  samples.sort()
+  p50, p90, p99 = (samples[len( samples ) * p // 100] for p in (50, 90, 99))
+  return f"{p50:7d}  {p90:7d}  {p99:7d}  {samples[-1]:7d}"
+
+
+def label( name, qos, kwargs ):
+  return f"{name:6s}  {qos:3d}  {kwargs.get( 'max_inflight', 1 ):6d}"
+
+
+if __name__ == "__main__":
+  broker = Broker()
+  print( f"{MESSAGES} messages of {len( PAYLOAD )} bytes on {TOPIC!r}" )
+  print( "" )
+  print( "client  qos  window  publish msg/s  writes/msg  tx B/msg  rx B/msg  alloc B/msg" )
+  for qos in (0, 1):
+    for name, cls, kwargs in CLIENTS:
+      if qos or not kwargs:
+        print( f"{label( name, qos, kwargs )}  {bench_publish( broker, cls, qos, kwargs )}" )
+  print( "" )
+  print( "client  qos  receive msg/s  writes/msg  tx B/msg  rx B/msg  alloc B/msg" )
+  for qos in (0, 1):
+    for name, cls, kwargs in CLIENTS:
+      if not kwargs:
+        print( f"{name:6s}  {qos:3d}  {bench_receive( broker, cls, qos )}" )
+  print( "" )
+  print( "client  qos  window  round trip us: p50      p90      p99      max" )
+  for qos in (0, 1):
+    for name, cls, kwargs in CLIENTS:
+      if qos or not kwargs:
+        print( f"{label( name, qos, kwargs )}                {bench_latency( broker, cls, qos, kwargs )}" )
+  broker.close()
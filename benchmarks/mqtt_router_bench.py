@@ -0,0 +1,84 @@
+"""
+Dispatch cost of umqtt.router.TopicRouter against checking every filter in turn, as the number of filters grows.
+
+The filters look like a fleet of devices with per-device command topics, some + and # wildcards, and the topics are
+drawn from the same space so that some match and some do not.  Every topic's matches are checked against the
+linear scan before timing.
+
+Run from the repository root:
+  python3 -m benchmarks.mqtt_router_bench
+"""
+import random
+
+from benchmarks.timing import ticks_us, ticks_diff
+from umqtt.router import TopicRouter
+
+FILTER_COUNTS = (10, 100, 1000, 5000)
+TOPICS = 2000
+SITES = 20
+COMMANDS = ("led", "config", "reset", "interval", "sleep")
+
+
+def make_filters( rng, count ):
+  filters = []
+  while len( filters ) < count:
+    site = f"site{rng.randrange( SITES )}"
+    device = f"pico{rng.randrange( count )}"
+    kind = rng.random()
+    if kind < 0.8:
+      filters.append( f"{site}/{device}/{rng.choice( COMMANDS )}" )
+    elif kind < 0.9:
+      filters.append( f"{site}/+/{rng.choice( COMMANDS )}" )
+    elif kind < 0.97:
+      filters.append( f"{site}/{device}/#" )
+    else:
+      filters.append( f"+/{device}/+" )
+  return filters
+
+
+def make_topics( rng, count ):
+  return [f"site{rng.randrange( SITES )}/pico{rng.randrange( count )}/{rng.choice( COMMANDS )}".encode()
+          for _ in range( TOPICS )]
+
+
+def filter_matches( filter_levels, topic_levels ):
+  for i, level in enumerate( filter_levels ):
+    if level == b"#":
+      return True
+    if i >= len( topic_levels ) or (level != b"+" and level != topic_levels[i]):
+      return False
+  return len( filter_levels ) == len( topic_levels )
+
+
+def linear_match( filters, topic ):
+  topic_levels = topic.split( b"/" )
+  return [handler for filter_levels, handler in filters if filter_matches( filter_levels, topic_levels )]
+
+
+if __name__ == "__main__":
+  rng = random.Random( 18 )
+  print( "filters  trie us/topic  linear us/topic  matches/topic" )
+  for count in FILTER_COUNTS:
+    filters = make_filters( rng, count )
+    topics = make_topics( rng, count )
+    router = TopicRouter()
+    linear = []
+    for i, topic_filter in enumerate( filters ):
+      router.add( topic_filter, i )  # the index stands in for the handler
+      linear.append( (topic_filter.encode().split( b"/" ), i) )
+
+    matches = 0
+    for topic in topics:
+      found = sorted( router.match( topic ) )
+      assert found == sorted( linear_match( linear, topic ) ), topic
+      matches += len( found )
+
+    start = ticks_us()
+    for topic in topics:
+      router.match( topic )
+    trie_us = ticks_diff( ticks_us(), start ) / TOPICS
+    start = ticks_us()
+    for topic in topics:
+      linear_match( linear, topic )
+    linear_us = ticks_diff( ticks_us(), start ) / TOPICS
+    print( f"{count:7d}  {trie_us:13.2f}  {linear_us:15.2f}  {matches / TOPICS:13.2f}" )
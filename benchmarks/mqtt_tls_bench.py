@@ -0,0 +1,79 @@
+"""
+TLS connect cost of umqtt.simple against the broker in benchmarks.mqtt_broker, for three ways of reconnecting:
+
+  new context  a new SSL context and a full handshake every time, as connect() used to do
+  context      the client's SSL context reused, but a full handshake every time
+  resume       the SSL context reused, and the previous TLS session offered to the broker.  Only on the host:
+               MicroPython's ssl has no sessions, so on the Pico a reconnect costs what the context row does.
+
+Connect time covers the TCP connect, the handshake and the CONNACK, on loopback.  A throwaway self-signed RSA 2048
+certificate is made with the openssl command line tool.  The heap the client holds after a handshake (heap_bytes
+in MQTTClient.ssl_stats) is only measured on MicroPython, where gc.mem_alloc() sees mbedTLS; CPython's OpenSSL
+allocates outside the Python heap.
+
+Run from the repository root:
+  python3 -m benchmarks.mqtt_tls_bench
+"""
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path[:0] = [os.path.join( BENCHMARKS, "shims" ), os.path.join( os.path.dirname( BENCHMARKS ), "umqtt" )]
+
+import simple
+from benchmarks.mqtt_broker import Broker
+from benchmarks.timing import ticks_us, ticks_diff
+
+CONNECTS = 200
+VERSIONS = (("1.2", ssl.TLSVersion.TLSv1_2), ("1.3", ssl.TLSVersion.TLSv1_3))
+MODES = ("new context", "context", "resume")
+
+
+def make_certificate( directory ):
+  cert = os.path.join( directory, "cert.pem" )
+  key = os.path.join( directory, "key.pem" )
+  subprocess.run( ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                   "-keyout", key, "-out", cert], check = True, capture_output = True )
+  return cert, key
+
+
+def server_context( cert, key, version ):
+  context = ssl.SSLContext( ssl.PROTOCOL_TLS_SERVER )
+  context.load_cert_chain( cert, key )
+  context.minimum_version = version
+  context.maximum_version = version
+  return context
+
+
+def bench( broker, mode ):
+  client = simple.MQTTClient( "bench", "127.0.0.1", port = broker.port, ssl = True )
+  times = []
+  resumed = 0
+  for _ in range( CONNECTS ):
+    if mode == "new context":
+      client.ssl_context = None
+    if mode != "resume":
+      client.ssl_session = None
+    start = ticks_us()
+    client.connect()
+    times.append( ticks_diff( ticks_us(), start ) )
+    resumed += bool( client.ssl_stats['resumed'] )
+    client.disconnect()
+  times.sort()
+  return times[len( times ) // 2], times[len( times ) * 9 // 10], sum( times ) / len( times ), resumed
+
+
+if __name__ == "__main__":
+  with tempfile.TemporaryDirectory() as directory:
+    cert, key = make_certificate( directory )
+    print( f"{CONNECTS} connects each" )
+    print( "TLS  reconnect     connect us: p50      p90     mean  resumed" )
+    for name, version in VERSIONS:
+      for mode in MODES:
+        broker = Broker( ssl_context = server_context( cert, key, version ) )
+        p50, p90, mean, resumed = bench( broker, mode )
+        broker.close()
+        print( f"{name:3s}  {mode:11s}  {p50:15d}  {p90:7d}  {mean:7.0f}  {resumed:7d}" )
@@ -0,0 +1,68 @@
+"""
+machine for importing the Pico scripts under CPython: pins remember their value, the ADC reads a fixed value and
+timers run their callback from a thread.
+"""
+
+
+class Pin:
+  IN = 0
+  OUT = 1
+
+  def __init__( self, pin_id, mode = IN, value = 0 ):
+    self.pin_id = pin_id
+    self._value = value
+
+  def value( self, value = None ):
+    if value is None:
+      return self._value
+    self._value = value
+
+  def on( self ):
+    self._value = 1
+
+  def off( self ):
+    self._value = 0
+
+
+class ADC:
+  CORE_TEMP = 4
+
+  def __init__( self, channel ):
+    self.channel = channel
+
+  def read_u16( self ):
+    return 14000  # about 27 C on the core temperature sensor
+
+
+def reset():
+  raise SystemExit
+
+
+class Timer:
+  """
+  Calls the callback from a thread, every period ms or once.
+  """
+  ONE_SHOT = 0
+  PERIODIC = 1
+
+  def __init__( self, timer_id = -1 ):
+    self._stop = None
+
+  def init( self, mode = PERIODIC, period = -1, callback = None ):
+    import threading
+
+    self.deinit()
+    stop = self._stop = threading.Event()
+
+    def run():
+      while not stop.wait( period / 1000 ):
+        callback( self )
+        if mode == Timer.ONE_SHOT:
+          break
+
+    threading.Thread( target = run, daemon = True ).start()
+
+  def deinit( self ):
+    if self._stop is not None:
+      self._stop.set()
+      self._stop = None
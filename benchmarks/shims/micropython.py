@@ -0,0 +1,11 @@
+"""
+micropython for running MicroPython modules under CPython.
+"""
+
+
+def const( value ):
+  return value
+
+
+def schedule( function, argument ):
+  function( argument )
@@ -0,0 +1,31 @@
+"""
+network for importing the Pico scripts under CPython: a WLAN that is always connected to loopback.
+"""
+STA_IF = 0
+AP_IF = 1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+  def __init__( self, interface = STA_IF ):
+    self.interface = interface
+
+  def active( self, flag = None ):
+    return True
+
+  def connect( self, ssid = None, password = None ):
+    pass
+
+  def isconnected( self ):
+    return True
+
+  def status( self ):
+    return STAT_GOT_IP
+
+  def ifconfig( self ):
+    return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+  def config( self, name ):
+    if name == "mac":
+      return b"\x28\xcd\xc1\0\0\0"
+    raise ValueError( name )
@@ -0,0 +1,22 @@
+"""
+picozero for importing the Pico scripts under CPython: the parts web_server.py uses.
+"""
+
+
+class _TemperatureSensor:
+  temp = 21.5
+
+
+class _LED:
+  def __init__( self ):
+    self.value = 0
+
+  def on( self ):
+    self.value = 1
+
+  def off( self ):
+    self.value = 0
+
+
+pico_temp_sensor = _TemperatureSensor()
+pico_led = _LED()
@@ -0,0 +1,4 @@
+"""
+ucollections for running MicroPython modules under CPython.
+"""
+from collections import *
@@ -0,0 +1,4 @@
+"""
+ujson for running MicroPython modules under CPython.
+"""
+from json import *
@@ -0,0 +1,4 @@
+"""
+urandom for running MicroPython modules under CPython.
+"""
+from random import getrandbits, randint, randrange, random, choice, seed
@@ -0,0 +1,90 @@
+"""
+usocket for running umqtt under CPython: a CPython socket with the MicroPython stream methods, which counts the
+traffic in STATS so that the benchmarks can report bytes on the wire.
+"""
+import socket as _socket
+
+getaddrinfo = _socket.getaddrinfo
+AF_INET = _socket.AF_INET
+SOCK_STREAM = _socket.SOCK_STREAM
+
+STATS = { "writes": 0, "sent": 0, "reads": 0, "received": 0 }
+
+
+def reset_stats():
+  for key in STATS:
+    STATS[key] = 0
+
+
+class socket:
+  def __init__( self, af = AF_INET, kind = SOCK_STREAM, _sock = None ):
+    """
+    :param _sock: a connected CPython socket to wrap instead of creating one (not in MicroPython).
+    """
+    self._sock = _socket.socket( af, kind ) if _sock is None else _sock
+    # Otherwise Nagle's algorithm holds back the small packets MQTT writes, and loopback latency measures the
+    # delayed ACK timer instead of the client.
+    self._sock.setsockopt( _socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1 )
+    self._blocking = True
+
+  def connect( self, addr ):
+    self._sock.connect( addr )
+
+  def setblocking( self, flag ):
+    self._blocking = flag
+    self._sock.setblocking( flag )
+
+  def settimeout( self, value ):
+    self._blocking = value is None or value > 0
+    self._sock.settimeout( value )
+
+  def write( self, buf, off_or_n = None, n = None ):
+    """
+    write( buf ), write( buf, n ) or write( buf, off, n ), as MicroPython streams take them.
+    """
+    if isinstance( buf, str ):
+      buf = buf.encode()
+    if n is not None:
+      buf = memoryview( buf )[off_or_n:off_or_n + n]
+    elif off_or_n is not None:
+      buf = memoryview( buf )[:off_or_n]
+    self._sock.sendall( buf )
+    STATS["writes"] += 1
+    STATS["sent"] += len( buf )
+    return len( buf )
+
+  send = write
+
+  def readinto( self, buf, nbytes = None ):
+    """
+    Blocking: fill nbytes (or all of buf), stopping early only at end of stream.
+    Non-blocking: whatever is available, or None if nothing is.
+    """
+    if nbytes is None:
+      nbytes = len( buf )
+    try:
+      got = self._sock.recv_into( buf, nbytes )
+    except BlockingIOError:
+      return None
+    if got and got < nbytes and self._blocking:
+      view = memoryview( buf )
+      while got < nbytes:
+        r = self._sock.recv_into( view[got:nbytes] )
+        if not r:
+          break
+        got += r
+    STATS["reads"] += 1
+    STATS["received"] += got
+    return got
+
+  def read( self, n ):
+    buf = bytearray( n )
+    got = self.readinto( buf )
+    if got is None:
+      return None
+    return bytes( buf[:got] )
+
+  recv = read
+
+  def close( self ):
+    self._sock.close()
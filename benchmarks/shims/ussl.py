@@ -0,0 +1,76 @@
+"""
+ussl for running umqtt under CPython: MicroPython's SSLContext and wrap_socket() on top of CPython's ssl, taking
+and returning usocket stand-ins.  SSL sockets also have CPython's session and session_reused.
+"""
+import ssl as _ssl
+
+import usocket
+
+CERT_NONE = _ssl.CERT_NONE
+CERT_OPTIONAL = _ssl.CERT_OPTIONAL
+CERT_REQUIRED = _ssl.CERT_REQUIRED
+PROTOCOL_TLS_CLIENT = _ssl.PROTOCOL_TLS_CLIENT
+PROTOCOL_TLS_SERVER = _ssl.PROTOCOL_TLS_SERVER
+
+
+class _SSLSocket( usocket.socket ):
+  def readinto( self, buf, nbytes = None ):
+    try:
+      return super().readinto( buf, nbytes )
+    except _ssl.SSLWantReadError:
+      return None
+
+  @property
+  def session( self ):
+    return self._sock.session
+
+  @property
+  def session_reused( self ):
+    return self._sock.session_reused
+
+
+class SSLContext:
+  def __init__( self, protocol ):
+    self.context = _ssl.SSLContext( protocol )
+
+  @property
+  def verify_mode( self ):
+    return self.context.verify_mode
+
+  @verify_mode.setter
+  def verify_mode( self, value ):
+    self.context.verify_mode = value
+
+  @property
+  def check_hostname( self ):
+    return self.context.check_hostname
+
+  @check_hostname.setter
+  def check_hostname( self, value ):
+    self.context.check_hostname = value
+
+  def load_cert_chain( self, certfile, keyfile ):
+    self.context.load_cert_chain( certfile, keyfile )
+
+  def load_verify_locations( self, cafile = None, cadata = None ):
+    self.context.load_verify_locations( cafile = cafile, cadata = cadata )
+
+  def wrap_socket( self, sock, server_side = False, do_handshake_on_connect = True, server_hostname = None,
+                   session = None ):
+    wrapped = self.context.wrap_socket( sock._sock, server_side = server_side,
+                                        do_handshake_on_connect = do_handshake_on_connect,
+                                        server_hostname = server_hostname, session = session )
+    return _SSLSocket( _sock = wrapped )
+
+
+def wrap_socket( sock, server_side = False, key = None, cert = None, cert_reqs = CERT_NONE, cadata = None,
+                 server_hostname = None, do_handshake = True ):
+  context = SSLContext( PROTOCOL_TLS_SERVER if server_side else PROTOCOL_TLS_CLIENT )
+  if cert or key:
+    context.load_cert_chain( cert, key )
+  if cadata:
+    context.load_verify_locations( cadata = cadata )
+  if cert_reqs == CERT_NONE:
+    context.check_hostname = False
+  context.verify_mode = cert_reqs
+  return context.wrap_socket( sock, server_side, do_handshake, server_hostname )
@@ -0,0 +1,4 @@
+"""
+ustruct for running MicroPython modules under CPython.
+"""
+from struct import *
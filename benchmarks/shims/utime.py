@@ -0,0 +1,29 @@
+"""
+utime for running MicroPython modules under CPython.  The ticks do not wrap around, which ticks_diff() users
+cannot tell apart.
+"""
+from time import time, sleep, monotonic_ns as _monotonic_ns
+
+
+def ticks_ms():
+  return _monotonic_ns() // 1000000
+
+
+def ticks_us():
+  return _monotonic_ns() // 1000
+
+
+def ticks_diff( end, start ):
+  return end - start
+
+
+def ticks_add( ticks, delta ):
+  return ticks + delta
+
+
+def sleep_ms( ms ):
+  sleep( ms / 1000 )
+
+
+def sleep_us( us ):
+  sleep( us / 1000000 )
@@ -0,0 +1,89 @@
+"""
+Size and encode/decode speed of Telemetry_Frame against publishing every value as ASCII on its own topic, the way
+MQTT_uPython.py does by default.
+
+Bytes are whole MQTT PUBLISH packets at QoS 0 (fixed header, topic and payload) per sample of temperature,
+pressure and humidity, and publishes are the packets (and socket writes) per sample.  Every frame is decoded and
+checked against the values it was built from before timing.
+
+Run from the repository root:
+  python3 -m benchmarks.telemetry_frame_bench
+"""
+import random
+
+from Telemetry_Frame import FrameEncoder, decode
+from benchmarks.timing import ticks_us, ticks_diff
+
+PUBLISH_TOPIC = "pico/weather"
+SENSORS = ('temperature', 'pressure', 'humidity')
+SAMPLES = 20000
+BATCHES = (1, 10, 60)
+
+
+def publish_size( topic, payload ):
+  remaining = 2 + len( topic ) + len( payload )
+  return 1 + (1 if remaining < 128 else 2) + remaining
+
+
+def make_samples( rng ):
+  return [(1000000 + 5 * i, (round( rng.uniform( -20, 40 ), 2 ), round( rng.uniform( 950, 1050 ), 2 ),
+                             round( rng.uniform( 10, 90 ), 2 ))) for i in range( SAMPLES )]
+
+
+def text_encode( samples ):
+  topics = [f"{PUBLISH_TOPIC}/{name}".encode() for name in SENSORS]
+  messages = []
+  for _, values in samples:
+    for topic, value in zip( topics, values ):
+      messages.append( (topic, f"{value:.2f}".encode()) )
+  return messages
+
+
+def text_decode( messages ):
+  return [float( msg ) for _, msg in messages]
+
+
+def binary_encode( samples, batch ):
+  encoder = FrameEncoder( SENSORS, batch )
+  frames = []
+  for timestamp, values in samples:
+    frame = encoder.add( timestamp, values )
+    if frame is not None:
+      frames.append( bytes( frame ) )
+  frame = encoder.flush()
+  if frame is not None:
+    frames.append( bytes( frame ) )
+  return frames
+
+
+def binary_decode( frames ):
+  return [sample for frame in frames for sample in decode( frame )]
+
+
+def timed( function, *args ):
+  start = ticks_us()
+  result = function( *args )
+  return result, ticks_diff( ticks_us(), start ) / SAMPLES
+
+
+if __name__ == "__main__":
+  samples = make_samples( random.Random( 21 ) )
+  print( "scheme       publishes/sample  bytes/sample  encode us/sample  decode us/sample" )
+
+  messages, encode_us = timed( text_encode, samples )
+  values, decode_us = timed( text_decode, messages )
+  assert values == [value for _, sample in samples for value in sample]
+  size = sum( publish_size( topic, msg ) for topic, msg in messages ) / SAMPLES
+  print( f"text         {len( messages ) / SAMPLES:16.2f}  {size:12.1f}  {encode_us:16.2f}  {decode_us:16.2f}" )
+
+  topic = f"{PUBLISH_TOPIC}/telemetry".encode()
+  for batch in BATCHES:
+    frames, encode_us = timed( binary_encode, samples, batch )
+    decoded, decode_us = timed( binary_decode, frames )
+    for (timestamp, values), sample in zip( samples, decoded ):
+      assert sample['timestamp'] == timestamp
+      assert [sample[name] for name in SENSORS] == list( values ), (sample, values)
+    assert len( decoded ) == SAMPLES and decoded[-1]['sequence'] == (SAMPLES - 1) & 0xFFFF
+    size = sum( publish_size( topic, frame ) for frame in frames ) / SAMPLES
+    print( f"binary x{batch:<3d}  {len( frames ) / SAMPLES:16.2f}  {size:12.1f}  {encode_us:16.2f}  "
+           f"{decode_us:16.2f}" )
@@ -0,0 +1,15 @@
+"""
+Microsecond timer that works on MicroPython and CPython, for the benchmark scripts.
+"""
+try:
+  from time import ticks_us, ticks_diff
+except ImportError:
+  from time import perf_counter_ns
+
+
+  def ticks_us():
+    return perf_counter_ns() // 1000
+
+
+  def ticks_diff( end, start ):
+    return end - start
@@ -0,0 +1,164 @@
+"""
+Load test of the web_server.py status page: HttpServer (asyncio, keep-alive) against serve2() (one connection at
+a time, listen( 1 )), each in its own process on loopback, with the shims in benchmarks/shims standing in for the
+Pico hardware.
+
+The load comes from asyncio clients in this process, each making its share of REQUESTS requests to / one after
+another: over one kept-alive connection, or a new connection per request.  The idle rows first open a connection
+that never sends anything, as a stalled phone or a port scanner would: serve2() waits on it until the load gives
+up after STALL_LIMIT_S, while HttpServer serves the others and drops it after its timeout.
+
+Run from the repository root:
+  python3 -m benchmarks.web_server_bench
+"""
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+BENCHMARKS = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path.insert( 0, os.path.join( BENCHMARKS, "shims" ) )
+
+import utime
+
+# SensorCache uses MicroPython's time.ticks_ms(), which CPython's time module does not have.
+time.ticks_ms = utime.ticks_ms
+time.ticks_diff = utime.ticks_diff
+
+import web_server
+from Http_Server import HttpServer
+from benchmarks.timing import ticks_us, ticks_diff
+
+REQUESTS = 2000
+STALL_LIMIT_S = 5
+SCENARIOS = (
+  # server, clients, keep-alive, idle client
+  ("HttpServer", 1, True, False),
+  ("HttpServer", 8, True, False),
+  ("HttpServer", 8, False, False),
+  ("HttpServer", 8, True, True),
+  ("serve2", 1, False, False),
+  ("serve2", 8, False, False),
+  ("serve2", 8, False, True),
+)
+
+
+def free_port():
+  with socket.socket() as s:
+    s.bind( ("127.0.0.1", 0) )
+    return s.getsockname()[1]
+
+
+def run_http_server( port ):
+  # More connections than the Pico default, so that none of the load clients is turned away.
+  server = HttpServer( web_server.ROUTES, backlog = 16, max_connections = 16, timeout_ms = 2000 )
+  server.run( "127.0.0.1", port )
+
+
+def run_serve2( port ):
+  with contextlib.redirect_stdout( None ):
+    web_server.serve2( web_server.open_socket( "127.0.0.1", port ) )
+
+
+async def read_response( reader ):
+  """
+  :return: whether the status is 200, or None if the server had closed the connection.
+  """
+  status = await reader.readline()
+  if not status:
+    return None
+  length = 0
+  while True:
+    line = await reader.readline()
+    if line in (b"\r\n", b""):
+      break
+    name, _, value = line.partition( b":" )
+    if name.lower() == b"content-length":
+      length = int( value )
+  await reader.readexactly( length )
+  return status.split()[1] == b"200"
+
+
+async def load_client( port, count, keep_alive, latencies ):
+  errors = 0
+  reader = writer = None
+  request = b"GET / HTTP/1.1\r\nHost: pico\r\n" + (b"\r\n" if keep_alive else b"Connection: close\r\n\r\n")
+  for _ in range( count ):
+    start = ticks_us()
+    try:
+      if writer is None:
+        reader, writer = await asyncio.open_connection( "127.0.0.1", port )
+      writer.write( request )
+      await writer.drain()
+      ok = await read_response( reader )
+      if ok is None:
+        # The server closes kept-alive connections after max_requests; retry on a new one, as browsers do.
+        writer.close()
+        reader, writer = await asyncio.open_connection( "127.0.0.1", port )
+        writer.write( request )
+        await writer.drain()
+        ok = await read_response( reader )
+      if not ok:
+        errors += 1
+    except (OSError, EOFError):
+      errors += 1
+      keep_alive = False
+    latencies.append( ticks_diff( ticks_us(), start ) )
+    if not keep_alive and writer is not None:
+      writer.close()
+      writer = None
+  if writer is not None:
+    writer.close()
+  return errors
+
+
+async def load( port, clients, keep_alive, idle ):
+  if idle:
+    _, idle_writer = await asyncio.open_connection( "127.0.0.1", port )
+    await asyncio.sleep( 0.05 )
+  latencies = []
+  start = ticks_us()
+  try:
+    errors = await asyncio.wait_for( asyncio.gather(
+      *(load_client( port, REQUESTS // clients, keep_alive, latencies ) for _ in range( clients )) ), STALL_LIMIT_S )
+  except asyncio.TimeoutError:
+    return None
+  elapsed = ticks_diff( ticks_us(), start )
+  latencies.sort()
+  return (len( latencies ) * 1000000 / elapsed, [latencies[len( latencies ) * p // 100] for p in (50, 90, 99)],
+          latencies[-1], sum( errors ))
+
+
+def wait_for_port( port ):
+  for _ in range( 100 ):
+    try:
+      socket.create_connection( ("127.0.0.1", port) ).close()
+      return
+    except OSError:
+      time.sleep( 0.05 )
+  raise OSError( "server did not start" )
+
+
+if __name__ == "__main__":
+  print( f"{REQUESTS} requests of / per row" )
+  print( "server      clients  keep-alive  idle  requests/s     p50 us     p90 us     p99 us     max us  errors" )
+  for name, clients, keep_alive, idle in SCENARIOS:
+    port = free_port()
+    target = run_http_server if name == "HttpServer" else run_serve2
+    process = multiprocessing.Process( target = target, args = (port,), daemon = True )
+    process.start()
+    try:
+      wait_for_port( port )
+      result = asyncio.run( load( port, clients, keep_alive, idle ) )
+    finally:
+      process.terminate()
+      process.join()
+    row = f"{name:10s}  {clients:7d}  {str( keep_alive ):10s}  {'yes' if idle else 'no':4s}"
+    if result is None:
+      print( f"{row}  stalled: not done after {STALL_LIMIT_S} s" )
+    else:
+      rate, percentiles, worst, errors = result
+      print( f"{row}  {rate:10.0f}  " + "  ".join( f"{p:9d}" for p in percentiles ) + f"  {worst:9d}  {errors:6d}" )
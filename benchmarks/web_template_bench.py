@@ -0,0 +1,135 @@
+"""
+Rendering the web_server.py status page: the f-string format_html() it had before (with its two debug prints,
+sent to a discarding stream here), rendering through PageTemplate, and the cached HTTP response that serve2()
+sends, both while the readings stay the same and with a new reading on every request.  Then a /metrics scrape
+without an ETag, and with the ETag of the last scrape, which gets a 304.
+
+Alloc is the most memory a single request has in use for new Python objects at once, from tracemalloc.  For the
+template, over 1 KB of it is CPython's bytes.join() holding a buffer descriptor per piece while it copies them;
+MicroPython's join only allocates the result.
+
+Run from the repository root:
+  python3 -m benchmarks.web_template_bench
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname( os.path.abspath( __file__ ) )
+sys.path.insert( 0, os.path.join( BENCHMARKS, "shims" ) )
+
+import utime
+
+# SensorCache uses MicroPython's time.ticks_ms(), which CPython's time module does not have.
+time.ticks_ms = utime.ticks_ms
+time.ticks_diff = utime.ticks_diff
+
+import web_server
+from Http_Server import Request
+from benchmarks.timing import ticks_us, ticks_diff
+
+REQUESTS = 50000
+ALLOC_REQUESTS = 1000
+
+
+def format_html_fstring( temperature, adjusted_temp, state, cpu_temperature ):
+  """
+  format_html() before PageTemplate.
+  """
+  c_to_f = web_server.c_to_f
+  print( f"Temp: {temperature} C ({c_to_f( temperature )} F)" )
+  print( f"Adjusted temp: {adjusted_temp} C ({c_to_f( adjusted_temp )} F)" )
+  # Template HTML
+  html = f"""
+  <!DOCTYPE html>
+  <html>
+    <head></head>
+    <body style="background-color:black;color:gray;">
+      <h1>PicoW</h1>
+
+      <form action="./lighton">
+        <input type="submit" value="Light on" />
+      </form>
+
+      <form action="./lightoff">
+        <input type="submit" value="Light off" />
+      </form>
+
+      <p>LED is {state}</p>
+      <p>
+        Temperature: {round( temperature, 2 )} C ({round( c_to_f( temperature ), 2 )} F)<br>
+        Adjusted temp: {round( adjusted_temp, 2 )} C ({round( c_to_f( adjusted_temp ), 2 )} F)<br>
+        CPU temp: {round( cpu_temperature, 2 )} C ({round( c_to_f( cpu_temperature ), 2 )} F)
+      </p>
+    </body>
+  </html>
+  """
+  return str( html )
+
+
+def old_page( i ):
+  return format_html_fstring( 21.5, web_server.adjust_temp( 21.5 ), "ON", 27.1 )
+
+
+def template_page( i ):
+  return web_server.format_html( 21.5, web_server.adjust_temp( 21.5 ), "ON", 27.1 )
+
+
+def cached_response( i ):
+  return web_server.STATUS_PAGE.response( web_server.status_values, 21.5, web_server.adjust_temp( 21.5 ), "ON",
+                                          27.1 )
+
+
+def changing_response( i ):
+  temperature = 21.5 + i * 0.01
+  return web_server.STATUS_PAGE.response( web_server.status_values, temperature,
+                                          web_server.adjust_temp( temperature ), "ON", 27.1 )
+
+
+SCRAPE = Request( "GET", "/metrics", b"HTTP/1.1", { } )
+
+
+def metrics_scrape( i ):
+  return web_server.metrics( SCRAPE )
+
+
+def metrics_not_modified( i ):
+  return web_server.metrics( CONDITIONAL_SCRAPE )
+
+
+def run( page ):
+  start = ticks_us()
+  for i in range( REQUESTS ):
+    page( i )
+  rate = REQUESTS * 1000000 / ticks_diff( ticks_us(), start )
+  total = 0
+  tracemalloc.start()
+  for i in range( ALLOC_REQUESTS ):
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    page( i )
+    total += tracemalloc.get_traced_memory()[1] - before
+  tracemalloc.stop()
+  return rate, total / ALLOC_REQUESTS, len( page( 0 ) )
+
+
+if __name__ == "__main__":
+  cases = (("f-string + prints", old_page), ("PageTemplate.render", template_page),
+           ("cached response", cached_response), ("new reading each time", changing_response),
+           ("/metrics", metrics_scrape), ("/metrics, 304", metrics_not_modified))
+  web_server.metrics( SCRAPE )
+  CONDITIONAL_SCRAPE = Request( "GET", "/metrics", b"HTTP/1.1", { b"if-none-match": web_server.METRICS_PAGE.etag } )
+  results = []
+  with contextlib.redirect_stdout( io.StringIO() ) as discard:
+    for name, page in cases:
+      results.append( (name, run( page )) )
+      discard.seek( 0 )
+      discard.truncate()
+  print( f"{REQUESTS} requests" )
+  print( "page                    requests/s  alloc B/request  response bytes" )
+  for name, (rate, alloc, size) in results:
+    print( f"{name:22s}  {rate:10.0f}  {alloc:15.1f}  {size:14d}" )
+  print( f"response cache: {web_server.STATUS_PAGE.hits} hits, {web_server.STATUS_PAGE.misses} misses" )
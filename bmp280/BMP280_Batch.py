@@ -0,0 +1,141 @@
+"""
+Host-side batch compensation of archived raw BMP280 readings.
+
+compensate_batch() takes the twelve calibration coefficients and whole sequences of raw temperature and pressure
+readings (the values BMP280 keeps in _t_raw and _p_raw), and returns the compensated temperatures in degrees
+Celsius and pressures in Pa.  The results are bit-for-bit what BMP280.temperature and BMP280.pressure report for
+the same raw sample and compensation engine.
+
+NumPy is used when it is installed, and processes millions of samples per second.  Without it, the scalar formulas
+from BMP280_Compensation are applied sample by sample and the results are returned in array('d') objects.
+"""
+from array import array
+
+from bmp280.BMP280_Compensation import COMPENSATION_INT64, COMPENSATION_INT32, COMPENSATION_FLOAT
+from bmp280.BMP280_Compensation import t_fine, temperature_c, pressure_pa
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+def compensate_batch( cal, t_raw, p_raw, compensation = COMPENSATION_INT64, use_numpy = True ):
+  """
+  Compensate a batch of raw readings.
+  :param cal: a Calibration (or any sequence of T1, T2, T3, P1 ... P9).
+  :param t_raw: raw temperature readings, any sequence or array of integers.
+  :param p_raw: raw pressure readings, the same length as t_raw.
+  :param compensation: one of the COMPENSATION_* engines from BMP280_Compensation.
+  :param use_numpy: set to False to force the pure Python path.
+  :return: (temperatures, pressures), as NumPy float64 arrays or array('d') objects.
+  """
+  assert len( t_raw ) == len( p_raw ), "t_raw and p_raw must be the same length"
+  if numpy is not None and use_numpy:
+    return _compensate_numpy( tuple( cal ), t_raw, p_raw, compensation )
+  return _compensate_python( cal, t_raw, p_raw, compensation )
+
+
+def _compensate_python( cal, t_raw, p_raw, compensation ):
+  count = len( t_raw )
+  temperatures = array( 'd', bytes( 8 * count ) )
+  pressures = array( 'd', bytes( 8 * count ) )
+  for i in range( count ):
+    t_fine_value = t_fine( cal, t_raw[i] )
+    temperatures[i] = temperature_c( t_fine_value, compensation )
+    pressures[i] = pressure_pa( cal, p_raw[i], t_fine_value, compensation )
+  return temperatures, pressures
+
+
+def _t_fine_numpy( cal, t_raw ):
+  t1, t2, t3 = cal[0], cal[1], cal[2]
+  var1 = (((t_raw >> 3) - (t1 << 1)) * t2) >> 11
+  b = (t_raw >> 4) - t1
+  var2 = (((b * b) >> 12) * t3) >> 14
+  return var1 + var2
+
+
+def _trunc_div_3125( numerator, divisor ):
+  # int( numerator * 3125 / divisor ) without overflowing int64: the quotient is truncated toward zero, which is
+  # what the scalar path's correctly rounded division followed by int() gives for these magnitudes.
+  negative = (numerator < 0) != (divisor < 0)
+  numerator = numpy.abs( numerator )
+  divisor = numpy.abs( divisor )
+  quotient = (numerator // divisor) * 3125 + ((numerator % divisor) * 3125) // divisor
+  return numpy.where( negative, -quotient, quotient )
+
+
+def _pressure_q24_8_numpy( cal, p_raw, t_fine_value ):
+  p1, p2, p3, p4, p5, p6, p7, p8, p9 = cal[3:]
+  var1 = t_fine_value - 128000
+  var2 = var1 * var1 * p6
+  var2 = var2 + ((var1 * p5) << 17)
+  var2 = var2 + (p4 << 35)
+  var1 = ((var1 * var1 * p3) >> 8) + ((var1 * p2) << 12)
+  # (((1 << 47) + var1) * P1) >> 33, split on the low 16 bits so the product fits in int64.
+  x = (1 << 47) + var1
+  var1 = ((x >> 16) * p1 + (((x & 0xFFFF) * p1) >> 16)) >> 17
+
+  invalid = var1 == 0
+  var1 = numpy.where( invalid, 1, var1 )
+  p = 1048576 - p_raw
+  p = _trunc_div_3125( (p << 31) - var2, var1 )
+  var1 = (p9 * (p >> 13) * (p >> 13)) >> 25
+  var2 = (p8 * p) >> 19
+  p = ((p + var1 + var2) >> 8) + (p7 << 4)
+  return numpy.where( invalid, 0, p )
+
+
+def _pressure_int32_numpy( cal, p_raw, t_fine_value ):
+  p1, p2, p3, p4, p5, p6, p7, p8, p9 = cal[3:]
+  var1 = (t_fine_value >> 1) - 64000
+  var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * p6
+  var2 = var2 + ((var1 * p5) << 1)
+  var2 = (var2 >> 2) + (p4 << 16)
+  var1 = (((p3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3) + ((p2 * var1) >> 1)) >> 18
+  var1 = ((32768 + var1) * p1) >> 15
+
+  invalid = var1 == 0
+  var1 = numpy.where( invalid, 1, var1 )
+  p = (1048576 - p_raw) - (var2 >> 12)
+  p = numpy.where( p < 687195, (p * 6250) // var1, ((p * 3125) // var1) << 1 )
+  var1 = (p9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+  var2 = ((p >> 2) * p8) >> 13
+  p = p + ((var1 + var2 + p7) >> 4)
+  return numpy.where( invalid, 0, p )
+
+
+def _pressure_float_numpy( cal, p_raw, t_fine_value ):
+  p1, p2, p3, p4, p5, p6, p7, p8, p9 = cal[3:]
+  var1 = t_fine_value / 2.0 - 64000.0
+  var2 = var1 * var1 * p6 / 32768.0
+  var2 = var2 + var1 * p5 * 2.0
+  var2 = var2 / 4.0 + p4 * 65536.0
+  var1 = (p3 * var1 * var1 / 524288.0 + p2 * var1) / 524288.0
+  var1 = (1.0 + var1 / 32768.0) * p1
+
+  invalid = var1 == 0
+  var1 = numpy.where( invalid, 1.0, var1 )
+  p = 1048576.0 - p_raw
+  p = (p - var2 / 4096.0) * 6250.0 / var1
+  var1 = p9 * p * p / 2147483648.0
+  var2 = p * p8 / 32768.0
+  p = p + (var1 + var2 + p7) / 16.0
+  return numpy.where( invalid, 0.0, p )
+
+
+def _compensate_numpy( cal, t_raw, p_raw, compensation ):
+  t_raw = numpy.asarray( t_raw, dtype = numpy.int64 )
+  p_raw = numpy.asarray( p_raw, dtype = numpy.int64 )
+  t_fine_value = _t_fine_numpy( cal, t_raw )
+  if compensation == COMPENSATION_FLOAT:
+    temperatures = t_fine_value / 5120.0
+  else:
+    temperatures = ((t_fine_value * 5 + 128) >> 8) / 100.
+  if compensation == COMPENSATION_INT32:
+    pressures = _pressure_int32_numpy( cal, p_raw, t_fine_value ).astype( numpy.float64 )
+  elif compensation == COMPENSATION_FLOAT:
+    pressures = _pressure_float_numpy( cal, p_raw, t_fine_value )
+  else:
+    pressures = _pressure_q24_8_numpy( cal, p_raw, t_fine_value ) / 256.0
+  return temperatures, pressures
@@ -0,0 +1,158 @@
+"""
+BMP280 compensation formulas from the Bosch datasheet (BST-BMP280-DS001), section 3.11.3 and 8.
+
+Three pressure engines are provided:
+  pressure_q24_8()   The 64-bit integer formula, returning Pa in Q24.8 (divide by 256).  Its intermediates
+                     (1 << 47, << 35, << 31) are big integers, which MicroPython heap-allocates on every call.
+  pressure_int32()   The datasheet's 32-bit integer formula, returning whole Pa.  Every product is split so
+                     that no intermediate leaves MicroPython's 31-bit small-int range for temperatures of
+                     -40 to 85 C, pressures of 300 to 1100 hPa and production calibration values, so it does
+                     not allocate.  Results are bit-identical to the C reference.
+  pressure_float()   The datasheet's floating point formula.  It does not allocate on hosts or on ports with
+                     unboxed floats, but each float operation allocates on the Pico (RP2040).
+
+This module has no MicroPython-only imports, so the same code runs on the device and on the host.
+"""
+from collections import namedtuple
+
+# Compensation engines.  BMP280_uPython_Library exposes the same values as BMP280_COMPENSATION_*.
+COMPENSATION_INT64 = 0
+COMPENSATION_INT32 = 1
+COMPENSATION_FLOAT = 2
+
+# The twelve calibration coefficients stored in registers 0x88 - 0x9F.
+Calibration = namedtuple( 'Calibration', ('T1', 'T2', 'T3', 'P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9') )
+
+# Golden values from the datasheet example (section 3.12).
+TEST_CALIBRATION = Calibration( 27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000 )
+TEST_T_RAW = 519888
+TEST_P_RAW = 415148
+
+
+def t_fine( cal, t_raw ):
+  """
+  Fine temperature value shared by the temperature and pressure formulas.
+  The products are split so the intermediates stay below 2**30 for any raw reading.
+  """
+  # var1 = (((t_raw >> 3) - (T1 << 1)) * T2) >> 11
+  a = (t_raw >> 3) - (cal.T1 << 1)
+  var1 = (a >> 11) * cal.T2 + (((a & 0x7FF) * cal.T2) >> 11)
+  # var2 = (((b * b) >> 12) * T3) >> 14, with b = (t_raw >> 4) - T1
+  b = (t_raw >> 4) - cal.T1
+  if b < 0:
+    b = -b
+  bh = b >> 6
+  bl = b & 0x3F
+  b_sq = bh * bh + ((((bh * bl) << 7) + bl * bl) >> 12)
+  var2 = (b_sq * cal.T3) >> 14
+  return var1 + var2
+
+
+def temperature_centi( t_fine_value ):
+  """
+  Temperature in hundredths of a degree Celsius.
+  """
+  return (t_fine_value * 5 + 128) >> 8
+
+
+def pressure_q24_8( cal, p_raw, t_fine_value ):
+  """
+  64-bit integer pressure formula (datasheet page 22).
+  :return: the pressure in Pa as a Q24.8 fixed point number, or 0 if the calibration is invalid.
+  """
+  var1 = t_fine_value - 128000
+  var2 = var1 * var1 * cal.P6
+  var2 = var2 + ((var1 * cal.P5) << 17)
+  var2 = var2 + (cal.P4 << 35)
+  var1 = ((var1 * var1 * cal.P3) >> 8) + ((var1 * cal.P2) << 12)
+  var1 = (((1 << 47) + var1) * cal.P1) >> 33
+
+  if var1 == 0:
+    return 0
+
+  p = 1048576 - p_raw
+  p = int( (((p << 31) - var2) * 3125) / var1 )
+  var1 = (cal.P9 * (p >> 13) * (p >> 13)) >> 25
+  var2 = (cal.P8 * p) >> 19
+
+  return ((p + var1 + var2) >> 8) + (cal.P7 << 4)
+
+
+def pressure_int32( cal, p_raw, t_fine_value ):
+  """
+  32-bit integer pressure formula (datasheet section 8.2).
+  :return: the pressure in whole Pa, or 0 if the calibration is invalid.
+  """
+  var1 = (t_fine_value >> 1) - 64000
+  # (((var1 >> 2) * (var1 >> 2)) >> 11), computed from 6-bit halves of |var1 >> 2|.
+  a = var1 >> 2
+  if a < 0:
+    a = -a
+  ah = a >> 6
+  al = a & 0x3F
+  a_sq = ((ah * ah) << 1) + ((((ah * al) << 7) + al * al) >> 11)
+  var2 = a_sq * cal.P6
+  var2 = var2 + ((var1 * cal.P5) << 1)
+  var2 = (var2 >> 2) + (cal.P4 << 16)
+  # ((P2 * var1) >> 1), split on the lowest bit of var1.
+  p2_term = (var1 >> 1) * cal.P2 + (((var1 & 1) * cal.P2) >> 1)
+  var1 = (((cal.P3 * (a_sq >> 2)) >> 3) + p2_term) >> 18
+  # (((32768 + var1) * P1) >> 15), split on the low byte of (32768 + var1).
+  x = 32768 + var1
+  var1 = ((x >> 8) * cal.P1 + (((x & 0xFF) * cal.P1) >> 8)) >> 7
+
+  if var1 == 0:
+    return 0
+
+  # p * 3125 overflows 31 bits, so the multiply and divide are done as quotient and remainder.
+  p = (1048576 - p_raw) - (var2 >> 12)
+  if p < 687195:
+    # p * 3125 < 0x80000000: p = (p * 6250) / var1
+    p = (p // var1) * 6250 + ((p % var1) * 6250) // var1
+  else:
+    p = ((p // var1) * 3125 + ((p % var1) * 3125) // var1) << 1
+  var1 = (cal.P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+  var2 = ((p >> 2) * cal.P8) >> 13
+  return p + ((var1 + var2 + cal.P7) >> 4)
+
+
+def pressure_float( cal, p_raw, t_fine_value ):
+  """
+  Floating point pressure formula (datasheet section 8.1).
+  :return: the pressure in Pa, or 0 if the calibration is invalid.
+  """
+  var1 = t_fine_value / 2.0 - 64000.0
+  var2 = var1 * var1 * cal.P6 / 32768.0
+  var2 = var2 + var1 * cal.P5 * 2.0
+  var2 = var2 / 4.0 + cal.P4 * 65536.0
+  var1 = (cal.P3 * var1 * var1 / 524288.0 + cal.P2 * var1) / 524288.0
+  var1 = (1.0 + var1 / 32768.0) * cal.P1
+
+  if var1 == 0:
+    return 0
+
+  p = 1048576.0 - p_raw
+  p = (p - var2 / 4096.0) * 6250.0 / var1
+  var1 = cal.P9 * p * p / 2147483648.0
+  var2 = p * cal.P8 / 32768.0
+  return p + (var1 + var2 + cal.P7) / 16.0
+
+
+def temperature_c( t_fine_value, compensation = COMPENSATION_INT64 ):
+  """
+  Temperature in degrees Celsius, as reported by BMP280.temperature for the given engine.
+  """
+  if compensation == COMPENSATION_FLOAT:
+    return t_fine_value / 5120.0
+  return temperature_centi( t_fine_value ) / 100.
+
+
+def pressure_pa( cal, p_raw, t_fine_value, compensation = COMPENSATION_INT64 ):
+  """
+  Pressure in Pa, as reported by BMP280.pressure for the given engine.
+  """
+  if compensation == COMPENSATION_INT32:
+    return float( pressure_int32( cal, p_raw, t_fine_value ) )
+  if compensation == COMPENSATION_FLOAT:
+    return pressure_float( cal, p_raw, t_fine_value )
+  return pressure_q24_8( cal, p_raw, t_fine_value ) / 256.0
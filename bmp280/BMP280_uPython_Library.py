@@ -1,5 +1,12 @@
+import os
+
 from micropython import const
+from ucollections import namedtuple
 from ustruct import unpack as unp
+from utime import ticks_ms, ticks_add, ticks_diff
+
+from bmp280.BMP280_Compensation import Calibration, TEST_CALIBRATION, TEST_T_RAW, TEST_P_RAW
+from bmp280.BMP280_Compensation import t_fine, temperature_centi, temperature_c, pressure_int32, pressure_pa
 
 # Author David Stenwall Wahlund (david at dafnet.se)
 
@@ -59,6 +66,11 @@ _BMP280_OS_MATRIX = [
   [BMP280_PRES_OS_16, BMP280_TEMP_OS_2, 44]
 ]
 
+# Compensation engines, see BMP280_Compensation.py (same values as its COMPENSATION_*)
+BMP280_COMPENSATION_INT64 = const( 0 )
+BMP280_COMPENSATION_INT32 = const( 1 )
+BMP280_COMPENSATION_FLOAT = const( 2 )
+
 # Use cases
 BMP280_CASE_HANDHELD_LOW = const( 0 )
 BMP280_CASE_HANDHELD_DYN = const( 1 )
@@ -76,6 +88,9 @@ _BMP280_CASE_MATRIX = [
   [BMP280_POWER_NORMAL, BMP280_OS_ULTRAHIGH, BMP280_IIR_FILTER_16, BMP280_STANDBY_0_5]
 ]
 
+# Setting names accepted by BMP280.configure(), in the order they are applied.
+_BMP280_SETTINGS = ('oversample', 'temp_os', 'press_os', 'power_mode', 'standby', 'iir', 'spi3w')
+
 _BMP280_REGISTER_ID = const( 0xD0 )
 _BMP280_REGISTER_RESET = const( 0xE0 )
 _BMP280_REGISTER_STATUS = const( 0xF3 )
@@ -83,10 +98,16 @@ _BMP280_REGISTER_CONTROL = const( 0xF4 )
 _BMP280_REGISTER_CONFIG = const( 0xF5 )  # IIR filter config
 
 _BMP280_REGISTER_DATA = const( 0xF7 )
+_BMP280_REGISTER_CALIBRATION = const( 0x88 )
+_BMP280_CALIBRATION_SIZE = const( 24 )
+
+# Result of BMP280.measure(): temperature in degrees Celsius and pressure in Pa, both from the same conversion.
+BMP280Measurement = namedtuple( 'BMP280Measurement', ('temperature', 'pressure') )
 
 
 class BMP280:
-  def __init__( self, i2c_bus, addr = 0x76, use_case = BMP280_CASE_HANDHELD_DYN ):
+  def __init__( self, i2c_bus, addr = 0x76, use_case = BMP280_CASE_HANDHELD_DYN, calibration_cache = None,
+                compensation = BMP280_COMPENSATION_INT64, max_age_ms = 0 ):
     self._bmp_i2c = i2c_bus
     self._i2c_addr = addr
 
@@ -94,32 +115,46 @@ class BMP280:
     # < little-endian
     # H unsigned short
     # h signed short
-    self._T1 = unp( '<H', self._read( 0x88, 2 ) )[0]
-    self._T2 = unp( '<h', self._read( 0x8A, 2 ) )[0]
-    self._T3 = unp( '<h', self._read( 0x8C, 2 ) )[0]
-    self._P1 = unp( '<H', self._read( 0x8E, 2 ) )[0]
-    self._P2 = unp( '<h', self._read( 0x90, 2 ) )[0]
-    self._P3 = unp( '<h', self._read( 0x92, 2 ) )[0]
-    self._P4 = unp( '<h', self._read( 0x94, 2 ) )[0]
-    self._P5 = unp( '<h', self._read( 0x96, 2 ) )[0]
-    self._P6 = unp( '<h', self._read( 0x98, 2 ) )[0]
-    self._P7 = unp( '<h', self._read( 0x9A, 2 ) )[0]
-    self._P8 = unp( '<h', self._read( 0x9C, 2 ) )[0]
-    self._P9 = unp( '<h', self._read( 0x9E, 2 ) )[0]
+    # The 24 calibration bytes (0x88 - 0x9F) are read in one burst, or taken from the flash cache if one is given
+    # and it was written for the chip that answers now.
+    self._chip_id = self._read( _BMP280_REGISTER_ID )[0]
+    cal = None
+    if calibration_cache is not None:
+      cal = self._load_calibration( calibration_cache )
+    if cal is None:
+      cal = self._read( _BMP280_REGISTER_CALIBRATION, _BMP280_CALIBRATION_SIZE )
+      if calibration_cache is not None:
+        self._save_calibration( calibration_cache, cal )
+    self._cal = Calibration( *unp( '<HhhHhhhhhhhh', cal ) )
 
     # output raw
+    # None marks a compensated value that has not been calculated yet for the current raw sample.
     self._t_raw = 0
-    self._t_fine = 0
-    self._t = 0
+    self._t_fine = None
+    self._t = None
 
     self._p_raw = 0
-    self._p = 0
+    self._p = None
 
-    self.read_wait_ms = 0  # interval between forced measure and readout
-    self._new_read_ms = 200  # interval between
-    self._last_read_ts = 0
+    self._data = bytearray( 6 )  # burst read buffer, reused so a measurement does not allocate
+    self._compensation = compensation
 
-    if use_case is None:
+    self.read_wait_ms = 0  # interval between forced measure and readout
+    self._forced_deadline = None  # ticks_ms() when a triggered forced conversion should be done
+    self._new_read_ms = max_age_ms  # samples younger than this are served from memory instead of the bus
+    self._last_read_ts = None  # ticks_ms() of the last burst read
+    self.cache_hits = 0
+    self.cache_misses = 0
+
+    # RAM copies of CTRL_MEAS and CONFIG, loaded on first use.  Getters and setters work on these,
+    # and writes inside a batch (see configure() and __enter__) are deferred until the batch ends.
+    self._ctrl_meas = None
+    self._config = None
+    self._dirty_ctrl_meas = False
+    self._dirty_config = False
+    self._batch_depth = 0
+
+    if use_case is not None:
       self.use_case( use_case )
 
   def _read( self, addr, size = 1 ):
@@ -130,105 +165,261 @@ class BMP280:
       b_arr = bytearray( [b_arr] )
     return self._bmp_i2c.writeto_mem( self._i2c_addr, addr, b_arr )
 
-  def _gauge( self ):
-    # TODO limit new reads
+  def _calibration_file( self, directory ):
+    return "{}/bmp280_cal_{:02x}.bin".format( directory, self._i2c_addr )
+
+  def _load_calibration( self, directory ):
+    """
+    Return the cached calibration block for this I2C address, or None if there is no usable cache file.
+    The file holds the chip ID, the I2C address, and the 24 raw calibration bytes.  A file from a different chip
+    ID (say a BME280 swapped in at the same address) is not usable.
+    """
+    try:
+      with open( self._calibration_file( directory ), 'rb' ) as cache_file:
+        data = cache_file.read()
+    except OSError:
+      return None
+    if len( data ) != _BMP280_CALIBRATION_SIZE + 2 or data[0] != self._chip_id or data[1] != self._i2c_addr:
+      return None
+    return data[2:]
+
+  def _save_calibration( self, directory, cal ):
+    try:
+      with open( self._calibration_file( directory ), 'wb' ) as cache_file:
+        cache_file.write( bytes( [self._chip_id, self._i2c_addr] ) )
+        cache_file.write( cal )
+    except OSError:
+      pass
+
+  def clear_calibration_cache( self, directory ):
+    try:
+      os.remove( self._calibration_file( directory ) )
+    except OSError:
+      pass
+
+  def _gauge( self, force = False ):
+    # Reuse the last sample while it is younger than max_age_ms, so several consumers share one bus read.
+    now = ticks_ms()
+    if not force and self._last_read_ts is not None and ticks_diff( now, self._last_read_ts ) < self._new_read_ms:
+      self.cache_hits += 1
+      return
+    self.cache_misses += 1
+    self._last_read_ts = now
+
     # read all data at once (as by spec)
-    d = self._read( _BMP280_REGISTER_DATA, 6 )
+    d = self._data
+    self._bmp_i2c.readfrom_mem_into( self._i2c_addr, _BMP280_REGISTER_DATA, d )
 
     self._p_raw = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
     self._t_raw = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
 
-    self._t_fine = 0
-    self._t = 0
-    self._p = 0
+    self._t_fine = None
+    self._t = None
+    self._p = None
 
   def reset( self ):
     self._write( _BMP280_REGISTER_RESET, 0xB6 )
+    # Both configuration registers return to their 0x00 reset value.
+    self._ctrl_meas = 0
+    self._config = 0
+    self._dirty_ctrl_meas = False
+    self._dirty_config = False
+    self._update_read_wait()
 
   def load_test_calibration( self ):
-    self._T1 = 27504
-    self._T2 = 26435
-    self._T3 = -1000
-    self._P1 = 36477
-    self._P2 = -10685
-    self._P3 = 3024
-    self._P4 = 2855
-    self._P5 = 140
-    self._P6 = -7
-    self._P7 = 15500
-    self._P8 = -14600
-    self._P9 = 6000
+    self._cal = TEST_CALIBRATION
 
   def load_test_data( self ):
-    self._t_raw = 519888
-    self._p_raw = 415148
+    self._t_raw = TEST_T_RAW
+    self._p_raw = TEST_P_RAW
+    self._t_fine = None
+    self._t = None
+    self._p = None
 
   def print_calibration( self ):
-    print( "T1: {} {}".format( self._T1, type( self._T1 ) ) )
-    print( "T2: {} {}".format( self._T2, type( self._T2 ) ) )
-    print( "T3: {} {}".format( self._T3, type( self._T3 ) ) )
-    print( "P1: {} {}".format( self._P1, type( self._P1 ) ) )
-    print( "P2: {} {}".format( self._P2, type( self._P2 ) ) )
-    print( "P3: {} {}".format( self._P3, type( self._P3 ) ) )
-    print( "P4: {} {}".format( self._P4, type( self._P4 ) ) )
-    print( "P5: {} {}".format( self._P5, type( self._P5 ) ) )
-    print( "P6: {} {}".format( self._P6, type( self._P6 ) ) )
-    print( "P7: {} {}".format( self._P7, type( self._P7 ) ) )
-    print( "P8: {} {}".format( self._P8, type( self._P8 ) ) )
-    print( "P9: {} {}".format( self._P9, type( self._P9 ) ) )
+    print( "T1: {} {}".format( self._cal.T1, type( self._cal.T1 ) ) )
+    print( "T2: {} {}".format( self._cal.T2, type( self._cal.T2 ) ) )
+    print( "T3: {} {}".format( self._cal.T3, type( self._cal.T3 ) ) )
+    print( "P1: {} {}".format( self._cal.P1, type( self._cal.P1 ) ) )
+    print( "P2: {} {}".format( self._cal.P2, type( self._cal.P2 ) ) )
+    print( "P3: {} {}".format( self._cal.P3, type( self._cal.P3 ) ) )
+    print( "P4: {} {}".format( self._cal.P4, type( self._cal.P4 ) ) )
+    print( "P5: {} {}".format( self._cal.P5, type( self._cal.P5 ) ) )
+    print( "P6: {} {}".format( self._cal.P6, type( self._cal.P6 ) ) )
+    print( "P7: {} {}".format( self._cal.P7, type( self._cal.P7 ) ) )
+    print( "P8: {} {}".format( self._cal.P8, type( self._cal.P8 ) ) )
+    print( "P9: {} {}".format( self._cal.P9, type( self._cal.P9 ) ) )
+
+  @property
+  def max_age_ms( self ):
+    return self._new_read_ms
+
+  @max_age_ms.setter
+  def max_age_ms( self, v ):
+    assert v >= 0
+    self._new_read_ms = v
+
+  def invalidate( self ):
+    """
+    Force the next reading to come from the bus, whatever max_age_ms is.
+    """
+    self._last_read_ts = None
+
+  @property
+  def compensation( self ):
+    return self._compensation
+
+  @compensation.setter
+  def compensation( self, engine ):
+    assert 0 <= engine <= 2
+    self._compensation = engine
+    self._t = None
+    self._p = None
 
   def _calc_t_fine( self ):
     # From datasheet page 22
-    self._gauge()
-    if self._t_fine == 0:
-      var1 = (((self._t_raw >> 3) - (self._T1 << 1)) * self._T2) >> 11
-      var2 = (((((self._t_raw >> 4) - self._T1)
-                * ((self._t_raw >> 4)
-                   - self._T1)) >> 12)
-              * self._T3) >> 14
-      self._t_fine = var1 + var2
+    if self._t_fine is None:
+      self._t_fine = t_fine( self._cal, self._t_raw )
 
-  @property
-  def temperature( self ):
+  def _compensate_temperature( self ):
+    # Compensates the current raw sample without touching the bus.
     self._calc_t_fine()
-    if self._t == 0:
-      self._t = ((self._t_fine * 5 + 128) >> 8) / 100.
+    if self._t is None:
+      self._t = temperature_c( self._t_fine, self._compensation )
     return self._t
 
+  def _compensate_pressure( self ):
+    # Compensates the current raw sample without touching the bus.
+    self._calc_t_fine()
+    if self._p is None:
+      self._p = pressure_pa( self._cal, self._p_raw, self._t_fine, self._compensation )
+    return self._p
+
+  @property
+  def temperature( self ):
+    self._gauge()
+    return self._compensate_temperature()
+
   @property
   def pressure( self ):
-    # From datasheet page 22
+    self._gauge()
+    return self._compensate_pressure()
+
+  def measure( self ):
+    """
+    Read temperature and pressure with a single burst read, so both values come from the same conversion.
+    :return: a BMP280Measurement with the temperature in degrees Celsius and the pressure in Pa.
+    """
+    self._gauge()
+    return BMP280Measurement( self._compensate_temperature(), self._compensate_pressure() )
+
+  def measure_into( self, buf ):
+    """
+    Allocation-free reading for tight sampling loops.
+    Does one burst read and compensates it with the 32-bit integer engine, whatever the compensation setting.
+    :param buf: a preallocated array( 'i' ) with at least two elements.  buf[0] receives the temperature in
+                hundredths of a degree Celsius and buf[1] the pressure in Pa.
+    """
+    self._gauge()
     self._calc_t_fine()
-    if self._p == 0:
-      var1 = self._t_fine - 128000
-      var2 = var1 * var1 * self._P6
-      var2 = var2 + ((var1 * self._P5) << 17)
-      var2 = var2 + (self._P4 << 35)
-      var1 = ((var1 * var1 * self._P3) >> 8) + ((var1 * self._P2) << 12)
-      var1 = (((1 << 47) + var1) * self._P1) >> 33
-
-      if var1 == 0:
-        return 0
-
-      p = 1048576 - self._p_raw
-      p = int( (((p << 31) - var2) * 3125) / var1 )
-      var1 = (self._P9 * (p >> 13) * (p >> 13)) >> 25
-      var2 = (self._P8 * p) >> 19
-
-      p = ((p + var1 + var2) >> 8) + (self._P7 << 4)
-      self._p = p / 256.0
-    return self._p
+    buf[0] = temperature_centi( self._t_fine )
+    buf[1] = pressure_int32( self._cal, self._p_raw, self._t_fine )
+
+  def _load_shadow( self ):
+    # CTRL_MEAS (0xF4) and CONFIG (0xF5) are adjacent, so one read fills both shadows.
+    if self._ctrl_meas is None or self._config is None:
+      d = self._read( _BMP280_REGISTER_CONTROL, 2 )
+      if self._config is None:
+        self._config = d[1]
+      if self._ctrl_meas is None:
+        self._ctrl_meas = d[0]
+        self._update_read_wait()
+
+  def _shadow( self, address ):
+    self._load_shadow()
+    if address == _BMP280_REGISTER_CONTROL:
+      return self._ctrl_meas
+    return self._config
+
+  def _set_shadow( self, address, value ):
+    if address == _BMP280_REGISTER_CONTROL:
+      self._ctrl_meas = value
+      self._dirty_ctrl_meas = True
+      self._update_read_wait()
+    else:
+      self._config = value
+      self._dirty_config = True
+    if self._batch_depth == 0:
+      self._flush()
+
+  def _flush( self ):
+    # CONFIG goes first so the new filter and standby settings are in place before the mode changes.
+    if self._dirty_config:
+      self._write( _BMP280_REGISTER_CONFIG, self._config )
+      self._dirty_config = False
+    if self._dirty_ctrl_meas:
+      self._write( _BMP280_REGISTER_CONTROL, self._ctrl_meas )
+      self._dirty_ctrl_meas = False
+      if self._ctrl_meas & 0x03 == BMP280_POWER_FORCED:
+        # The sensor drops back to sleep on its own after a forced conversion.
+        self._ctrl_meas &= ~0x03
+
+  def _update_read_wait( self ):
+    # Maximum measurement time from datasheet section 3.8.1, rounded up to whole ms.
+    t_os = self._ctrl_meas >> 5 & 0x07
+    p_os = self._ctrl_meas >> 2 & 0x07
+    t_samples = 1 << (min( t_os, 5 ) - 1) if t_os else 0
+    p_samples = 1 << (min( p_os, 5 ) - 1) if p_os else 0
+    wait_us = 1250 + 2300 * t_samples + 2300 * p_samples
+    if p_samples:
+      wait_us += 575
+    self.read_wait_ms = (wait_us + 999) // 1000
 
   def _write_bits( self, address, value, length, shift = 0 ):
-    d = self._read( address )[0]
-    m = int( '1' * length, 2 ) << shift
+    d = self._shadow( address )
+    m = ((1 << length) - 1) << shift
     d &= ~m
     d |= m & value << shift
-    self._write( address, d )
+    self._set_shadow( address, d )
 
   def _read_bits( self, address, length, shift = 0 ):
-    d = self._read( address )[0]
-    return d >> shift & int( '1' * length, 2 )
+    if address == _BMP280_REGISTER_CONTROL or address == _BMP280_REGISTER_CONFIG:
+      d = self._shadow( address )
+    else:
+      d = self._read( address )[0]
+    return d >> shift & ((1 << length) - 1)
+
+  def __enter__( self ):
+    self._batch_depth += 1
+    return self
+
+  def __exit__( self, exc_type, exc_value, traceback ):
+    self._batch_depth -= 1
+    if self._batch_depth == 0:
+      self._flush()
+
+  def batch( self ):
+    """
+    Group several setter calls so each configuration register is written at most once:
+      with bmp.batch():
+        bmp.iir = BMP280_IIR_FILTER_2
+        bmp.standby = BMP280_STANDBY_250
+    """
+    return self
+
+  def configure( self, **settings ):
+    """
+    Apply several settings with at most one write per configuration register.
+    Accepted keywords: oversample, temp_os, press_os, power_mode, standby, iir, spi3w.
+    oversample is applied first, so explicit temp_os and press_os values override it.
+    """
+    # Checked before anything is applied, so an unknown keyword does not leave the valid ones half written.
+    for name in settings:
+      assert name in _BMP280_SETTINGS, "Unknown BMP280 setting: " + name
+    with self:
+      for name in _BMP280_SETTINGS:
+        if name in settings:
+          setattr( self, name, settings[name] )
 
   @property
   def standby( self ):
@@ -303,6 +494,51 @@ class BMP280:
   def force_measure( self ):
     self.power_mode = BMP280_POWER_FORCED
 
+  def start_forced_measure( self ):
+    """
+    Trigger a single forced-mode conversion and return immediately.
+    The sensor goes back to sleep by itself once the conversion is done.
+    :return: the expected conversion time in ms.
+    """
+    self.force_measure()
+    self._forced_deadline = ticks_add( ticks_ms(), self.read_wait_ms )
+    return self.read_wait_ms
+
+  def poll_forced_measure( self, callback = None ):
+    """
+    Check on a conversion started with start_forced_measure().
+    While the conversion is still running this returns None without reading the data registers.
+    Once it is done, the result is burst-read, passed to callback (if given), and returned.
+    :return: a BMP280Measurement, or None if the conversion is not finished yet.
+    """
+    if self._forced_deadline is None:
+      return None
+    if ticks_diff( self._forced_deadline, ticks_ms() ) > 0 or self.is_measuring:
+      return None
+    self._forced_deadline = None
+    # Always read the new conversion, even if an older sample is still inside max_age_ms.
+    self._gauge( True )
+    measurement = BMP280Measurement( self._compensate_temperature(), self._compensate_pressure() )
+    if callback is not None:
+      callback( measurement )
+    return measurement
+
+  async def measure_async( self, poll_ms = 1 ):
+    """
+    Run one forced-mode conversion under uasyncio.
+    Other tasks run while the sensor converts; the data is read once the status bit clears.
+    :param poll_ms: how often to check the status register after the expected conversion time has passed.
+    :return: a BMP280Measurement.
+    """
+    import uasyncio as asyncio
+
+    await asyncio.sleep_ms( self.start_forced_measure() )
+    while True:
+      measurement = self.poll_forced_measure()
+      if measurement is not None:
+        return measurement
+      await asyncio.sleep_ms( poll_ms )
+
   def normal_measure( self ):
     self.power_mode = BMP280_POWER_NORMAL
 
@@ -312,11 +548,27 @@ class BMP280:
   def use_case( self, uc ):
     assert 0 <= uc <= 5
     pm, oss, iir, sb = _BMP280_CASE_MATRIX[uc]
-    t_os, p_os, self.read_wait_ms = _BMP280_OS_MATRIX[oss]
-    self._write( _BMP280_REGISTER_CONFIG, (iir << 2) + (sb << 5) )
-    self._write( _BMP280_REGISTER_CONTROL, pm + (p_os << 2) + (t_os << 5) )
+    p_os, t_os, _ = _BMP280_OS_MATRIX[oss]
+    with self:
+      self._set_shadow( _BMP280_REGISTER_CONFIG, (iir << 2) + (sb << 5) )
+      self._set_shadow( _BMP280_REGISTER_CONTROL, pm + (p_os << 2) + (t_os << 5) )
 
+  @property
+  def oversample( self ):
+    """
+    The BMP280_OS_* preset matching the current temperature and pressure oversampling, or None if there is no match.
+    """
+    p_os = self.press_os
+    t_os = self.temp_os
+    for oss in range( len( _BMP280_OS_MATRIX ) ):
+      if _BMP280_OS_MATRIX[oss][0] == p_os and _BMP280_OS_MATRIX[oss][1] == t_os:
+        return oss
+    return None
+
+  @oversample.setter
   def oversample( self, oss ):
     assert 0 <= oss <= 4
-    t_os, p_os, self.read_wait_ms = _BMP280_OS_MATRIX[oss]
-    self._write_bits( _BMP280_REGISTER_CONTROL, p_os + (t_os << 3), 2 )
+    p_os, t_os, _ = _BMP280_OS_MATRIX[oss]
+    with self:
+      self.press_os = p_os
+      self.temp_os = t_os
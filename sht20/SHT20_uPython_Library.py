@@ -1,20 +1,199 @@
 import time
-from time import sleep_ms
+from time import sleep_ms, ticks_ms, ticks_add, ticks_diff
 
 from machine import Pin, I2C
+from micropython import const
 
 from Utilities_uPython import c_to_f
 
+_SHT20_TRIGGER_T_NO_HOLD = const( 0xF3 )
+_SHT20_TRIGGER_RH_NO_HOLD = const( 0xF5 )
+_SHT20_WRITE_USER_REGISTER = const( 0xE6 )
+_SHT20_READ_USER_REGISTER = const( 0xE7 )
+_SHT20_SOFT_RESET = const( 0xFE )
+
+# Measurement resolution, user register bits 7 and 0.
+SHT20_RESOLUTION_RH12_T14 = const( 0x00 )
+SHT20_RESOLUTION_RH8_T12 = const( 0x01 )
+SHT20_RESOLUTION_RH10_T13 = const( 0x80 )
+SHT20_RESOLUTION_RH11_T11 = const( 0x81 )
+_SHT20_RESOLUTION_MASK = const( 0x81 )
+
+# Maximum conversion times in ms from the datasheet: resolution -> (temperature, humidity)
+_SHT20_CONVERSION_MS = {
+  SHT20_RESOLUTION_RH12_T14: (85, 29),
+  SHT20_RESOLUTION_RH8_T12: (22, 4),
+  SHT20_RESOLUTION_RH10_T13: (43, 9),
+  SHT20_RESOLUTION_RH11_T11: (11, 15),
+}
+# How long past the conversion time a sensor that does not acknowledge the read is given before fetch() gives up.
+_SHT20_READ_MARGIN_MS = const( 20 )
+
+
+class SHT20CRCError( OSError ):
+  pass
+
+
+def sht20_crc8( data, length = 2 ):
+  """
+  CRC-8 used by the SHT20: polynomial x^8 + x^5 + x^4 + 1 (0x31), initial value 0.
+  """
+  crc = 0
+  for i in range( length ):
+    crc ^= data[i]
+    for _ in range( 8 ):
+      if crc & 0x80:
+        crc = ((crc << 1) ^ 0x31) & 0xFF
+      else:
+        crc = (crc << 1) & 0xFF
+  return crc
+
+
+class SHT20:
+  """
+  SHT20 driver using the no-hold commands, so the I2C bus stays free while the sensor converts.
+  A measurement is split into trigger_temperature() / trigger_humidity() and fetch(),
+  and the time in between can be used for other work, including other devices on the same bus.
+  """
+
+  def __init__( self, i2c_bus, addr = 0x40 ):
+    self._i2c = i2c_bus
+    self._addr = addr
+    self._buf = bytearray( 3 )
+    self._command = bytearray( 1 )
+    self._resolution = SHT20_RESOLUTION_RH12_T14  # power-on default
+    self._pending = None  # command byte of the measurement in progress
+    self._deadline = 0
+
+  def _send( self, command ):
+    self._command[0] = command
+    self._i2c.writeto( self._addr, self._command )
+
+  def _trigger( self, command ):
+    self._send( command )
+    self._pending = command
+    wait_ms = _SHT20_CONVERSION_MS[self._resolution][0 if command == _SHT20_TRIGGER_T_NO_HOLD else 1]
+    self._deadline = ticks_add( ticks_ms(), wait_ms )
+    return wait_ms
+
+  def trigger_temperature( self ):
+    """
+    Start a temperature conversion and return at once.
+    :return: the maximum conversion time in ms.
+    """
+    return self._trigger( _SHT20_TRIGGER_T_NO_HOLD )
+
+  def trigger_humidity( self ):
+    """
+    Start a humidity conversion and return at once.
+    :return: the maximum conversion time in ms.
+    """
+    return self._trigger( _SHT20_TRIGGER_RH_NO_HOLD )
+
+  def fetch( self, wait = False ):
+    """
+    Read the result of the last triggered conversion.
+    :param wait: sleep until the result is ready instead of returning None.
+    :return: degrees Celsius or % relative humidity, or None if the conversion has not finished.
+    :raise OSError: if the sensor still does not acknowledge the read _SHT20_READ_MARGIN_MS after the conversion
+      time, as when it is missing or broken.
+    """
+    assert self._pending is not None, "No SHT20 measurement was triggered"
+    while True:
+      remaining = ticks_diff( self._deadline, ticks_ms() )
+      if remaining <= 0:
+        try:
+          self._i2c.readfrom_into( self._addr, self._buf )
+          break
+        except OSError:
+          # The sensor does not acknowledge reads while it is still converting.
+          if remaining <= -_SHT20_READ_MARGIN_MS:
+            self._pending = None
+            raise
+          remaining = 1
+      if not wait:
+        return None
+      sleep_ms( remaining )
+    command = self._pending
+    self._pending = None
+    return self._convert( command )
+
+  def _convert( self, command ):
+    buf = self._buf
+    if sht20_crc8( buf ) != buf[2]:
+      raise SHT20CRCError( "SHT20 CRC mismatch" )
+    raw = ((buf[0] << 8) | buf[1]) & 0xFFFC  # the two low bits are status bits
+    # Datasheet section 6: T = -46.85 + 175.72 * S / 2^16 and RH = -6 + 125 * S / 2^16.  The driver before this one
+    # used -46.86 and / 65535, so its temperatures read about 0.01 C lower.
+    if command == _SHT20_TRIGGER_T_NO_HOLD:
+      return -46.85 + 175.72 * raw / 65536
+    return -6 + 125 * raw / 65536
+
+  async def _measure_async( self, command ):
+    import uasyncio as asyncio
+
+    await asyncio.sleep_ms( self._trigger( command ) )
+    while True:
+      value = self.fetch()
+      if value is not None:
+        return value
+      await asyncio.sleep_ms( 1 )
+
+  async def measure_temperature( self ):
+    """
+    Awaitable temperature measurement in degrees Celsius; other tasks run during the conversion.
+    """
+    return await self._measure_async( _SHT20_TRIGGER_T_NO_HOLD )
+
+  async def measure_humidity( self ):
+    """
+    Awaitable relative humidity measurement in %; other tasks run during the conversion.
+    """
+    return await self._measure_async( _SHT20_TRIGGER_RH_NO_HOLD )
+
+  @property
+  def temperature( self ):
+    self.trigger_temperature()
+    return self.fetch( wait = True )
+
+  @property
+  def humidity( self ):
+    self.trigger_humidity()
+    return self.fetch( wait = True )
+
+  def _read_user_register( self ):
+    self._send( _SHT20_READ_USER_REGISTER )
+    return self._i2c.readfrom( self._addr, 1 )[0]
+
+  @property
+  def resolution( self ):
+    self._resolution = self._read_user_register() & _SHT20_RESOLUTION_MASK
+    return self._resolution
+
+  @resolution.setter
+  def resolution( self, v ):
+    """
+    One of the SHT20_RESOLUTION_* values.  Lower resolutions convert much faster (11 ms instead of 85 ms for
+    temperature at RH11_T11).  The reserved bits of the user register are preserved, as the datasheet requires.
+    """
+    assert v in _SHT20_CONVERSION_MS
+    user_register = (self._read_user_register() & ~_SHT20_RESOLUTION_MASK) | v
+    self._i2c.writeto( self._addr, bytes( [_SHT20_WRITE_USER_REGISTER, user_register] ) )
+    self._resolution = v
+
+  def reset( self ):
+    self._send( _SHT20_SOFT_RESET )
+    self._resolution = SHT20_RESOLUTION_RH12_T14
+    self._pending = None
+    sleep_ms( 15 )
+
 
 def sht20_temperature( i2c_class_object, address ):
   """
   Obtain the temperature value of SHT20 module
   Return:Temperature
   """
-  i2c_class_object.writeto( address, b'\xf3' )  # Write byte “0xf3” to address 0x40, SHT20
-  sleep_ms( 75 )  # SHT20 measurement takes time, must wait
-  temp = i2c_class_object.readfrom( address, 2 )  # Read 2 bytes of data from the x40 address, SHT20
-  return -46.86 + 175.72 * (temp[0] * 256 + temp[1]) / 65535  # Perform temperature conversion processing on the read data T=-46.86+175.72*St/2^16
+  return SHT20( i2c_class_object, address ).temperature
 
 
 def sht20_humidity( i2c_class_object, address ):
@@ -22,10 +201,7 @@ def sht20_humidity( i2c_class_object, address ):
   Obtain the humidity value of SHT20 module
   Return:Humidity
   """
-  i2c_class_object.writeto( address, b'\xf5' )  # Write byte “0xf5” to address 0x40, SHT20
-  sleep_ms( 25 )  # SHT20 measurement takes time, must wait
-  humid = i2c_class_object.readfrom( address, 2 )  # Read 2 bytes of data from the x40 address, SHT20
-  return -6 + 125 * (humid[0] * 256 + humid[1]) / 65535  # Perform humidity conversion processing on the read data RH=-6+125*Srh/2^16
+  return SHT20( i2c_class_object, address ).humidity
 
 
 if __name__ == "__main__":
@@ -36,13 +212,14 @@ if __name__ == "__main__":
   last_sensor_poll = 0
   sensor_poll_interval = 15  # Seconds
   sht20_address = 0x40
+  sht20_object = SHT20( i2c_object, sht20_address )
 
   while True:
     if (time.time() - last_sensor_poll) > sensor_poll_interval:
       loop_count += 1
-      temp_c = sht20_temperature( i2c_object, sht20_address )
+      temp_c = sht20_object.temperature
       temp_f = c_to_f( temp_c )
-      humidity = sht20_humidity( i2c_object, sht20_address )
+      humidity = sht20_object.humidity
       print( f"SHT20 celsius: {temp_c:.2f} C" )
       print( f"SHT20 Fahrenheit: {temp_f:.2f} F" )
       print( f"SHT20 humidity: {humidity:.2f} %" )
@@ -0,0 +1,12 @@
+"""
+Host tests: the repository root, umqtt/ (where the client modules import each other as they do from /lib on the
+Pico) and the MicroPython stand-ins in benchmarks/shims go on the path.
+
+Run from the repository root:
+  python3 -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path[:0] = [ROOT, os.path.join( ROOT, "umqtt" ), os.path.join( ROOT, "benchmarks", "shims" )]
@@ -0,0 +1,45 @@
+import asyncio
+
+from benchmarks.mqtt_broker import Broker
+from umqtt.aio import MQTTClient
+
+TIMEOUT_S = 5
+
+
+async def wait_until( condition ):
+  for _ in range( TIMEOUT_S * 100 ):
+    if condition():
+      return
+    await asyncio.sleep( 0.01 )
+  raise AssertionError( "timed out" )
+
+
+def test_connection_dropped_while_sending_puback():
+  async def main():
+    broker = Broker()
+    client = MQTTClient( "aio", "127.0.0.1", port = broker.port, keepalive = 0 )
+    client.MIN_RECONNECT_MS = 50
+    await client.connect()
+    await client.subscribe( "t/x", 1 )
+
+    # The connection drops just as the client acknowledges the QoS 1 message the broker forwards to it.
+    writer = client._writer
+    write = writer.write
+
+    def write_and_drop( data ):
+      if data[:1] == b"\x40":
+        writer.transport.abort()
+      write( data )
+
+    writer.write = write_and_drop
+    await client.publish( "t/x", "one", qos = 1 )
+    await wait_until( lambda: client.reconnects == 1 and client.connected )
+
+    # The subscription was restored on the new connection.
+    await client.publish( "t/x", "two", qos = 1 )
+    topic, msg = await asyncio.wait_for( client.__anext__(), TIMEOUT_S )
+    assert (topic, msg) == (b"t/x", b"two")
+    await client.disconnect()
+    broker.close()
+
+  asyncio.run( main() )
@@ -0,0 +1,38 @@
+import select
+
+import pytest
+import robust
+import simple
+import utime
+from benchmarks.mqtt_broker import Broker
+
+MESSAGES = 20000
+# The client's clock runs this much faster, so a keepalive of 1 s (a PINGREQ due after 500 ms without sending)
+# comes due many times while the broker floods it.
+SPEEDUP = 100
+
+
+@pytest.mark.parametrize( "cls", (simple.MQTTClient, robust.MQTTClient) )
+def test_pings_while_every_check_msg_reads_a_message( cls, monkeypatch ):
+  monkeypatch.setattr( simple, "ticks_ms", lambda: utime.ticks_ms() * SPEEDUP )
+  broker = Broker()
+  received = [0]
+
+  def count( topic, msg ):
+    received[0] += 1
+
+  client = cls( "sub", "127.0.0.1", port = broker.port, keepalive = 1, ping_timeout_ms = 10 ** 9 )
+  client.set_callback( count )
+  client.connect()
+  client.subscribe( "telemetry" )
+  broker.flood( "telemetry", b"21.5", MESSAGES )
+  empty = 0
+  while received[0] < MESSAGES:
+    # Wait for data first, so that every check_msg() has a packet to read.
+    select.select( [client.sock._sock], [], [], 5 )
+    if client.check_msg() is None:
+      empty += 1
+  client.disconnect()
+  broker.close()
+  assert broker.pings >= 1
+  assert empty <= broker.pings  # check_msg() returns None for a PINGRESP; every other call read a message
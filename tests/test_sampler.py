@@ -0,0 +1,74 @@
+import random
+import time
+from array import array
+
+import pytest
+from Sampler_uPython import RingBuffer, Sampler
+
+
+def contents( buffer, count = None ):
+  older, newer = buffer.window( count )
+  return list( older ) + list( newer )
+
+
+def brute_force( values ):
+  mean = sum( values ) / len( values )
+  return mean, sum( (v - mean) ** 2 for v in values ) / len( values ), min( values ), max( values )
+
+
+@pytest.mark.parametrize( "length", (1, 2, 7, 60) )
+@pytest.mark.parametrize( "typecode", ('f', 'd', 'i') )
+def test_ring_buffer_matches_brute_force( length, typecode ):
+  rng = random.Random( length )
+  buffer = RingBuffer( length, typecode )
+  stored = array( typecode )  # each sample as the buffer's array rounds it
+  for n in range( 5 * length + 3 ):
+    if typecode == 'i':
+      value = rng.randrange( -1000, 1000 )
+    else:
+      # Pressure-like values in Pa, with runs of equal samples to exercise ties in min and max.
+      value = 100000 + rng.choice( (0.0, rng.gauss( 0, 50 )) )
+    buffer.append( value )
+    stored.append( value )
+    recent = list( stored[-length:] )
+    mean, variance, low, high = brute_force( recent )
+    assert len( buffer ) == len( recent )
+    assert buffer.latest == recent[-1]
+    assert buffer.mean == pytest.approx( mean, rel = 1e-9, abs = 1e-9 )
+    assert buffer.variance == pytest.approx( variance, rel = 1e-6, abs = 1e-6 )
+    assert buffer.min == low
+    assert buffer.max == high
+    assert contents( buffer ) == recent
+    assert contents( buffer, 3 ) == recent[-3:]
+
+
+def test_empty_and_cleared_buffer():
+  buffer = RingBuffer( 4 )
+  assert (buffer.latest, buffer.mean, buffer.variance, buffer.min, buffer.max) == (None,) * 5
+  for value in (1.0, 5.0, 3.0):
+    buffer.append( value )
+  buffer.clear()
+  assert len( buffer ) == 0 and buffer.mean is None
+  buffer.append( 2.0 )
+  assert (buffer.mean, buffer.variance, buffer.min, buffer.max) == (2.0, 0.0, 2.0, 2.0)
+
+
+def test_sampler_reads_from_the_timer_into_each_channel():
+  readings = iter( range( 1000 ) )
+
+  def read():
+    n = next( readings )
+    if n == 2:
+      raise OSError( 5 )
+    return n, -n
+
+  sampler = Sampler( read, length = 8, period_ms = 2, channels = 2 )
+  sampler.start()
+  deadline = time.monotonic() + 5
+  while len( sampler.buffers[0] ) < 8 and time.monotonic() < deadline:
+    time.sleep( 0.01 )
+  sampler.stop()
+  first, second = sampler.buffers
+  assert len( first ) == 8
+  assert sampler.errors == 1
+  assert contents( first ) == [-v for v in contents( second )]
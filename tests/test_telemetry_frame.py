@@ -0,0 +1,33 @@
+import pytest
+from Telemetry_Frame import FrameEncoder, MAX_OFFSET_S, decode
+
+
+def test_batch_round_trip():
+  encoder = FrameEncoder( ('pressure', 'temperature'), batch = 3 )
+  assert encoder.add( 1000, (1013.25, 21.5) ) is None
+  assert encoder.add( 1005, (1013.5, -4.25) ) is None
+  samples = decode( bytes( encoder.add( 1010, (1012.0, 0.0) ) ) )
+  assert [(s['timestamp'], s['sequence'], s['pressure'], s['temperature']) for s in samples] == [
+    (1000, 0, 1013.25, 21.5), (1005, 1, 1013.5, -4.25), (1010, 2, 1012.0, 0.0)]
+
+
+def test_sample_too_late_leaves_the_frame_intact():
+  encoder = FrameEncoder( ('temperature',), batch = 4 )
+  encoder.add( 0, (20.0,) )
+  with pytest.raises( ValueError ):
+    encoder.add( MAX_OFFSET_S + 1, (21.0,) )
+  encoder.add( MAX_OFFSET_S, (22.0,) )
+  samples = decode( bytes( encoder.flush() ) )
+  assert [(s['timestamp'], s['temperature']) for s in samples] == [(0, 20.0), (MAX_OFFSET_S, 22.0)]
+  # After a flush, the late sample starts the next frame.
+  encoder.add( MAX_OFFSET_S + 1, (21.0,) )
+  assert decode( bytes( encoder.flush() ) )[0]['timestamp'] == MAX_OFFSET_S + 1
+
+
+def test_value_out_of_range_leaves_the_frame_intact():
+  encoder = FrameEncoder( ('temperature', 'pressure'), batch = 2 )
+  with pytest.raises( ValueError ):
+    encoder.add( 5, (21.5, 3e7) )  # 3e9 once scaled
+  assert encoder.flush() is None
+  encoder.add( 5, (21.5, 1000.0) )
+  assert decode( bytes( encoder.flush() ) )[0]['pressure'] == 1000.0
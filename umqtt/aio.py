@@ -0,0 +1,438 @@
+"""
+MQTT 3.1.1 client for uasyncio (and CPython asyncio), using the same wire format as umqtt.simple.
+
+Nothing here blocks the event loop: a background task reads the connection, answers PUBACKs and PINGRESPs, and
+reconnects with backoff when the link drops, while another sends PINGREQ when the connection has been idle.
+Sensor sampling and the web server can run in the same loop:
+
+  client = MQTTClient( "pico", "broker.local", keepalive = 60 )
+  await client.connect()
+  await client.subscribe( "pico/command" )
+  await client.publish( "pico/temperature", "21.5", qos = 1 )
+  async for topic, msg in client:
+    print( topic, msg )
+
+While the connection is down, publish() and subscribe() wait for the reconnect instead of raising.  QoS 1
+publishes and subscriptions that were not acknowledged are resent once it is back, and the subscriptions are
+restored if the broker did not keep the session.
+"""
+import struct
+
+try:
+  import uasyncio as asyncio
+except ImportError:
+  import asyncio
+
+try:
+  from time import ticks_ms, ticks_diff
+except ImportError:
+  from time import monotonic
+
+
+  def ticks_ms():
+    return int( monotonic() * 1000 )
+
+
+  def ticks_diff( end, start ):
+    return end - start
+
+
+class MQTTException( Exception ):
+  pass
+
+
+def _encode( s ):
+  return s.encode() if isinstance( s, str ) else s
+
+
+def _put_len( buf, sz ):
+  while sz > 0x7F:
+    buf.append( (sz & 0x7F) | 0x80 )
+    sz >>= 7
+  buf.append( sz )
+
+
+def _put_str( buf, s ):
+  buf.extend( struct.pack( "!H", len( s ) ) )
+  buf.extend( s )
+
+
+class MQTTClient:
+  MIN_RECONNECT_MS = 500
+  MAX_RECONNECT_MS = 30000
+
+  def __init__(
+      self,
+      client_id,
+      server,
+      port = 0,
+      user = None,
+      password = None,
+      keepalive = 60,
+      ssl = None,
+      retry_ms = 10000,
+      queue_length = 16,
+      reconnect = True,
+  ):
+    """
+    :param ssl: None for plain TCP, or an SSL context (or True) passed to asyncio.open_connection().
+    :param retry_ms: resend a QoS 1 publish or a subscribe if it has not been acknowledged after this long.
+    :param queue_length: received messages kept for iteration; the oldest is dropped when it is full.
+    :param reconnect: reconnect when the connection drops.  Without it, waiting calls raise OSError instead.
+    """
+    if port == 0:
+      port = 8883 if ssl else 1883
+    self.client_id = client_id
+    self.server = server
+    self.port = port
+    self.user = user
+    self.pswd = password
+    self.keepalive = keepalive
+    self.ssl = ssl
+    self.retry_ms = retry_ms
+    self.queue_length = queue_length
+    self.reconnect = reconnect
+    self.lw_topic = None
+    self.lw_msg = None
+    self.lw_qos = 0
+    self.lw_retain = False
+    self.pid = 0
+    self.dropped = 0  # received messages dropped because the queue was full
+    self.reconnects = 0
+    self._reader = None
+    self._writer = None
+    self._tasks = []
+    self._closed = False
+    self._connected = asyncio.Event()
+    self._write_lock = asyncio.Lock()
+    self._messages = []
+    self._message_event = asyncio.Event()
+    self._waiters = { }  # packet identifier -> Event, for PUBACK and SUBACK
+    self._acks = { }  # packet identifier -> SUBACK return codes
+    self._subscriptions = { }  # topic -> qos, restored after reconnecting to a clean session
+    self._last_tx = 0
+    self._ping_sent = None
+
+  def set_last_will( self, topic, msg, retain = False, qos = 0 ):
+    assert 0 <= qos <= 2
+    assert topic
+    self.lw_topic = topic
+    self.lw_msg = msg
+    self.lw_qos = qos
+    self.lw_retain = retain
+
+  @property
+  def connected( self ):
+    return self._connected.is_set()
+
+  def _next_pid( self ):
+    pid = self.pid
+    while 1:
+      pid = pid % 65535 + 1
+      if pid not in self._waiters:
+        self.pid = pid
+        return pid
+
+  def _connect_frame( self, clean_session ):
+    client_id = _encode( self.client_id )
+    flags = clean_session << 1
+    payload = bytearray()
+    _put_str( payload, client_id )
+    if self.lw_topic:
+      flags |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
+      flags |= self.lw_retain << 5
+      _put_str( payload, _encode( self.lw_topic ) )
+      _put_str( payload, _encode( self.lw_msg ) )
+    if self.user is not None:
+      flags |= 0xC0
+      _put_str( payload, _encode( self.user ) )
+      _put_str( payload, _encode( self.pswd ) )
+    assert self.keepalive < 65536
+    frame = bytearray( b"\x10" )
+    _put_len( frame, 10 + len( payload ) )
+    frame.extend( b"\0\x04MQTT\x04" )
+    frame.append( flags )
+    frame.extend( struct.pack( "!H", self.keepalive ) )
+    frame.extend( payload )
+    return frame
+
+  def _subscribe_frame( self, pid, topic, qos ):
+    topic = _encode( topic )
+    frame = bytearray( b"\x82" )
+    _put_len( frame, 2 + 2 + len( topic ) + 1 )
+    frame.extend( struct.pack( "!H", pid ) )
+    _put_str( frame, topic )
+    frame.append( qos )
+    return frame
+
+  async def _read_len( self ):
+    n = 0
+    sh = 0
+    while 1:
+      b = (await self._reader.readexactly( 1 ))[0]
+      n |= (b & 0x7F) << sh
+      if not b & 0x80:
+        return n
+      sh += 7
+
+  async def _read_packet( self ):
+    op = (await self._reader.readexactly( 1 ))[0]
+    sz = await self._read_len()
+    data = await self._reader.readexactly( sz ) if sz else b""
+    return op, data
+
+  async def _open( self, clean_session ):
+    """
+    Open the connection and complete the CONNECT handshake.
+    :return: the CONNACK session present flag.
+    """
+    if self.ssl:
+      self._reader, self._writer = await asyncio.open_connection( self.server, self.port, ssl = self.ssl )
+    else:
+      self._reader, self._writer = await asyncio.open_connection( self.server, self.port )
+    try:
+      self._writer.write( self._connect_frame( clean_session ) )
+      await self._writer.drain()
+      op, data = await self._read_packet()
+    except (OSError, EOFError):
+      self._close_stream()
+      raise
+    if op != 0x20 or len( data ) != 2:
+      self._close_stream()
+      raise MQTTException( op )
+    if data[1] != 0:
+      self._close_stream()
+      raise MQTTException( data[1] )
+    self._last_tx = ticks_ms()
+    self._ping_sent = None
+    return data[0] & 1
+
+  def _close_stream( self ):
+    if self._writer is not None:
+      try:
+        self._writer.close()
+      except OSError:
+        pass
+      self._writer = None
+
+  async def connect( self, clean_session = True ):
+    """
+    Connect and start the background tasks.
+    :return: the CONNACK session present flag.
+    """
+    self._closed = False
+    session_present = await self._open( clean_session )
+    self._connected.set()
+    self._tasks = [asyncio.create_task( self._run() ), asyncio.create_task( self._keepalive_loop() )]
+    return session_present
+
+  async def disconnect( self ):
+    self._closed = True
+    if self._connected.is_set():
+      try:
+        async with self._write_lock:
+          self._writer.write( b"\xe0\0" )
+          await self._writer.drain()
+      except OSError:
+        pass
+    self._connected.clear()
+    for task in self._tasks:
+      task.cancel()
+    self._tasks = []
+    self._close_stream()
+    self._wake_waiters()
+    self._message_event.set()
+
+  async def _send( self, frame ):
+    """
+    Write one packet, waiting for the connection if it is down.
+    """
+    while 1:
+      if self._closed:
+        raise OSError( -1 )
+      await self._connected.wait()
+      try:
+        async with self._write_lock:
+          self._writer.write( frame )
+          await self._writer.drain()
+        self._last_tx = ticks_ms()
+        return
+      except OSError:
+        self._lost()
+
+  async def _write_now( self, frame ):
+    """
+    Write one packet on the current connection, for the reader task: it cannot wait for the reconnect like _send(),
+    as it is the task that makes it.
+    :raise OSError: if the connection is down or the write fails.
+    """
+    async with self._write_lock:
+      if self._writer is None:
+        raise OSError( -1 )
+      self._writer.write( frame )
+      await self._writer.drain()
+    self._last_tx = ticks_ms()
+
+  def _lost( self ):
+    """
+    The connection failed: close it so the reader task notices and reconnects.
+    """
+    self._connected.clear()
+    self._close_stream()
+
+  def _wake_waiters( self ):
+    # Waiters that find their packet still unacknowledged resend it.
+    for event in self._waiters.values():
+      event.set()
+
+  async def _request( self, pid, frame, dup ):
+    """
+    Send a packet and wait for its acknowledgement, resending it on timeout or after a reconnect.
+    :param dup: set the DUP flag on resends (PUBLISH only).
+    """
+    event = asyncio.Event()
+    self._waiters[pid] = event
+    try:
+      while 1:
+        await self._send( frame )
+        try:
+          await asyncio.wait_for( event.wait(), self.retry_ms / 1000 )
+        except asyncio.TimeoutError:
+          pass
+        if pid not in self._waiters:
+          return self._acks.pop( pid, None )
+        if self._closed:
+          raise OSError( -1 )
+        event.clear()
+        if dup:
+          frame[0] |= 0x08
+    finally:
+      self._waiters.pop( pid, None )
+
+  async def publish( self, topic, msg, retain = False, qos = 0 ):
+    """
+    Publish a message.  With qos = 1, return once the broker has acknowledged it.
+    """
+    assert 0 <= qos <= 1
+    topic = _encode( topic )
+    msg = _encode( msg )
+    sz = 2 + len( topic ) + len( msg ) + (2 if qos else 0)
+    assert sz < 2097152
+    frame = bytearray( (0x30 | qos << 1 | retain,) )
+    _put_len( frame, sz )
+    _put_str( frame, topic )
+    if qos:
+      pid = self._next_pid()
+      frame.extend( struct.pack( "!H", pid ) )
+      frame.extend( msg )
+      await self._request( pid, frame, True )
+    else:
+      frame.extend( msg )
+      await self._send( frame )
+
+  async def subscribe( self, topic, qos = 0 ):
+    """
+    Subscribe to a topic filter.  It is restored after reconnects that do not keep the session.
+    """
+    assert 0 <= qos <= 1
+    pid = self._next_pid()
+    codes = await self._request( pid, self._subscribe_frame( pid, topic, qos ), False )
+    if codes[0] == 0x80:
+      raise MQTTException( codes[0] )
+    self._subscriptions[topic] = qos
+
+  def __aiter__( self ):
+    return self
+
+  async def __anext__( self ):
+    """
+    :return: (topic, msg) as bytes, for the next message received.
+    """
+    while not self._messages:
+      if self._closed:
+        raise StopAsyncIteration
+      self._message_event.clear()
+      await self._message_event.wait()
+    return self._messages.pop( 0 )
+
+  async def _dispatch( self, op, data ):
+    kind = op & 0xF0
+    if kind == 0x30:  # PUBLISH
+      topic_len = (data[0] << 8) | data[1]
+      i = 2 + topic_len
+      topic = data[2:i]
+      if op & 6:
+        pid = data[i:i + 2]
+        i += 2
+        await self._write_now( b"\x40\x02" + pid )
+      if len( self._messages ) >= self.queue_length:
+        self._messages.pop( 0 )
+        self.dropped += 1
+      self._messages.append( (topic, data[i:]) )
+      self._message_event.set()
+    elif kind == 0x40 or kind == 0x90:  # PUBACK, SUBACK
+      pid = (data[0] << 8) | data[1]
+      if kind == 0x90 and pid in self._waiters:
+        # Only for a subscribe() waiting on it: the SUBSCRIBEs that restore subscriptions have no one to collect it.
+        self._acks[pid] = data[2:]
+      event = self._waiters.pop( pid, None )
+      if event is not None:
+        event.set()
+    elif kind == 0xD0:  # PINGRESP
+      self._ping_sent = None
+
+  async def _run( self ):
+    """
+    Read and dispatch packets; when the connection drops, reconnect with exponential backoff.
+    """
+    while 1:
+      try:
+        while 1:
+          op, data = await self._read_packet()
+          await self._dispatch( op, data )
+      except (OSError, EOFError):
+        pass
+      self._lost()
+      if self._closed or not self.reconnect:
+        self._closed = True
+        self._wake_waiters()
+        self._message_event.set()
+        return
+      delay = self.MIN_RECONNECT_MS
+      while 1:
+        try:
+          session_present = await self._open( False )
+          if not session_present and self._subscriptions:
+            # Written in one go before _connected is set, so no publish() or PINGREQ can go out between them.
+            frames = bytearray()
+            for topic, qos in self._subscriptions.items():
+              frames.extend( self._subscribe_frame( self._next_pid(), topic, qos ) )
+            await self._write_now( frames )
+          break
+        except (OSError, EOFError, MQTTException):
+          self._close_stream()
+          await asyncio.sleep( delay / 1000 )
+          delay = min( delay * 2, self.MAX_RECONNECT_MS )
+      self.reconnects += 1
+      self._connected.set()
+      self._wake_waiters()
+
+  async def _keepalive_loop( self ):
+    """
+    Send PINGREQ after keepalive / 2 seconds without traffic, and drop the connection if the PINGRESP has not
+    arrived keepalive / 2 seconds after that.
+    """
+    if not self.keepalive:
+      return
+    half_ms = self.keepalive * 500
+    while 1:
+      await asyncio.sleep( min( half_ms / 4000, 1 ) )
+      if not self._connected.is_set():
+        continue
+      now = ticks_ms()
+      if self._ping_sent is not None:
+        if ticks_diff( now, self._ping_sent ) > half_ms:
+          self._lost()
+      elif ticks_diff( now, self._last_tx ) >= half_ms:
+        self._ping_sent = now
+        await self._send( b"\xc0\0" )
@@ -1,13 +1,86 @@
+import os
+
+import urandom
+import ustruct as struct
 import utime
 import simple
 
+DROP_OLDEST = 0
+DROP_NEWEST = 1
+
+# Spilled message header: flags (retain, qos << 1), topic length, message length.
+_SPILL_HEADER = "!BHI"
+_SPILL_HEADER_SIZE = struct.calcsize( _SPILL_HEADER )
+
 
 class MQTTClient( simple.MQTTClient ):
-  DELAY = 2
+  """
+  MQTT client that survives broker outages without blocking the caller.
+
+  When the connection drops, publish() queues messages instead of waiting for the broker, and check_msg() and
+  publish() retry the connection with exponential backoff.  Once reconnected, the queue is sent in order and
+  subscriptions are restored if the broker did not keep the session.  wait_msg() and reconnect() still block
+  until the broker is back.
+  """
+  MIN_DELAY_MS = 500
+  MAX_DELAY_MS = 60000
   DEBUG = False
 
+  def __init__( self, *args, queue_length = 32, drop_policy = DROP_OLDEST, spill_file = None, spill_limit = 16384,
+                pipeline_subscriptions = False, **kwargs ):
+    """
+    Takes the umqtt.simple.MQTTClient arguments, and:
+    :param queue_length: messages held in memory while offline.
+    :param drop_policy: DROP_OLDEST or DROP_NEWEST, which message to lose when the queue is full.
+    :param spill_file: path of a flash file that takes messages once the memory queue is full, so they survive
+      longer outages.  Messages are only dropped when this is also full, and then always the newest: the oldest
+      are in the file, which is only ever appended to.
+    :param spill_limit: maximum size of spill_file in bytes.
+    :param pipeline_subscriptions: on reconnect, send the subscriptions right behind the CONNECT instead of
+      waiting for the CONNACK to see whether the broker kept them.  Saves a round trip, but the broker resends
+      retained messages for subscriptions it already had.
+    """
+    super().__init__( *args, **kwargs )
+    self.queue_length = queue_length
+    self.drop_policy = drop_policy
+    self.spill_file = spill_file
+    self.spill_limit = spill_limit
+    self.pipeline_subscriptions = pipeline_subscriptions
+    self.dropped = 0  # messages lost because the queue was full
+    self._queue = []  # (topic, msg, retain, qos), oldest first
+    self._spill_size = 0  # bytes in spill_file
+    self._spill_offset = 0  # bytes of spill_file already sent
+    self._spilled = 0  # messages in spill_file not sent yet
+    self._subscriptions = { }  # topic -> qos
+    self._online = False
+    # True while publish(), subscribe() or a reconnect waits in wait_msg(): errors go back to them.
+    self._nested = False
+    self._attempt = 0
+    self._retry_at = utime.ticks_ms()
+    if spill_file is not None:
+      self._load_spill()
+
+  @property
+  def online( self ):
+    return self._online
+
+  @property
+  def queued( self ):
+    """
+    Messages waiting to be sent, in memory and in the spill file.
+    """
+    return len( self._queue ) + self._spilled
+
+  def backoff_ms( self, attempt ):
+    """
+    Delay before reconnect attempt number attempt (from 1): doubling from MIN_DELAY_MS up to MAX_DELAY_MS, of
+    which the second half is random so that devices cut off together do not all retry together.
+    """
+    delay = min( self.MAX_DELAY_MS, self.MIN_DELAY_MS << min( attempt - 1, 16 ) )
+    return delay // 2 + urandom.getrandbits( 16 ) % (delay // 2 + 1)
+
   def delay( self, i ):
-    utime.sleep( self.DELAY )
+    utime.sleep_ms( self.backoff_ms( i ) )
 
   def log( self, in_reconnect, e ):
     if self.DEBUG:
@@ -16,38 +89,244 @@ class MQTTClient( simple.MQTTClient ):
       else:
         print( "mqtt: %r" % e )
 
-  def reconnect( self ):
-    i = 0
-    while 1:
+  def connect( self, clean_session = True, subscriptions = None ):
+    session_present = super().connect( clean_session, subscriptions )
+    self._online = True
+    self._attempt = 0
+    if not self._nested:
+      # Send what is left from before, such as messages spilled by an earlier run.  try_reconnect() does this itself
+      # once the subscriptions are restored.
+      self._drain()
+    return session_present
+
+  def _went_offline( self, e ):
+    self.log( False, e )
+    self._online = False
+    try:
+      self.sock.close()
+    except (OSError, AttributeError):
+      pass
+    self._retry_at = utime.ticks_ms()
+
+  def try_reconnect( self ):
+    """
+    Make one reconnect attempt if the backoff delay has passed, then send what was queued meanwhile.
+    This only blocks for the connection attempt itself.
+    :return: True if online.
+    """
+    if self._online:
+      return True
+    if utime.ticks_diff( utime.ticks_ms(), self._retry_at ) < 0:
+      return False
+    self._nested = True
+    try:
+      subscriptions = list( self._subscriptions.items() )
+      if self.pipeline_subscriptions and subscriptions:
+        self.connect( False, subscriptions )
+      elif not self.connect( False ) and subscriptions:
+        super().subscribe_many( subscriptions )
+    except (OSError, simple.MQTTException) as e:
+      if isinstance( e, simple.MQTTException ) and e.args[0] == 0x80:
+        raise  # a subscription the broker refused: trying again would not change that
+      # A refused CONNECT, such as 3 (server unavailable) while the broker restarts, is retried like a lost link.
+      self.log( True, e )
+      self._online = False
       try:
-        return super().connect( False )
-      except OSError as e:
-        self.log( True, e )
-        i += 1
-        self.delay( i )
+        self.sock.close()
+      except (OSError, AttributeError):
+        pass
+      self._attempt += 1
+      self._retry_at = utime.ticks_add( utime.ticks_ms(), self.backoff_ms( self._attempt ) )
+      return False
+    finally:
+      self._nested = False
+    self._drain()
+    return self._online
+
+  def reconnect( self ):
+    """
+    Block until the connection is back.
+    """
+    while not self.try_reconnect():
+      wait = utime.ticks_diff( self._retry_at, utime.ticks_ms() )
+      if wait > 0:
+        utime.sleep_ms( wait )
+
+  def _enqueue( self, topic, msg, retain, qos ):
+    if not isinstance( msg, (bytes, str) ):
+      msg = bytes( msg )  # the caller may reuse its buffer
+    if len( self._queue ) < self.queue_length and not self._spilled:
+      self._queue.append( (topic, msg, retain, qos) )
+    elif self.spill_file is not None and self._spill( topic, msg, retain, qos ):
+      pass
+    elif self.drop_policy == DROP_OLDEST and self._queue and not self._spilled:
+      self._queue.pop( 0 )
+      self._queue.append( (topic, msg, retain, qos) )
+      self.dropped += 1
+    else:
+      self.dropped += 1
+
+  def _spill( self, topic, msg, retain, qos ):
+    if isinstance( topic, simple.PublishHandle ):
+      retain = topic.retain
+      qos = topic.qos
+      topic = topic.topic
+    topic = simple._encode( topic )
+    msg = simple._encode( msg )
+    size = _SPILL_HEADER_SIZE + len( topic ) + len( msg )
+    if self._spill_size + size > self.spill_limit:
+      return False
+    with open( self.spill_file, "ab" ) as f:
+      f.write( struct.pack( _SPILL_HEADER, qos << 1 | retain, len( topic ), len( msg ) ) )
+      f.write( topic )
+      f.write( msg )
+    self._spill_size += size
+    self._spilled += 1
+    return True
+
+  def _load_spill( self ):
+    """
+    Pick up messages spilled before a restart.  A file with a partly written last message is discarded.
+    """
+    try:
+      size = os.stat( self.spill_file )[6]
+    except OSError:
+      return
+    count = 0
+    offset = 0
+    with open( self.spill_file, "rb" ) as f:
+      while offset < size:
+        header = f.read( _SPILL_HEADER_SIZE )
+        if len( header ) < _SPILL_HEADER_SIZE:
+          break
+        _, topic_len, msg_len = struct.unpack( _SPILL_HEADER, header )
+        offset += _SPILL_HEADER_SIZE + topic_len + msg_len
+        f.seek( offset )
+        count += 1
+    if offset != size:
+      os.remove( self.spill_file )
+      return
+    self._spill_size = size
+    self._spilled = count
+
+  def _drain( self ):
+    """
+    Send the queue, oldest first: memory, then the spill file.  Stops, keeping the rest, if the link drops again.
+    """
+    while self._queue:
+      topic, msg, retain, qos = self._queue[0]
+      if not self._publish_online( topic, msg, retain, qos ):
+        return
+      self._queue.pop( 0 )
+    if not self._spilled:
+      return
+    with open( self.spill_file, "rb" ) as f:
+      f.seek( self._spill_offset )
+      while self._spill_offset < self._spill_size:
+        flags, topic_len, msg_len = struct.unpack( _SPILL_HEADER, f.read( _SPILL_HEADER_SIZE ) )
+        topic = f.read( topic_len )
+        msg = f.read( msg_len )
+        if not self._publish_online( topic, msg, flags & 1, flags >> 1 ):
+          return
+        self._spill_offset += _SPILL_HEADER_SIZE + topic_len + msg_len
+        self._spilled -= 1
+    os.remove( self.spill_file )
+    self._spill_size = 0
+    self._spill_offset = 0
+
+  def _publish_online( self, topic, msg, retain, qos ):
+    """
+    :return: True if the message was sent, or is in flight and will be resent after a reconnect.
+    """
+    pid = self.pid
+    self._nested = True
+    try:
+      super().publish( topic, msg, retain, qos )
+      return True
+    except OSError as e:
+      self._went_offline( e )
+      # A QoS 1 publish that got as far as the in-flight table is resent by connect().
+      return self.pid != pid and self.pid in self._inflight
+    finally:
+      self._nested = False
+
+  def _wait_inflight( self, limit ):
+    # simple.MQTTClient.check_msg(), so that a lost link raises out to _publish_online() or flush() instead of
+    # reconnecting in here, and a full window does not hold publish() up while offline: the publishes in flight
+    # are resent by connect().
+    while len( self._inflight ) > limit and self._online:
+      if simple.MQTTClient.check_msg( self ) is None:
+        utime.sleep_ms( 1 )
+
+  def flush( self ):
+    """
+    Block until every QoS 1 publish in flight has been acknowledged, or the connection drops.
+    """
+    self._nested = True
+    try:
+      super().flush()
+    except OSError as e:
+      self._went_offline( e )
+    finally:
+      self._nested = False
 
   def publish( self, topic, msg, retain = False, qos = 0 ):
-    while 1:
+    """
+    Publish now if possible, otherwise queue the message and return.
+    """
+    if self._online and (self._queue or self._spilled):
+      self._drain()
+    if self._online and not self._queue and not self._spilled:
+      if self._publish_online( topic, msg, retain, qos ):
+        return
+    self._enqueue( topic, msg, retain, qos )
+    if not self._online:
+      self.try_reconnect()
+
+  def subscribe_many( self, subscriptions ):
+    """
+    Subscribe, and remember the subscriptions to restore them after reconnecting.  While offline this only
+    remembers them.  subscribe() comes here too.
+    """
+    assert self.cb is not None, "Subscribe callback is not set"
+    for topic, qos in subscriptions:
+      self._subscriptions[topic] = qos
+    if self._online:
+      self._nested = True
       try:
-        return super().publish( topic, msg, retain, qos )
+        return super().subscribe_many( subscriptions )
       except OSError as e:
-        self.log( False, e )
-      self.reconnect()
+        self._went_offline( e )
+      finally:
+        self._nested = False
 
   def wait_msg( self ):
+    if self._nested:
+      # Waiting inside publish(), subscribe() or a reconnect: let them handle errors instead of blocking here.
+      return super().wait_msg()
     while 1:
-      try:
-        return super().wait_msg()
-      except OSError as e:
-        self.log( False, e )
+      if self._online:
+        try:
+          return super().wait_msg()
+        except OSError as e:
+          self._went_offline( e )
       self.reconnect()
 
   def check_msg( self, attempts = 2 ):
     while attempts:
+      if not self.try_reconnect():
+        return None
+      if self._queue or self._spilled:
+        self._drain()
+        if not self._online:
+          return None
       self.sock.setblocking( False )
       try:
-        return super().wait_msg()
+        op = super().wait_msg()
+        if self._inflight:
+          self._resend_expired()
+        self._keepalive()
+        return op
       except OSError as e:
-        self.log( False, e )
-      self.reconnect()
+        self._went_offline( e )
       attempts -= 1
@@ -0,0 +1,136 @@
+"""
+Dispatch received MQTT messages to handlers by topic filter, with + and # wildcards.
+
+Filters are stored in a tree with one level per topic level, so finding the handlers for a topic only walks the
+topic's levels (plus the wildcard branches on the way), however many filters are registered:
+
+  router = TopicRouter()
+  router.add( "pico/led", led_handler )
+  router.add( "pico/+/config", config_handler )
+  router.add( "pico/#", log_handler )
+  client.set_callback( router.dispatch )
+
+Handlers are called as handler( topic, msg ), with what the client passed in.
+"""
+
+
+class _Node:
+  def __init__( self ):
+    self.children = { }  # topic level (bytes) -> _Node
+    self.handlers = []
+
+
+def _levels( topic ):
+  if isinstance( topic, str ):
+    topic = topic.encode()
+  return bytes( topic ).split( b"/" )
+
+
+class TopicRouter:
+  def __init__( self ):
+    self._root = _Node()
+    self._count = 0
+
+  def __len__( self ):
+    """
+    Number of (filter, handler) registrations.
+    """
+    return self._count
+
+  def add( self, topic_filter, handler ):
+    """
+    Call handler for every message whose topic matches topic_filter.
+    :raise ValueError: if the filter is not valid MQTT (a wildcard sharing a level, or # before the last level).
+    """
+    levels = _levels( topic_filter )
+    for i, level in enumerate( levels ):
+      if (b"#" in level and (level != b"#" or i != len( levels ) - 1)) or (b"+" in level and level != b"+"):
+        raise ValueError( "invalid topic filter" )
+    node = self._root
+    for level in levels:
+      child = node.children.get( level )
+      if child is None:
+        child = node.children[level] = _Node()
+      node = child
+    node.handlers.append( handler )
+    self._count += 1
+
+  def remove( self, topic_filter, handler = None ):
+    """
+    Remove handler from topic_filter, or every handler of topic_filter if handler is None.
+    :return: the number of registrations removed.
+    """
+    path = [self._root]
+    levels = _levels( topic_filter )
+    for level in levels:
+      child = path[-1].children.get( level )
+      if child is None:
+        return 0
+      path.append( child )
+    node = path[-1]
+    before = len( node.handlers )
+    if handler is None:
+      node.handlers = []
+    else:
+      node.handlers = [h for h in node.handlers if h != handler]
+    removed = before - len( node.handlers )
+    self._count -= removed
+    # Prune the branch back to the last node that is still in use.
+    for i in range( len( levels ), 0, -1 ):
+      node = path[i]
+      if node.handlers or node.children:
+        break
+      del path[i - 1].children[levels[i - 1]]
+    return removed
+
+  def filters( self ):
+    """
+    :return: a list of the registered topic filters, as bytes, for subscribing to them.
+    """
+    found = []
+    stack = [(self._root, b"")]
+    while stack:
+      node, prefix = stack.pop()
+      if node.handlers:
+        found.append( prefix )
+      for level, child in node.children.items():
+        stack.append( (child, prefix + b"/" + level if node is not self._root else level) )
+    return found
+
+  def match( self, topic ):
+    """
+    :return: a list of the handlers whose filter matches topic.
+    """
+    found = []
+    levels = _levels( topic )
+    # Topics starting with $ (broker statistics) are not matched by a wildcard in the first level.
+    system = levels[0][:1] == b"$"
+    self._match( self._root, levels, 0, system, found )
+    return found
+
+  def _match( self, node, levels, i, system, found ):
+    children = node.children
+    wild = not (system and i == 0)
+    if wild and b"#" in children:
+      # A trailing # also matches the parent level: "a/#" matches "a".
+      found.extend( children[b"#"].handlers )
+    if i == len( levels ):
+      found.extend( node.handlers )
+      return
+    child = children.get( levels[i] )
+    if child is not None:
+      self._match( child, levels, i + 1, system, found )
+    if wild:
+      child = children.get( b"+" )
+      if child is not None:
+        self._match( child, levels, i + 1, system, found )
+
+  def dispatch( self, topic, msg ):
+    """
+    Call every handler whose filter matches topic.  Suitable as the client callback.
+    :return: the number of handlers called.
+    """
+    handlers = self.match( topic )
+    for handler in handlers:
+      handler( topic, msg )
+    return len( handlers )
@@ -1,12 +1,117 @@
+import gc
+from array import array
+
 import usocket as socket
 import ustruct as struct
+from utime import ticks_ms, ticks_add, ticks_diff, sleep_ms
 
 
 class MQTTException( Exception ):
   pass
 
 
+def _encode( s ):
+  return s.encode() if isinstance( s, str ) else s
+
+
+def _put_len( buf, i, sz ):
+  """
+  Write an MQTT remaining length varint into buf at i.
+  :return: the index after it.
+  """
+  while sz > 0x7F:
+    buf[i] = (sz & 0x7F) | 0x80
+    sz >>= 7
+    i += 1
+  buf[i] = sz
+  return i + 1
+
+
+def _put_str( buf, i, s ):
+  """
+  Write a length-prefixed MQTT string (bytes) into buf at i.
+  :return: the index after it.
+  """
+  n = len( s )
+  buf[i] = n >> 8
+  buf[i + 1] = n & 0xFF
+  buf[i + 2:i + 2 + n] = s
+  return i + 2 + n
+
+
+def _ssl_context( ssl_params ):
+  """
+  An SSL context set up as ussl.wrap_socket( sock, **ssl_params ) would set one up, or None on ports whose ssl
+  module has no SSLContext.
+  """
+  import ussl
+
+  if not hasattr( ussl, "SSLContext" ):
+    return None
+  context = ussl.SSLContext( ussl.PROTOCOL_TLS_CLIENT )
+  key = ssl_params.get( "key" )
+  cert = ssl_params.get( "cert" )
+  if cert or key:
+    context.load_cert_chain( cert, key )
+  cadata = ssl_params.get( "cadata" )
+  if cadata:
+    context.load_verify_locations( cadata = cadata )
+  cert_reqs = ssl_params.get( "cert_reqs", ussl.CERT_NONE )
+  if cert_reqs == ussl.CERT_NONE and hasattr( context, "check_hostname" ):
+    context.check_hostname = False
+  context.verify_mode = cert_reqs
+  return context
+
+
+class PublishHandle:
+  """
+  A topic encoded once, with its QoS and retain flag, for publishing to it repeatedly.
+  The handle keeps its own frame with the topic already in place, so a publish only writes the fixed header
+  (right-aligned against the topic), the packet identifier and the payload.  Create it with MQTTClient.prepare().
+  """
+
+  def __init__( self, topic, qos = 0, retain = False ):
+    assert 0 <= qos <= 1
+    self.topic = _encode( topic )
+    self.qos = qos
+    self.retain = retain
+    self._header = 0x30 | qos << 1 | retain
+    # Topic and packet identifier, the part of the remaining length that never changes.
+    self._fixed = 2 + len( self.topic ) + (2 if qos else 0)
+    # Up to 4 bytes of fixed header go in front of the topic.
+    self._frame = bytearray( 5 + self._fixed + 32 )
+    _put_str( self._frame, 5, self.topic )
+
+  def _fill( self, msg, pid, copy_msg ):
+    """
+    Complete the frame for one publish.
+    :return: (start, end) of the packet in the frame; the payload is not included when copy_msg is False.
+    """
+    buf = self._frame
+    sz = self._fixed + len( msg )
+    assert sz < 2097152
+    start = 3 if sz < 0x80 else 2 if sz < 0x4000 else 1
+    buf[start] = self._header
+    _put_len( buf, start + 1, sz )
+    end = 5 + self._fixed
+    if pid:
+      buf[end - 2] = pid >> 8
+      buf[end - 1] = pid & 0xFF
+    if copy_msg:
+      if len( buf ) < end + len( msg ):
+        buf.extend( bytearray( end + len( msg ) - len( buf ) ) )
+      buf[end:end + len( msg )] = msg
+      end += len( msg )
+    return start, end
+
+
 class MQTTClient:
+  # Payloads up to this size are copied into the frame buffer so the whole packet goes out in one write.
+  # Larger ones are written straight from the caller's buffer after the header, so the frame buffer stays small.
+  FRAME_COPY_LIMIT = 1024
+  # PINGRESP round trips kept for ping_stats()' 95th percentile.
+  PING_HISTORY = 32
+
   def __init__(
       self,
       client_id,
@@ -17,7 +122,24 @@ class MQTTClient:
       keepalive = 0,
       ssl = False,
       ssl_params = None,
+      max_inflight = 1,
+      retry_ms = 10000,
+      ping_timeout_ms = None,
   ):
+    """
+    :param ssl_params: keyword arguments of ussl.wrap_socket().  The SSL context built from them on the first
+      connect is kept in ssl_context and reused.  Where the ssl module supports sessions (CPython), reconnects
+      also offer the broker the previous TLS session so that it can skip the full handshake.  MicroPython's ssl
+      has no sessions, so on the Pico every connect makes a full handshake and only the context is reused.
+    :param max_inflight: QoS 1 publishes that may await their PUBACK at once.  With 1, publish() blocks until the
+      PUBACK arrives.  With more, publish() returns as soon as the packet is written (unless the window is full)
+      and PUBACKs are handled by check_msg() and wait_msg().
+    :param retry_ms: resend a publish with the DUP flag if its PUBACK has not arrived after this long (checked by
+      check_msg()).  Unacknowledged publishes are also resent after a reconnect.
+    :param ping_timeout_ms: with a keepalive, check_msg() sends PINGREQ once nothing has been sent for half the
+      keepalive interval, and raises OSError if the PINGRESP has not arrived this long after it.  The default is
+      half the keepalive interval.
+    """
     if ssl_params is None:
         ssl_params = dict()
     if port == 0:
@@ -28,8 +150,14 @@ class MQTTClient:
     self.port = port
     self.ssl = ssl
     self.ssl_params = ssl_params
+    self.ssl_context = None
+    self.ssl_session = None
+    # Handshake time in ms, whether the TLS session was resumed (None where ssl has no sessions, as on MicroPython)
+    # and the heap the connection holds after the handshake (None where gc cannot tell), for the last TLS connect.
+    self.ssl_stats = None
     self.pid = 0
     self.cb = None
+    self.copy_messages = False
     self.user = user
     self.pswd = password
     self.keepalive = keepalive
@@ -37,23 +165,73 @@ class MQTTClient:
     self.lw_msg = None
     self.lw_qos = 0
     self.lw_retain = False
+    self.max_inflight = max_inflight
+    self.retry_ms = retry_ms
+    self.retransmits = 0
+    # Packet identifier to [frame, ticks_ms() when sent] for QoS 1 publishes awaiting their PUBACK.
+    self._inflight = { }
+    # No publish in flight can be due for a resend before this, so check_msg() only scans _inflight from then on.
+    self._resend_at = ticks_ms()
+    self._buf = bytearray( 128 )
+    # Incoming packets are read into _rbuf and decoded in place; _byte holds single header bytes.
+    self._rbuf = bytearray( 128 )
+    self._rview = memoryview( self._rbuf )
+    self._byte = bytearray( 1 )
+    self._puback = bytearray( b"\x40\x02\0\0" )
+    self.ping_timeout_ms = ping_timeout_ms
+    self.ping_timeouts = 0
+    self._last_tx = ticks_ms()
+    self._ping_sent = None  # ticks_ms() of the outstanding PINGREQ
+    self._ping_last = None
+    self._ping_ewma = None
+    self._ping_count = 0
+    self._ping_history = array( 'H', bytes( 2 * self.PING_HISTORY ) )
+
+  def _frame( self, size ):
+    """
+    The reusable frame buffer, grown if needed so it holds at least size bytes.
+    """
+    if len( self._buf ) < size:
+      self._buf = bytearray( max( size, 2 * len( self._buf ) ) )
+    return self._buf
 
-  def _send_str( self, s ):
-    self.sock.write( struct.pack( "!H", len( s ) ) )
-    self.sock.write( s )
+  def _read_into( self, n ):
+    """
+    Read exactly n bytes into the start of the receive buffer, growing it if needed.
+    :return: the receive buffer, valid until the next read.
+    """
+    if len( self._rbuf ) < n:
+      self._rbuf = bytearray( max( n, 2 * len( self._rbuf ) ) )
+      self._rview = memoryview( self._rbuf )
+    got = self.sock.readinto( self._rbuf, n ) if n else 0
+    while got < n:
+      r = self.sock.readinto( self._rview[got:n] )
+      if not r:
+        raise OSError( -1 )
+      got += r
+    return self._rbuf
 
   def _recv_len( self ):
     n = 0
     sh = 0
+    byte = self._byte
     while 1:
-      b = self.sock.read( 1 )[0]
+      if not self.sock.readinto( byte ):
+        raise OSError( -1 )
+      b = byte[0]
       n |= (b & 0x7F) << sh
       if not b & 0x80:
         return n
       sh += 7
 
-  def set_callback( self, f ):
+  def set_callback( self, f, copy = False ):
+    """
+    :param f: called as f( topic, msg ) for each message received.
+    :param copy: by default topic and msg are memoryviews into the client's receive buffer, which is overwritten
+      by the next message.  Pass True to receive bytes instead, when the callback keeps them.
+    """
     self.cb = f
+    self.copy_messages = copy
 
   def set_last_will( self, topic, msg, retain = False, qos = 0 ):
     assert 0 <= qos <= 2
@@ -63,54 +241,93 @@ class MQTTClient:
     self.lw_qos = qos
     self.lw_retain = retain
 
-  def connect( self, clean_session = True ):
+  def connect( self, clean_session = True, subscriptions = None ):
+    """
+    :param subscriptions: optional [(topic, qos), ...] to subscribe to in the same round trip: the SUBSCRIBE is
+      sent right behind the CONNECT, without waiting for the CONNACK, as MQTT allows.
+    :return: the CONNACK session present flag.
+    """
+    if subscriptions:
+      assert self.cb is not None, "Subscribe callback is not set"
     self.sock = socket.socket()
     addr = socket.getaddrinfo( self.server, self.port )[0][-1]
     self.sock.connect( addr )
     if self.ssl:
-      import ussl
-
-      self.sock = ussl.wrap_socket( self.sock, **self.ssl_params )
-    premsg = bytearray( b"\x10\0\0\0\0\0" )
-    msg = bytearray( b"\x04MQTT\x04\x02\0\0" )
-
-    sz = 10 + 2 + len( self.client_id )
-    msg[6] = clean_session << 1
+      self.sock = self._wrap_ssl( self.sock )
+    client_id = _encode( self.client_id )
+    sz = 10 + 2 + len( client_id )
+    flags = clean_session << 1
     if self.user is not None:
-      sz += 2 + len( self.user ) + 2 + len( self.pswd )
-      msg[6] |= 0xC0
+      user = _encode( self.user )
+      pswd = _encode( self.pswd )
+      sz += 2 + len( user ) + 2 + len( pswd )
+      flags |= 0xC0
     if self.keepalive:
       assert self.keepalive < 65536
-      msg[7] |= self.keepalive >> 8
-      msg[8] |= self.keepalive & 0x00FF
     if self.lw_topic:
-      sz += 2 + len( self.lw_topic ) + 2 + len( self.lw_msg )
-      msg[6] |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
-      msg[6] |= self.lw_retain << 5
-
-    i = 1
-    while sz > 0x7F:
-      premsg[i] = (sz & 0x7F) | 0x80
-      sz >>= 7
-      i += 1
-    premsg[i] = sz
+      lw_topic = _encode( self.lw_topic )
+      lw_msg = _encode( self.lw_msg )
+      sz += 2 + len( lw_topic ) + 2 + len( lw_msg )
+      flags |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
+      flags |= self.lw_retain << 5
 
-    self.sock.write( premsg, i + 2 )
-    # self.sock.write( premsg )
-    self.sock.write( msg )
-    # print(hex(len(msg)), hexlify(msg, ":"))
-    self._send_str( self.client_id )
+    # The whole CONNECT packet (and the SUBSCRIBE behind it) is assembled in the frame buffer and sent with one
+    # write.
+    sub_sz = 0
+    if subscriptions:
+      topics, sub_sz = self._subscribe_size( subscriptions )
+    buf = self._frame( 5 + sz + 5 + sub_sz )
+    buf[0] = 0x10
+    i = _put_len( buf, 1, sz )
+    buf[i:i + 7] = b"\0\x04MQTT\x04"
+    buf[i + 7] = flags
+    buf[i + 8] = self.keepalive >> 8
+    buf[i + 9] = self.keepalive & 0x00FF
+    i = _put_str( buf, i + 10, client_id )
     if self.lw_topic:
-      self._send_str( self.lw_topic )
-      self._send_str( self.lw_msg )
+      i = _put_str( buf, i, lw_topic )
+      i = _put_str( buf, i, lw_msg )
     if self.user is not None:
-      self._send_str( self.user )
-      self._send_str( self.pswd )
-    resp = self.sock.read( 4 )
+      i = _put_str( buf, i, user )
+      i = _put_str( buf, i, pswd )
+    if subscriptions:
+      pid = self._next_pid()
+      i = self._put_subscribe( buf, i, pid, topics, sub_sz )
+    self.sock.write( buf, i )
+    self._last_tx = ticks_ms()
+    self._ping_sent = None
+    resp = self._read_into( 4 )
     assert resp[0] == 0x20 and resp[1] == 0x02
     if resp[3] != 0:
       raise MQTTException( resp[3] )
-    return resp[2] & 1
+    session_present = resp[2] & 1
+    if self.ssl:
+      # With TLS 1.3 the session ticket arrives after the handshake, so the session is taken once data has come in.
+      self.ssl_session = getattr( self.sock, "session", None )
+    self._resend_inflight()
+    if subscriptions:
+      self._wait_suback( pid, subscriptions )
+    return session_present
+
+  def _wrap_ssl( self, sock ):
+    if self.ssl_context is None:
+      self.ssl_context = _ssl_context( self.ssl_params )
+    mem_alloc = getattr( gc, "mem_alloc", None )
+    heap = mem_alloc() if mem_alloc else None
+    start = ticks_ms()
+    if self.ssl_context is None:
+      import ussl
+
+      sock = ussl.wrap_socket( sock, **self.ssl_params )
+    elif self.ssl_session is None:
+      sock = self.ssl_context.wrap_socket( sock, server_hostname = self.ssl_params.get( "server_hostname" ) )
+    else:
+      sock = self.ssl_context.wrap_socket( sock, server_hostname = self.ssl_params.get( "server_hostname" ),
+                                           session = self.ssl_session )
+    self.ssl_stats = { 'handshake_ms': ticks_diff( ticks_ms(), start ),
+                       'resumed': getattr( sock, "session_reused", None ),
+                       'heap_bytes': mem_alloc() - heap if mem_alloc else None }
+    return sock
 
   def disconnect( self ):
     self.sock.write( b"\xe0\0" )
@@ -118,94 +335,290 @@ class MQTTClient:
 
   def ping( self ):
     self.sock.write( b"\xc0\0" )
+    self._last_tx = ticks_ms()
+    if self._ping_sent is None:
+      self._ping_sent = self._last_tx
+
+  def _keepalive( self ):
+    """
+    Ping if nothing has been sent for half the keepalive interval, so the broker hears from the client in time
+    without pinging a connection that is busy anyway.  A PINGRESP that does not arrive means the link is dead.
+    """
+    if not self.keepalive:
+      return
+    now = ticks_ms()
+    if self._ping_sent is not None:
+      timeout = self.ping_timeout_ms
+      if timeout is None:
+        timeout = self.keepalive * 500
+      if ticks_diff( now, self._ping_sent ) > timeout:
+        self._ping_sent = None
+        self.ping_timeouts += 1
+        raise OSError( -1 )
+    elif ticks_diff( now, self._last_tx ) >= self.keepalive * 500:
+      self.ping()
+
+  def _pingresp( self ):
+    if self._ping_sent is None:
+      return
+    rtt = ticks_diff( ticks_ms(), self._ping_sent )
+    self._ping_sent = None
+    self._ping_last = rtt
+    # Exponentially weighted moving average with a weight of 1/8, as TCP uses for its round trip estimate.
+    self._ping_ewma = rtt if self._ping_ewma is None else self._ping_ewma + (rtt - self._ping_ewma) / 8
+    self._ping_history[self._ping_count % self.PING_HISTORY] = min( rtt, 0xFFFF )
+    self._ping_count += 1
+
+  def ping_stats( self ):
+    """
+    PINGREQ to PINGRESP round trip times in milliseconds, as seen by check_msg(), so they include how often it
+    is called.
+    :return: a dictionary with the last round trip, its moving average, the 95th percentile of the last
+      PING_HISTORY round trips, the number of PINGRESPs and the number of pings that timed out.
+    """
+    count = min( self._ping_count, self.PING_HISTORY )
+    p95 = None
+    if count:
+      recent = sorted( self._ping_history[:count] )
+      p95 = recent[(95 * count + 99) // 100 - 1]
+    return { 'last': self._ping_last, 'ewma': self._ping_ewma, 'p95': p95, 'count': self._ping_count,
+             'timeouts': self.ping_timeouts }
 
   def publish( self, topic, msg, retain = False, qos = 0 ):
-    pkt = bytearray( b"\x30\0\0\0" )
-    pkt[0] |= qos << 1 | retain
+    """
+    :param topic: the topic, or a PublishHandle from prepare(), in which case retain and qos come from the handle.
+    """
+    if isinstance( topic, PublishHandle ):
+      return self._publish_prepared( topic, msg )
+    topic = _encode( topic )
+    msg = _encode( msg )
     sz = 2 + len( topic ) + len( msg )
     if qos > 0:
       sz += 2
     assert sz < 2097152
-    i = 1
-    while sz > 0x7F:
-      pkt[i] = (sz & 0x7F) | 0x80
-      sz >>= 7
-      i += 1
-    pkt[i] = sz
-    # print(hex(len(pkt)), hexlify(pkt, ":"))
-    self.sock.write( pkt, i + 1 )
-    self._send_str( topic )
+    copy_msg = len( msg ) <= self.FRAME_COPY_LIMIT
+    buf = self._frame( 5 + sz if copy_msg else 5 + sz - len( msg ) )
+    buf[0] = 0x30 | qos << 1 | retain
+    i = _put_len( buf, 1, sz )
+    i = _put_str( buf, i, topic )
     if qos > 0:
-      self.pid += 1
-      pid = self.pid
-      struct.pack_into( "!H", pkt, 0, pid )
-      self.sock.write( pkt, 2 )
-    self.sock.write( msg )
+      pid = self._next_pid()
+      struct.pack_into( "!H", buf, i, pid )
+      i += 2
+    if copy_msg:
+      buf[i:i + len( msg )] = msg
+      i += len( msg )
+    self.sock.write( buf, i )
+    if not copy_msg:
+      self.sock.write( msg )
+    self._last_tx = ticks_ms()
     if qos == 1:
-      while 1:
-        op = self.wait_msg()
-        if op == 0x40:
-          sz = self.sock.read( 1 )
-          assert sz == b"\x02"
-          rcv_pid = self.sock.read( 2 )
-          rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
-          if pid == rcv_pid:
-            return
+      self._sent_qos1( pid, buf, 0, i, None if copy_msg else msg )
     elif qos == 2:
       assert 0
 
+  def prepare( self, topic, qos = 0, retain = False ):
+    """
+    Encode a topic once for repeated publishing:
+      temperature_topic = client.prepare( "sensors/temperature" )
+      client.publish( temperature_topic, "21.5" )
+    The handle does not depend on the connection, so it stays valid across reconnects.
+    :return: a PublishHandle to pass to publish() in place of the topic.
+    """
+    return PublishHandle( topic, qos, retain )
+
+  def _publish_prepared( self, handle, msg ):
+    msg = _encode( msg )
+    pid = 0
+    if handle.qos:
+      pid = self._next_pid()
+    copy_msg = len( msg ) <= self.FRAME_COPY_LIMIT
+    start, end = handle._fill( msg, pid, copy_msg )
+    self.sock.write( handle._frame, start, end - start )
+    if not copy_msg:
+      self.sock.write( msg )
+    self._last_tx = ticks_ms()
+    if pid:
+      self._sent_qos1( pid, handle._frame, start, end, None if copy_msg else msg )
+
+  def _next_pid( self ):
+    """
+    The next packet identifier, 1 to 65535, skipping any still in flight.
+    """
+    pid = self.pid
+    while 1:
+      pid = pid % 65535 + 1
+      if pid not in self._inflight:
+        self.pid = pid
+        return pid
+
+  def _sent_qos1( self, pid, buf, start, end, tail ):
+    """
+    Track a QoS 1 publish that has just been written until its PUBACK arrives.
+    :param tail: the payload, when it was written separately from buf[start:end].
+    """
+    # Keep a copy of the packet to resend: the frame buffer is reused by the next publish.
+    frame = bytearray( memoryview( buf )[start:end] )
+    if tail is not None:
+      frame.extend( tail )
+    now = ticks_ms()
+    self._inflight[pid] = [frame, now]
+    if len( self._inflight ) == 1:
+      self._resend_at = ticks_add( now, self.retry_ms )
+    if self.max_inflight <= 1:
+      # If the connection drops while waiting here, connect() resends the packet and the wait goes on.
+      while pid in self._inflight:
+        self.wait_msg()
+    else:
+      self._wait_inflight( self.max_inflight - 1 )
+
+  def _wait_inflight( self, limit ):
+    while len( self._inflight ) > limit:
+      if self.check_msg() is None:
+        sleep_ms( 1 )
+
+  def _resend( self, entry ):
+    frame = entry[0]
+    frame[0] |= 0x08  # DUP
+    self.sock.write( frame )
+    entry[1] = self._last_tx = ticks_ms()
+    self.retransmits += 1
+
+  def _resend_expired( self ):
+    now = ticks_ms()
+    if ticks_diff( now, self._resend_at ) < 0:
+      return
+    oldest = now
+    for entry in self._inflight.values():
+      if ticks_diff( now, entry[1] ) >= self.retry_ms:
+        self._resend( entry )
+      if ticks_diff( entry[1], oldest ) < 0:
+        oldest = entry[1]
+    self._resend_at = ticks_add( oldest, self.retry_ms )
+
+  def _resend_inflight( self ):
+    """
+    After connecting, resend every publish that was not acknowledged on the previous connection, oldest first.
+    """
+    now = ticks_ms()
+    for _, entry in sorted( self._inflight.items(), key = lambda item: ticks_diff( item[1][1], now ) ):
+      self._resend( entry )
+
+  def flush( self ):
+    """
+    Block until every QoS 1 publish in flight has been acknowledged, resending any that time out.
+    """
+    self._wait_inflight( 0 )
+
+  @property
+  def inflight( self ):
+    """
+    Number of QoS 1 publishes awaiting their PUBACK.
+    """
+    return len( self._inflight )
+
   def subscribe( self, topic, qos = 0 ):
+    self.subscribe_many( ((topic, qos),) )
+
+  def subscribe_many( self, subscriptions ):
+    """
+    Subscribe to several topic filters with one SUBSCRIBE packet and one round trip.
+    :param subscriptions: [(topic, qos), ...]
+    :return: the QoS granted for each filter.
+    :raise MQTTException: with the failure code and the topics the broker refused, if it refused any.
+    """
     assert self.cb is not None, "Subscribe callback is not set"
-    pkt = bytearray( b"\x82\0\0\0" )
-    self.pid += 1
-    struct.pack_into( "!BH", pkt, 1, 2 + 2 + len( topic ) + 1, self.pid )
-    # print(hex(len(pkt)), hexlify(pkt, ":"))
-    self.sock.write( pkt )
-    self._send_str( topic )
-    self.sock.write( qos.to_bytes( 1, "little" ) )
+    topics, sz = self._subscribe_size( subscriptions )
+    pid = self._next_pid()
+    buf = self._frame( 5 + sz )
+    self.sock.write( buf, self._put_subscribe( buf, 0, pid, topics, sz ) )
+    self._last_tx = ticks_ms()
+    return self._wait_suback( pid, subscriptions )
+
+  @staticmethod
+  def _subscribe_size( subscriptions ):
+    """
+    :return: ([(encoded topic, qos), ...], SUBSCRIBE remaining length).
+    """
+    topics = [(_encode( topic ), qos) for topic, qos in subscriptions]
+    sz = 2
+    for topic, _ in topics:
+      sz += 2 + len( topic ) + 1
+    return topics, sz
+
+  @staticmethod
+  def _put_subscribe( buf, i, pid, topics, sz ):
+    buf[i] = 0x82
+    i = _put_len( buf, i + 1, sz )
+    buf[i] = pid >> 8
+    buf[i + 1] = pid & 0xFF
+    i += 2
+    for topic, qos in topics:
+      i = _put_str( buf, i, topic )
+      buf[i] = qos
+      i += 1
+    return i
+
+  def _wait_suback( self, pid, subscriptions ):
     while 1:
       op = self.wait_msg()
       if op == 0x90:
-        resp = self.sock.read( 4 )
-        # print(resp)
-        assert resp[1] == pkt[2] and resp[2] == pkt[3]
-        if resp[3] == 0x80:
-          raise MQTTException( resp[3] )
-        return
+        sz = self._recv_len()
+        resp = self._read_into( sz )
+        if resp[0] == pid >> 8 and resp[1] == pid & 0xFF:
+          break
+    codes = list( resp[2:sz] )
+    assert len( codes ) == len( subscriptions )
+    failed = [subscriptions[n][0] for n in range( len( codes ) ) if codes[n] == 0x80]
+    if failed:
+      raise MQTTException( 0x80, failed )
+    return codes
 
   # Wait for a single incoming MQTT message and process it.
   # Subscribed messages are delivered to a callback previously
   # set by .set_callback() method. Other (internal) MQTT
   # messages processed internally.
   def wait_msg( self ):
-    res = self.sock.read( 1 )
+    r = self.sock.readinto( self._byte )
     self.sock.setblocking( True )
-    if res is None:
+    if r is None:
       return None
-    if res == b"":
+    if not r:
       raise OSError( -1 )
-    if res == b"\xd0":  # PINGRESP
-      sz = self.sock.read( 1 )[0]
+    op = self._byte[0]
+    if op == 0xD0:  # PINGRESP
+      sz = self._recv_len()
       assert sz == 0
+      self._pingresp()
       return None
-    op = res[0]
+    if op == 0x40:  # PUBACK
+      sz = self._recv_len()
+      assert sz == 2
+      data = self._read_into( 2 )
+      self._inflight.pop( data[0] << 8 | data[1], None )
+      return op
     if op & 0xF0 != 0x30:
       return op
+    # Read the whole PUBLISH at once and hand out slices of it.
     sz = self._recv_len()
-    topic_len = self.sock.read( 2 )
-    topic_len = (topic_len[0] << 8) | topic_len[1]
-    topic = self.sock.read( topic_len )
-    sz -= topic_len + 2
+    data = self._read_into( sz )
+    topic_len = (data[0] << 8) | data[1]
+    i = 2 + topic_len
+    topic = self._rview[2:i]
     if op & 6:
-      pid = self.sock.read( 2 )
-      pid = pid[0] << 8 | pid[1]
-      sz -= 2
-    msg = self.sock.read( sz )
+      pid = data[i] << 8 | data[i + 1]
+      i += 2
+    msg = self._rview[i:sz]
+    if self.copy_messages:
+      topic = bytes( topic )
+      msg = bytes( msg )
     self.cb( topic, msg )
     if op & 6 == 2:
-      pkt = bytearray( b"\x40\x02\0\0" )
-      struct.pack_into( "!H", pkt, 2, pid )
+      pkt = self._puback
+      pkt[2] = pid >> 8
+      pkt[3] = pid & 0xFF
       self.sock.write( pkt )
+      self._last_tx = ticks_ms()
     elif op & 6 == 4:
       assert 0
     return op
@@ -213,6 +626,14 @@ class MQTTClient:
   # Checks whether a pending message from server is available.
   # If not, returns immediately with None. Otherwise, does
   # the same processing as wait_msg.
+  # Every call also resends QoS 1 publishes whose PUBACK is overdue and sends
+  # a PINGREQ if the keepalive interval requires one, whether or not a
+  # message was pending: a subscriber that gets a message on every call
+  # still has to ping, as receiving does not count as activity to the broker.
   def check_msg( self ):
     self.sock.setblocking( False )
-    return self.wait_msg()
+    op = self.wait_msg()
+    if self._inflight:
+      self._resend_expired()
+    self._keepalive()
+    return op
@@ -7,6 +7,10 @@ import network
 import ujson
 from picozero import pico_temp_sensor, pico_led
 
+from Http_Server import HttpServer
+from Page_Template import PageTemplate
+from Utilities_uPython import SensorCache
+
 
 def wifi_connect( ssid, password ):
   print( f"Attempting to connect to SSID '{ssid}'." )
@@ -39,35 +43,42 @@ def c_to_f( temp_c ):
   return (temp_c * 1.8) + 32
 
 
+# The page format_html() renders, split into its static parts once at startup.
+STATUS_PAGE = PageTemplate( """<!DOCTYPE html>
+<html>
+  <head></head>
+  <body style="background-color:black;color:gray;">
+    <h1>PicoW</h1>
+
+    <form action="./lighton">
+      <input type="submit" value="Light on" />
+    </form>
+
+    <form action="./lightoff">
+      <input type="submit" value="Light off" />
+    </form>
+
+    <p>LED is {state}</p>
+    <p>
+      Temperature: {temperature_c} C ({temperature_f} F)<br>
+      Adjusted temp: {adjusted_c} C ({adjusted_f} F)<br>
+      CPU temp: {cpu_c} C ({cpu_f} F)
+    </p>
+  </body>
+</html>
+""" )
+
+
+def status_values( temperature, adjusted_temp, state, cpu_temperature ):
+  # Formatted straight to bytes, which the template joins without encoding them.
+  return { 'state': state, 'led': b"1" if state == 'ON' else b"0",
+           'temperature_c': b"%.2f" % temperature, 'temperature_f': b"%.2f" % c_to_f( temperature ),
+           'adjusted_c': b"%.2f" % adjusted_temp, 'adjusted_f': b"%.2f" % c_to_f( adjusted_temp ),
+           'cpu_c': b"%.2f" % cpu_temperature, 'cpu_f': b"%.2f" % c_to_f( cpu_temperature ) }
+
+
 def format_html( temperature, adjusted_temp, state, cpu_temperature ):
-  print( f"Temp: {temperature} C ({c_to_f( temperature )} F)" )
-  print( f"Adjusted temp: {adjusted_temp} C ({c_to_f( adjusted_temp )} F)" )
-  # Template HTML
-  html = f"""
-  <!DOCTYPE html>
-  <html>
-    <head></head>
-    <body style="background-color:black;color:gray;">
-      <h1>PicoW</h1>
-      
-      <form action="./lighton">
-        <input type="submit" value="Light on" />
-      </form>
-      
-      <form action="./lightoff">
-        <input type="submit" value="Light off" />
-      </form>
-      
-      <p>LED is {state}</p>
-      <p>
-        Temperature: {round( temperature, 2 )} C ({round( c_to_f( temperature ), 2 )} F)<br>
-        Adjusted temp: {round( adjusted_temp, 2 )} C ({round( c_to_f( adjusted_temp ), 2 )} F)<br>
-        CPU temp: {round( cpu_temperature, 2 )} C ({round( c_to_f( cpu_temperature ), 2 )} F)
-      </p>
-    </body>
-  </html>
-  """
-  return str( html )
+  return STATUS_PAGE.render( status_values( temperature, adjusted_temp, state, cpu_temperature ) )
 
 
 def adjust_temp( temp ):
@@ -85,6 +96,11 @@ def cpu_temp():
   return core_temperature
 
 
+# Every request used to hit the ADC twice; readings are now reused for up to a second.
+board_temperature = SensorCache( lambda: pico_temp_sensor.temp, 1000 )
+cpu_temperature = SensorCache( cpu_temp, 1000 )
+
+
 def serve2( socket_connection ):
   # Start a web server
   state = 'OFF'
@@ -104,29 +120,35 @@ def serve2( socket_connection ):
     elif request == '/lightoff?':
       pico_led.off()
       state = 'OFF'
-    temperature = pico_temp_sensor.temp
-    html = format_html( temperature, adjust_temp( temperature ), state, cpu_temp() )
-    client.send( html )
+    temperature = board_temperature.read()
+    # Formatted again only when the LED state or a cached reading has changed.
+    client.send( STATUS_PAGE.response( status_values, temperature, adjust_temp( temperature ), state,
+                                       cpu_temperature.read() ) )
     client.close()
 
 
+# The page webpage() renders.
+SIMPLE_PAGE = PageTemplate( """<!DOCTYPE html>
+<html>
+<form action="./lighton">
+<input type="submit" value="Light on" />
+</form>
+<form action="./lightoff">
+<input type="submit" value="Light off" />
+</form>
+<p>LED is {state}</p>
+<p>Temperature is {temperature}</p>
+</body>
+</html>
+""" )
+
+
+def simple_values( temperature, state ):
+  return { 'state': state, 'temperature': str( temperature ) }
+
+
 def webpage( temperature, state ):
-  # Template HTML
-  html = f"""
-            <!DOCTYPE html>
-            <html>
-            <form action="./lighton">
-            <input type="submit" value="Light on" />
-            </form>
-            <form action="./lightoff">
-            <input type="submit" value="Light off" />
-            </form>
-            <p>LED is {state}</p>
-            <p>Temperature is {temperature}</p>
-            </body>
-            </html>
-            """
-  return str( html )
+  return SIMPLE_PAGE.render( simple_values( temperature, state ) )
 
 
 def serve( connection ):
@@ -148,12 +170,74 @@ def serve( connection ):
     elif request == '/lightoff?':
       pico_led.off()
       state = 'OFF'
-    temperature = pico_temp_sensor.temp
-    html = webpage( temperature, state )
-    client.send( html )
+    temperature = board_temperature.read()
+    client.send( SIMPLE_PAGE.response( simple_values, temperature, state ) )
     client.close()
 
 
+# LED state shown by the pages HttpServer serves.
+led_state = 'OFF'
+
+
+def snapshot():
+  """
+  The cached sensor readings and the LED state, as status_values() takes them.
+  """
+  temperature = board_temperature.read()
+  return temperature, adjust_temp( temperature ), led_state, cpu_temperature.read()
+
+
+def index( request ):
+  return STATUS_PAGE.response( status_values, *snapshot() )
+
+
+# Prometheus text exposition format, for scraping.
+METRICS_PAGE = PageTemplate( """# HELP pico_temperature_celsius Board temperature sensor reading.
+# TYPE pico_temperature_celsius gauge
+pico_temperature_celsius {temperature_c}
+# HELP pico_adjusted_temperature_celsius Board temperature with the ADC offset correction.
+# TYPE pico_adjusted_temperature_celsius gauge
+pico_adjusted_temperature_celsius {adjusted_c}
+# HELP pico_cpu_temperature_celsius RP2040 core temperature.
+# TYPE pico_cpu_temperature_celsius gauge
+pico_cpu_temperature_celsius {cpu_c}
+# HELP pico_led_on Whether the onboard LED is on.
+# TYPE pico_led_on gauge
+pico_led_on {led}
+""", "text/plain; version=0.0.4" )
+
+TELEMETRY_PAGE = PageTemplate( '{"temperature_c": {temperature_c}, "adjusted_temperature_c": {adjusted_c}, '
+                               '"cpu_temperature_c": {cpu_c}, "led": "{state}"}', "application/json" )
+
+
+def metrics( request ):
+  # A scraper that sends back the last ETag gets a bodyless 304 until a reading or the LED changes.
+  return METRICS_PAGE.conditional_response( request.headers.get( b"if-none-match" ), status_values, *snapshot() )
+
+
+def telemetry( request ):
+  return TELEMETRY_PAGE.conditional_response( request.headers.get( b"if-none-match" ), status_values, *snapshot() )
+
+
+def light_on( request ):
+  global led_state
+  pico_led.on()
+  led_state = 'ON'
+  return index( request )
+
+
+def light_off( request ):
+  global led_state
+  pico_led.off()
+  led_state = 'OFF'
+  return index( request )
+
+
+# Path, without the query string, to the handler that answers it.
+ROUTES = { "/": index, "/lighton": light_on, "/lightoff": light_off, "/metrics": metrics,
+           "/api/telemetry": telemetry }
+
+
 if __name__ == "__main__":
   # Load login data from a file for safety reasons.
   with open( 'privateInfo.json' ) as privateInfo:
@@ -162,7 +246,8 @@ if __name__ == "__main__":
   wifi_password = secrets['pass']
   try:
     ip = wifi_connect( wifi_ssid, wifi_password )
-    socket_class_object = open_socket( ip, 80 )
-    serve( socket_class_object )
+    pico_led.off()
+    # Serves several clients at once with keep-alive, where serve() and serve2() take one connection at a time.
+    HttpServer( ROUTES ).run( ip, 80 )
   except KeyboardInterrupt:
     machine.reset()